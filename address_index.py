@@ -0,0 +1,335 @@
+import re
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+# Administrative levels of a Korean lot-number (지번) address, from broadest to narrowest
+ADDRESS_LEVELS = ("sido", "sigungu", "eupmyeon", "ri", "jibun")
+
+# Column names that are treated as the address column, in order of preference
+ADDRESS_COLUMN_TERMS = ["주소", "address", "location", "site", "place"]
+
+# Lot number and anything after it ("715-1", "산68-24 외 1필지")
+_LOT_NUMBER_RE = re.compile(r'\s+산?\d.*$')
+
+# Above this many matching addresses, rows are selected with a vectorized mask
+# instead of concatenating the per-address row lists
+_MASK_THRESHOLD = 128
+
+
+def normalize_address(text):
+    """
+    Normalize an address or query for matching.
+    Whitespace is removed entirely so that "삼례읍 삼례리" and "삼례읍삼례리" match the same way.
+
+    Args:
+        text (str): Address or query string
+
+    Returns:
+        str: Normalized string
+    """
+    return re.sub(r'\s+', '', str(text)).lower()
+
+def parse_address(address):
+    """
+    Split a lot-number address into its administrative levels.
+
+    Example:
+        "전라북도 완주군 삼례읍 삼례리 998-5" ->
+        {"sido": "전라북도", "sigungu": "완주군", "eupmyeon": "삼례읍", "ri": "삼례리", "jibun": "998-5"}
+
+    Args:
+        address (str): Address string
+
+    Returns:
+        dict: Mapping of each level in ADDRESS_LEVELS to its value ("" if missing)
+    """
+    parts = dict.fromkeys(ADDRESS_LEVELS, "")
+    jibun_tokens = []
+
+    for token in str(address).split():
+        if jibun_tokens:
+            # Everything after the lot number belongs to it (e.g. "산68-24 외 1필지")
+            jibun_tokens.append(token)
+        elif not parts["sido"] and not parts["sigungu"] and token.endswith(("도", "특별시", "광역시", "특별자치시")):
+            parts["sido"] = token
+        elif not parts["eupmyeon"] and token.endswith(("시", "군", "구")):
+            # Cities with wards are written as "전주시 덕진구"
+            parts["sigungu"] = f"{parts['sigungu']} {token}".strip()
+        elif not parts["ri"] and not parts["eupmyeon"] and token.endswith(("읍", "면", "동")):
+            parts["eupmyeon"] = token
+        elif not parts["ri"] and token.endswith(("리", "가")) and not token[0].isdigit():
+            parts["ri"] = token
+        else:
+            jibun_tokens.append(token)
+
+    parts["jibun"] = " ".join(jibun_tokens)
+    return parts
+
+def factorize_regions(addresses):
+    """
+    Parse the administrative levels of many addresses, once per distinct region.
+    Lot numbers are cut off before parsing, so a table with millions of distinct addresses
+    only parses its few hundred distinct 리.
+
+    Args:
+        addresses (iterable of str): Address of each row
+
+    Returns:
+        tuple: (codes, regions) where codes[i] is the position in regions of row i's
+        parse_address result (with an empty "jibun")
+    """
+    address_codes, uniques = pd.factorize(pd.Series(addresses, dtype=object).fillna("").astype(str))
+    prefixes = [_LOT_NUMBER_RE.sub("", address.strip()) for address in uniques]
+    prefix_codes, prefix_uniques = pd.factorize(pd.Series(prefixes, dtype=object))
+    regions = []
+    for prefix in prefix_uniques:
+        parts = parse_address(prefix)
+        parts["jibun"] = ""
+        regions.append(parts)
+    return prefix_codes[address_codes], regions
+
+def find_address_column(df):
+    """
+    Find the column holding addresses in a soil dataframe.
+
+    Args:
+        df (pandas.DataFrame): The CSV data
+
+    Returns:
+        str or None: Name of the address column, or None if there is none
+    """
+    for term in ADDRESS_COLUMN_TERMS:
+        for col in df.columns:
+            if term in str(col).lower():
+                return col
+    return None
+
+class AddressIndex:
+    """
+    Prebuilt lookup structure over the address column of a soil dataframe.
+
+    Distinct addresses are indexed once, so a query costs a few dictionary and
+    array operations instead of a scan over every row:
+
+    - prefix lookup uses a sorted list of normalized addresses and binary search
+    - substring lookup uses a character bigram index over the distinct address
+      tokens (시/군, 읍/면, 리, 지번), whose posting lists are intersected per query token
+    - exact level lookup (e.g. every row in 삼례읍) uses a dictionary per level
+
+    Results are positional row indices into the dataframe the index was built from.
+    """
+
+    def __init__(self, addresses):
+        """
+        Build the index.
+
+        Args:
+            addresses (iterable of str): Address of each row, in row order
+        """
+        addresses = pd.Series(addresses, dtype=object).fillna("").astype(str)
+
+        # Each distinct address gets an id; rows refer to it through self._codes
+        codes, uniques = pd.factorize(addresses, sort=False)
+        self._codes = codes.astype(np.int32)
+        self.addresses = list(uniques)
+        self.num_rows = len(addresses)
+
+        # Row positions grouped by address id
+        self._row_order = np.argsort(self._codes, kind="stable").astype(np.int32)
+        self._row_starts = np.searchsorted(self._codes[self._row_order], np.arange(len(uniques) + 1))
+
+        # Sorted normalized addresses for prefix lookup
+        normalized = [normalize_address(addr) for addr in self.addresses]
+        prefix_order = sorted(range(len(normalized)), key=normalized.__getitem__)
+        self._sorted_keys = [normalized[i] for i in prefix_order]
+        self._sorted_ids = np.array(prefix_order, dtype=np.int32)
+        self._normalized = normalized
+
+        # Token and level postings
+        token_postings = {}
+        self._level_postings = {level: {} for level in ADDRESS_LEVELS}
+        for address_id, addr in enumerate(self.addresses):
+            for token in set(addr.lower().split()):
+                token_postings.setdefault(token, []).append(address_id)
+            for level, value in parse_address(addr).items():
+                if value:
+                    self._level_postings[level].setdefault(value, []).append(address_id)
+
+        self._tokens = list(token_postings)
+        self._token_postings = [np.array(ids, dtype=np.int32) for ids in token_postings.values()]
+        for level in ADDRESS_LEVELS:
+            self._level_postings[level] = {
+                value: np.array(ids, dtype=np.int32)
+                for value, ids in self._level_postings[level].items()
+            }
+
+        # Character unigram/bigram -> ids of the tokens containing it
+        bigram_postings = {}
+        for token_id, token in enumerate(self._tokens):
+            grams = set(token) | {token[i:i + 2] for i in range(len(token) - 1)}
+            for bigram in grams:
+                bigram_postings.setdefault(bigram, []).append(token_id)
+        self._bigram_postings = {
+            bigram: np.array(ids, dtype=np.int32) for bigram, ids in bigram_postings.items()
+        }
+
+    @classmethod
+    def from_dataframe(cls, df, column=None):
+        """
+        Build an index over the address column of a dataframe.
+
+        Args:
+            df (pandas.DataFrame): The CSV data
+            column (str, optional): Address column; detected automatically if omitted
+
+        Returns:
+            AddressIndex or None: The index, or None if the dataframe has no address column
+        """
+        if df is None:
+            return None
+        column = column or find_address_column(df)
+        if column is None:
+            return None
+        index = cls(df[column].to_numpy())
+        index.column = column
+        return index
+
+    def _tokens_containing(self, fragment):
+        """Return the ids of the address tokens that contain fragment."""
+        if len(fragment) < 2:
+            return self._bigram_postings.get(fragment, np.empty(0, dtype=np.int32)).tolist()
+
+        # Intersect the bigram postings, rarest first, then verify the candidates
+        postings = []
+        for i in range(len(fragment) - 1):
+            ids = self._bigram_postings.get(fragment[i:i + 2])
+            if ids is None:
+                return []
+            postings.append(ids)
+        postings.sort(key=len)
+        candidates = postings[0]
+        for ids in postings[1:]:
+            candidates = np.intersect1d(candidates, ids, assume_unique=True)
+            if len(candidates) == 0:
+                return []
+        return [i for i in candidates.tolist() if fragment in self._tokens[i]]
+
+    def _rows_for(self, address_ids):
+        """Map address ids to sorted positional row indices."""
+        if len(address_ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        if len(address_ids) > _MASK_THRESHOLD:
+            selected = np.zeros(len(self.addresses), dtype=bool)
+            selected[address_ids] = True
+            return np.flatnonzero(selected[self._codes])
+        rows = np.concatenate([
+            self._row_order[self._row_starts[i]:self._row_starts[i + 1]] for i in address_ids
+        ])
+        rows.sort()
+        return rows
+
+    def search(self, query):
+        """
+        Find rows whose address contains the query (case-insensitive).
+        Each whitespace-separated word of the query must appear inside one address token,
+        and the query as a whole must appear in the address once whitespace is ignored.
+
+        Args:
+            query (str): Address query string
+
+        Returns:
+            numpy.ndarray: Sorted positional indices of the matching rows
+        """
+        words = str(query).lower().split()
+        if not words:
+            return np.empty(0, dtype=np.int64)
+
+        # Addresses containing each word, intersected from the smallest set up
+        word_ids = []
+        for word in words:
+            token_ids = self._tokens_containing(word)
+            if not token_ids:
+                # The word may span two tokens (e.g. "삼례읍삼례리")
+                return self._search_across_tokens(query)
+            if len(token_ids) == 1:
+                word_ids.append(self._token_postings[token_ids[0]])
+            else:
+                word_ids.append(np.unique(np.concatenate([self._token_postings[i] for i in token_ids])))
+        word_ids.sort(key=len)
+        candidates = word_ids[0]
+        for ids in word_ids[1:]:
+            member = np.zeros(len(self.addresses), dtype=bool)
+            member[ids] = True
+            candidates = candidates[member[candidates]]
+
+        if len(words) > 1 and len(candidates):
+            # Prefix matches are a subset of the candidates; if they account for all of
+            # them (the usual "전라북도 완주군 삼례읍" case) no per-address check is needed
+            key = normalize_address(query)
+            prefix_ids = self._prefix_ids(key)
+            if len(prefix_ids) != len(candidates):
+                candidates = [i for i in candidates.tolist() if key in self._normalized[i]]
+        return self._rows_for(candidates)
+
+    def _search_across_tokens(self, query):
+        """Substring match for a query that does not fit inside a single address token."""
+        key = normalize_address(query)
+        if len(key) < 2:
+            return np.empty(0, dtype=np.int64)
+
+        # Any match must contain a token holding the query's first two characters
+        token_ids = self._tokens_containing(key[:2])
+        if not token_ids:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.unique(np.concatenate([self._token_postings[i] for i in token_ids]))
+        return self._rows_for([i for i in candidates.tolist() if key in self._normalized[i]])
+
+    def _prefix_ids(self, key):
+        """Return the ids of the addresses whose normalized form starts with key."""
+        lo = bisect_left(self._sorted_keys, key)
+        hi = bisect_right(self._sorted_keys, key + "\U0010ffff", lo)
+        return self._sorted_ids[lo:hi]
+
+    def prefix(self, query):
+        """
+        Find rows whose address starts with the query, ignoring whitespace and case.
+
+        Args:
+            query (str): Address prefix, e.g. "전라북도 완주군 삼례읍"
+
+        Returns:
+            numpy.ndarray: Sorted positional indices of the matching rows
+        """
+        return self._rows_for(self._prefix_ids(normalize_address(query)))
+
+    def lookup(self, level, value):
+        """
+        Find rows whose address has the given value at one administrative level.
+
+        Args:
+            level (str): One of ADDRESS_LEVELS
+            value (str): Value at that level, e.g. "삼례읍"
+
+        Returns:
+            numpy.ndarray: Sorted positional indices of the matching rows
+        """
+        if level not in self._level_postings:
+            raise ValueError(f"Unknown address level: {level}")
+        ids = self._level_postings[level].get(value)
+        if ids is None:
+            return np.empty(0, dtype=np.int64)
+        return self._rows_for(ids)
+
+    def level_values(self, level):
+        """
+        List the distinct values present at one administrative level.
+
+        Args:
+            level (str): One of ADDRESS_LEVELS
+
+        Returns:
+            list: Distinct values, e.g. every 읍/면 in the data
+        """
+        return list(self._level_postings[level])
@@ -6,29 +6,55 @@ st.set_page_config(
     layout="wide"
 )
 
-import pandas as pd
-import os
-import tempfile
-import base64
+import time
 
-from pdf_processor import extract_text_from_pdf
-from csv_processor import process_csv_data
-from utils import get_soil_image_url
-from koalpaca_chatbot import get_chat_response_koalpaca, KoAlpacaModelManager
+from pdf_processor import extract_text_from_upload, get_pdf_cache_stats
+from csv_processor import process_csv_data, get_soil_data_by_address, format_csv_knowledge, DatasetProfile
+from address_index import AddressIndex
+from region_index import RegionIndex
+from soil_query import SoilQueryEngine
+from dataset_cache import get_shared_dataset
+from utils import get_soil_image_url, get_upload_digest
+from koalpaca_chatbot import (
+    stream_chat_response_koalpaca, get_response_cache, get_retrieval_status, create_conversation_memory,
+    KoAlpacaModelManager, KOALPACA_WARMUP
+)
 
 # Initialize session state variables
 if 'pdf_content' not in st.session_state:
     st.session_state.pdf_content = ""
 if 'csv_data' not in st.session_state:
     st.session_state.csv_data = None
+if 'address_index' not in st.session_state:
+    st.session_state.address_index = None
+if 'dataset_profile' not in st.session_state:
+    st.session_state.dataset_profile = None
+if 'region_index' not in st.session_state:
+    st.session_state.region_index = None
+if 'query_engine' not in st.session_state:
+    st.session_state.query_engine = None
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
+if 'conversation_memory' not in st.session_state:
+    # 모델에 보내는 대화 기록 (최근 몇 턴은 그대로, 그 이전은 요약)
+    st.session_state.conversation_memory = create_conversation_memory()
 if 'knowledge_base' not in st.session_state:
     st.session_state.knowledge_base = ""
+if 'knowledge_sources' not in st.session_state:
+    # 지식 베이스를 구성하는 문서별 텍스트 (업로드 시 해당 항목만 교체)
+    st.session_state.knowledge_sources = {"pdf": "", "csv": ""}
+if 'ingested_uploads' not in st.session_state:
+    # 이미 처리한 업로드 파일의 SHA-256 (종류별)
+    st.session_state.ingested_uploads = {}
+if 'upload_digests' not in st.session_state:
+    st.session_state.upload_digests = {}
+if 'ingest_timings' not in st.session_state:
+    st.session_state.ingest_timings = {}
+if 'pending_questions' not in st.session_state:
+    # 모델 로드 중에 받은 질문 (로드가 끝나면 순서대로 답변)
+    st.session_state.pending_questions = []
 if 'response_time' not in st.session_state:
     st.session_state.response_time = ""
-if 'model_loaded' not in st.session_state:
-    st.session_state.model_loaded = False
 
 # App title
 st.title("🐨 토양 정보 챗봇 (KoAlpaca 기반)")
@@ -36,39 +62,63 @@ st.title("🐨 토양 정보 챗봇 (KoAlpaca 기반)")
 # 모델 초기화
 model_manager = KoAlpacaModelManager.get_instance()
 
+# 워밍업 모드: 서버의 첫 실행에서 백그라운드 로드 시작 (이미 시작했으면 무시)
+if KOALPACA_WARMUP:
+    model_manager.start_background_load()
+
+def answer_question(question, container):
+    """질문에 대한 챗봇 응답을 생성되는 대로 container에 표시하고, 끝나면 대화 기록에 추가"""
+    # Add user message to chat history
+    st.session_state.chat_history.append({"role": "user", "content": question})
+    with container:
+        st.markdown(f"**You:** {question}")
+        placeholder = st.empty()
+    
+    if st.session_state.knowledge_base:
+        response = ""
+        for piece in stream_chat_response_koalpaca(
+            question, 
+            st.session_state.knowledge_base, 
+            st.session_state.csv_data,
+            st.session_state.dataset_profile,
+            st.session_state.region_index,
+            st.session_state.query_engine,
+            st.session_state.conversation_memory
+        ):
+            response += piece
+            placeholder.markdown(f"**Assistant:** {response}▌")
+    else:
+        response = "토양 조사 PDF 또는 CSV 파일을 업로드하여 질문을 시작하세요."
+    placeholder.markdown(f"**Assistant:** {response}")
+    
+    # Add assistant response to chat history
+    st.session_state.chat_history.append({"role": "assistant", "content": response})
+
 # 기본 데이터 로드 (미리 업로드된 파일)
-if not st.session_state.pdf_content and not st.session_state.csv_data:
-    with st.spinner("사전 업로드된 데이터 로드 중..."):
-        # 1. PDF 파일 로드
-        pdf_path = "attached_assets/KSIC_9rd_handbook.pdf"
-        if os.path.exists(pdf_path):
-            extracted_text = extract_text_from_pdf(pdf_path)
-            st.session_state.pdf_content = extracted_text
-            st.session_state.knowledge_base = extracted_text
-            st.success(f"기초 토양조사 매뉴얼 로드 완료!")
-        elif os.path.exists("data/KSIC_9rd_handbook.pdf"):  # Streamlit Cloud 배포용 경로
-            extracted_text = extract_text_from_pdf("data/KSIC_9rd_handbook.pdf")
-            st.session_state.pdf_content = extracted_text
-            st.session_state.knowledge_base = extracted_text
-            st.success(f"기초 토양조사 매뉴얼 로드 완료!")
-        
-        # 2. CSV 파일 로드
-        csv_path = "data/chatbot_wanju_reduced.csv"  # 축소된 CSV 파일 사용
-        if os.path.exists(csv_path):
-            try:
-                csv_data = pd.read_csv(csv_path)
-                cleaned_data = process_csv_data(csv_data)
-                st.session_state.csv_data = cleaned_data
-                
-                # Update knowledge base with CSV data summary
-                if cleaned_data is not None:
-                    csv_summary = f"CSV 데이터 요약:\n총 레코드: {len(cleaned_data)}\n컬럼: {', '.join(cleaned_data.columns)}\n"
-                    csv_sample = cleaned_data.head(5).to_string()
-                    st.session_state.knowledge_base += "\n\n" + csv_summary + csv_sample
-                
-                st.success(f"완주군 토양 데이터 로드 완료!")
-            except Exception as e:
-                st.error(f"CSV 파일 처리 오류: {str(e)}")
+# 파싱 결과는 프로세스 단위로 캐시되어 모든 세션이 같은 객체를 공유합니다 (읽기 전용)
+with st.spinner("사전 업로드된 데이터 로드 중..."):
+    shared_dataset = get_shared_dataset()
+
+if not st.session_state.pdf_content and st.session_state.csv_data is None:
+    for error in shared_dataset.errors:
+        st.error(error)
+
+    # 1. PDF 파일 로드
+    if shared_dataset.pdf_content:
+        st.session_state.pdf_content = shared_dataset.pdf_content
+        st.success(f"기초 토양조사 매뉴얼 로드 완료!")
+
+    # 2. CSV 파일 로드
+    if shared_dataset.csv_data is not None:
+        st.session_state.csv_data = shared_dataset.csv_data
+        st.session_state.address_index = shared_dataset.address_index
+        st.session_state.dataset_profile = shared_dataset.profile
+        st.session_state.region_index = shared_dataset.region_index
+        st.session_state.query_engine = shared_dataset.query_engine
+        st.success(f"완주군 토양 데이터 로드 완료!")
+
+    st.session_state.knowledge_sources = {"pdf": shared_dataset.pdf_content, "csv": shared_dataset.csv_summary}
+    st.session_state.knowledge_base = "".join(st.session_state.knowledge_sources.values())
 
 # Sidebar for file uploads and model loading
 with st.sidebar:
@@ -79,51 +129,124 @@ with st.sidebar:
     st.info("KoAlpaca는 한국어에 최적화된 언어 모델로, 토양 관련 질문에 한국어로 응답할 수 있습니다.")
     
     if st.button("모델 로드"):
+        # 다른 세션이 이미 로드 중이면 같은 로드가 끝날 때까지 기다림
         with st.spinner("KoAlpaca 모델 로드 중..."):
             if model_manager.load_model():
-                st.session_state.model_loaded = True
                 st.success("KoAlpaca 모델 로드 완료!")
             else:
-                st.error("모델 로드 실패")
+                st.error(f"모델 로드 실패: {model_manager.status()['error']}")
+    
+    # 모델 로드 상태 (프로세스 전체에서 공유)
+    model_status = model_manager.status()
+    if model_status["state"] == "loaded":
+        details = f"로드 {model_status['load_seconds']:.1f} 초"
+        if model_status["memory_bytes"]:
+            details += f", 메모리 {model_status['memory_bytes'] / (1024 ** 3):.2f} GB"
+        if model_status["precision"]:
+            details += f", {model_status['precision']}"
+        if model_status["threads"]:
+            details += f", 스레드 {model_status['threads']}개"
+        if model_status["demo_mode"]:
+            details += ", 데모 모드"
+        st.caption(f"모델: {model_status['model_name']} ({details})")
+    elif model_status["state"] == "loading":
+        st.caption("다른 세션에서 모델을 로드하는 중입니다.")
+    
+    # 반복 질문 응답 캐시 (프로세스 전체에서 공유)
+    response_cache = get_response_cache()
+    if response_cache is not None and len(response_cache):
+        cache_stats = response_cache.stats()
+        st.caption(
+            f"응답 캐시: {cache_stats['entries']}개, 적중률 {cache_stats['hit_rate']:.0%} "
+            f"(같은 질문 {cache_stats['exact_hits']}, 비슷한 질문 {cache_stats['near_hits']})"
+        )
+    
+    # 문서 검색 방식 (임베딩 검색은 첫 질문에서 색인)
+    retrieval_status = get_retrieval_status()
+    if retrieval_status["documents"]:
+        st.caption(f"문서 검색: {retrieval_status['mode']} (문서 {retrieval_status['documents']:,}개)")
+    elif retrieval_status["error"]:
+        st.caption(retrieval_status["error"])
     
     st.divider()
     
+    # 공유 데이터 캐시 상태
+    with st.expander("공유 데이터 캐시"):
+        for name, size in shared_dataset.memory_report().items():
+            st.text(f"{name}: {size / (1024 * 1024):.2f} MB")
+        if shared_dataset.csv_data is not None and "memory_report" in shared_dataset.csv_data.attrs:
+            csv_memory = shared_dataset.csv_data.attrs["memory_report"]
+            st.caption(f"CSV 범주형 변환: {csv_memory['before'] / (1024 * 1024):.2f} MB → {csv_memory['after'] / (1024 * 1024):.2f} MB")
+        if shared_dataset.csv_digest:
+            st.caption(f"CSV SHA-256: {shared_dataset.csv_digest[:12]}")
+        if shared_dataset.pdf_digest:
+            st.caption(f"PDF SHA-256: {shared_dataset.pdf_digest[:12]}")
+        pdf_cache_stats = get_pdf_cache_stats()
+        st.caption(f"PDF 텍스트 캐시: 적중 {pdf_cache_stats['hits']}회 / 미적중 {pdf_cache_stats['misses']}회")
+    
     st.header("문서 업로드")
     
-    # Upload PDF
+    # Upload PDF (파일 내용이 바뀐 경우에만 처리)
     pdf_file = st.file_uploader("토양 조사 PDF 업로드", type=["pdf"])
     if pdf_file is not None:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-            tmp_file.write(pdf_file.getvalue())
-            tmp_file_path = tmp_file.name
-        
-        with st.spinner("PDF 처리 중..."):
-            extracted_text = extract_text_from_pdf(tmp_file_path)
-            st.session_state.pdf_content = extracted_text
-            st.session_state.knowledge_base = extracted_text
-            st.success(f"PDF 처리 완료: {pdf_file.name}")
-        
-        # Clean up temp file
-        if os.path.exists(tmp_file_path):
-            os.unlink(tmp_file_path)
+        pdf_digest = get_upload_digest(pdf_file, st.session_state.upload_digests)
+        if st.session_state.ingested_uploads.get("pdf") != pdf_digest:
+            with st.spinner("PDF 처리 중..."):
+                progress_bar = st.progress(0.0)
+                preview = st.empty()
+                start_time = time.perf_counter()
+                preview_parts = []
+                
+                # 페이지가 추출되는 대로 받아서 앞부분을 바로 미리보기로 표시
+                def show_preview(page_number, page_text):
+                    if page_text and sum(map(len, preview_parts)) < 1000:
+                        preview_parts.append(page_text)
+                        preview.text("".join(preview_parts)[:1000])
+                
+                extracted_text = extract_text_from_upload(
+                    pdf_file,
+                    progress_callback=lambda done, total: progress_bar.progress(done / total, text=f"{done}/{total} 페이지"),
+                    page_callback=show_preview
+                )
+                st.session_state.ingest_timings["pdf"] = time.perf_counter() - start_time
+                progress_bar.empty()
+                preview.empty()
+                
+                st.session_state.pdf_content = extracted_text
+                st.session_state.knowledge_sources["pdf"] = extracted_text
+                st.session_state.knowledge_base = "".join(st.session_state.knowledge_sources.values())
+                st.session_state.ingested_uploads["pdf"] = pdf_digest
+        st.caption(f"PDF 처리 완료: {pdf_file.name} ({st.session_state.ingest_timings['pdf']:.2f} 초)")
     
-    # Upload CSV
+    # Upload CSV (파일 내용이 바뀐 경우에만 처리)
     csv_file = st.file_uploader("토양 특성 CSV 업로드", type=["csv"])
     if csv_file is not None:
-        try:
-            with st.spinner("CSV 처리 중..."):
-                csv_data = process_csv_data(csv_file)
-                st.session_state.csv_data = csv_data
-                
-                # Update knowledge base with CSV data summary
-                if csv_data is not None:
-                    csv_summary = f"CSV 데이터 요약:\n총 레코드: {len(csv_data)}\n컬럼: {', '.join(csv_data.columns)}\n"
-                    csv_sample = csv_data.head(5).to_string()
-                    st.session_state.knowledge_base += "\n\n" + csv_summary + csv_sample
-                
-                st.success(f"CSV 처리 완료: {csv_file.name}")
-        except Exception as e:
-            st.error(f"CSV 파일 처리 오류: {str(e)}")
+        csv_digest = get_upload_digest(csv_file, st.session_state.upload_digests)
+        if st.session_state.ingested_uploads.get("csv") != csv_digest:
+            try:
+                with st.spinner("CSV 처리 중..."):
+                    start_time = time.perf_counter()
+                    csv_data = process_csv_data(csv_file, digest=csv_digest)
+                    address_index = AddressIndex.from_dataframe(csv_data)
+                    dataset_profile = DatasetProfile.from_dataframe(csv_data)
+                    region_index = RegionIndex.from_dataframe(csv_data)
+                    query_engine = SoilQueryEngine.from_dataframe(csv_data, region_index)
+                    st.session_state.ingest_timings["csv"] = time.perf_counter() - start_time
+                    
+                    st.session_state.csv_data = csv_data
+                    st.session_state.address_index = address_index
+                    st.session_state.dataset_profile = dataset_profile
+                    st.session_state.region_index = region_index
+                    st.session_state.query_engine = query_engine
+                    
+                    # Replace the previous CSV summary in the knowledge base
+                    st.session_state.knowledge_sources["csv"] = format_csv_knowledge(csv_data)
+                    st.session_state.knowledge_base = "".join(st.session_state.knowledge_sources.values())
+                    st.session_state.ingested_uploads["csv"] = csv_digest
+            except Exception as e:
+                st.error(f"CSV 파일 처리 오류: {str(e)}")
+        if st.session_state.ingested_uploads.get("csv") == csv_digest:
+            st.caption(f"CSV 처리 완료: {csv_file.name} ({st.session_state.ingest_timings['csv']:.2f} 초)")
     
     # Display soil images
     st.subheader("토양 샘플")
@@ -144,11 +267,14 @@ with col1:
     st.header("토양 정보 챗")
     
     # 모델 상태 표시
-    model_status = "✅ 준비됨" if st.session_state.model_loaded else "⚠️ 모델 로드 필요"
+    model_loading = model_manager.status()["state"] == "loading"
+    model_status = "✅ 준비됨" if model_manager.is_loaded else ("⏳ 로드 중" if model_loading else "⚠️ 모델 로드 필요")
     st.markdown(f"**KoAlpaca 모델 상태:** {model_status}")
     
-    # 모델 로드 알림
-    if not st.session_state.model_loaded:
+    # 모델 로드 알림 (로드 중에는 질문을 받아 두었다가 로드 후 답변)
+    if model_loading:
+        st.info("모델을 로드하는 중입니다. 지금 질문하면 로드가 끝나는 대로 답변합니다.")
+    elif not model_manager.is_loaded:
         st.warning("왼쪽 사이드바에서 '모델 로드' 버튼을 클릭하세요.")
         
         # 문제 해결 가이드
@@ -172,6 +298,17 @@ with col1:
                 st.markdown(f"**You:** {message['content']}")
             else:
                 st.markdown(f"**Assistant:** {message['content']}")
+        for question in st.session_state.pending_questions:
+            st.markdown(f"**You:** {question} _(대기 중)_")
+    
+    # 마지막 질문의 프롬프트 토큰 사용량 (컨텍스트 출처별)
+    if st.session_state.get("prompt_tokens"):
+        usage = st.session_state.prompt_tokens
+        source_names = {"topic": "주제 설명", "region": "지역 프로필", "query": "조건 검색",
+                        "csv_summary": "CSV 요약", "retrieval": "문서 검색"}
+        sources = ", ".join(f"{source_names.get(source, source)} {tokens}" for source, tokens in usage["sources"].items())
+        dropped = f", 제외된 조각 {usage['dropped']}개" if usage["dropped"] else ""
+        st.caption(f"프롬프트 토큰 {usage['prompt_tokens']} / {usage['budget']} ({sources}{dropped})")
     
     # User input
     with st.form(key="chat_form", clear_on_submit=True):
@@ -180,25 +317,16 @@ with col1:
         
         if submit_button and user_input:
             # Check if model is loaded
-            if not st.session_state.model_loaded:
+            if model_manager.status()["state"] == "loading":
+                # 로드 중이면 질문을 대기열에 추가 (아래에서 로드 완료 후 답변)
+                st.session_state.pending_questions.append(user_input)
+                with chat_container:
+                    st.markdown(f"**You:** {user_input} _(대기 중)_")
+            elif not model_manager.is_loaded:
                 st.warning("먼저 모델을 로드해야 합니다. 사이드바에서 '모델 로드' 버튼을 클릭하세요.")
             else:
-                # Add user message to chat history
-                st.session_state.chat_history.append({"role": "user", "content": user_input})
-                
-                # Get response from KoAlpaca chatbot
-                with st.spinner("생각 중..."):
-                    if st.session_state.knowledge_base:
-                        response = get_chat_response_koalpaca(
-                            user_input, 
-                            st.session_state.knowledge_base, 
-                            st.session_state.csv_data
-                        )
-                    else:
-                        response = "토양 조사 PDF 또는 CSV 파일을 업로드하여 질문을 시작하세요."
-                    
-                    # Add assistant response to chat history
-                    st.session_state.chat_history.append({"role": "assistant", "content": response})
+                # Get response from KoAlpaca chatbot (생성되는 대로 대화창에 표시)
+                answer_question(user_input, chat_container)
                 
                 # 응답 시간 표시
                 if 'response_time' in st.session_state and st.session_state.response_time:
@@ -206,6 +334,26 @@ with col1:
                 
                 # Refresh the page to show the updated chat
                 st.rerun()
+    
+    # 대기 중인 질문: 로드 진행률을 보여주며 기다린 뒤 답변
+    # (기다리는 동안 새 질문을 보내면 이 실행은 중단되고 질문이 대기열에 추가됨)
+    if st.session_state.pending_questions:
+        st.caption(f"대기 중인 질문 {len(st.session_state.pending_questions)}개")
+        load_status = model_manager.status()
+        if load_status["state"] == "loading":
+            progress_bar = st.progress(load_status["progress"], text=f"모델 로드 중: {load_status['stage']}")
+            while load_status["state"] == "loading":
+                time.sleep(0.5)
+                load_status = model_manager.status()
+                progress_bar.progress(load_status["progress"], text=f"모델 로드 중: {load_status['stage']}")
+        
+        if model_manager.is_loaded:
+            while st.session_state.pending_questions:
+                answer_question(st.session_state.pending_questions.pop(0), chat_container)
+            st.rerun()
+        elif load_status["state"] == "failed":
+            st.error(f"모델 로드 실패: {load_status['error']}")
+            st.session_state.pending_questions = []
 
 with col2:
     # Data preview section
@@ -228,11 +376,11 @@ with col2:
     if address_search and st.session_state.csv_data is not None:
         # Search for address in CSV data
         try:
-            filtered_data = st.session_state.csv_data[
-                st.session_state.csv_data.apply(
-                    lambda row: address_search.lower() in str(row).lower(), axis=1
-                )
-            ]
+            filtered_data = get_soil_data_by_address(
+                st.session_state.csv_data,
+                address_search,
+                st.session_state.address_index
+            )
             
             if not filtered_data.empty:
                 st.success(f"'{address_search}'에 대한 {len(filtered_data)}개 결과 발견")
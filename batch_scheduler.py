@@ -0,0 +1,224 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import NamedTuple
+
+# Most prompts run through the model in one forward pass
+DEFAULT_MAX_BATCH_SIZE = 8
+
+# How long the first prompt of a batch waits for others to join it (seconds)
+DEFAULT_MAX_WAIT = 0.02
+
+# Number of recent requests kept for stats()
+STATS_WINDOW = 1000
+
+
+class BatchResult(NamedTuple):
+    """Generated text of one request, with where its time went."""
+    text: str
+    queue_seconds: float
+    compute_seconds: float
+    batch_size: int
+
+class _Request(NamedTuple):
+    prompt: str
+    params: tuple
+    future: Future
+    submitted: float
+    stream: object
+
+class TextStream:
+    """
+    Pieces of one request's text, handed from the worker to the caller as they are generated.
+
+    Iterating blocks until the next piece and stops once the worker calls end(). A caller
+    that stops reading calls cancel(); generate_batch should then stop generating that text.
+    """
+
+    _END = object()
+
+    def __init__(self, **options):
+        """
+        Args:
+            **options: Per-request settings for generate_batch, kept as attributes
+        """
+        self.__dict__.update(options)
+        self._pieces = queue.Queue()
+        self._cancelled = threading.Event()
+
+    def put(self, piece):
+        """Add a piece of text (called by generate_batch)."""
+        self._pieces.put(piece)
+
+    def end(self):
+        """Mark the text complete (called by generate_batch, also when it fails)."""
+        self._pieces.put(self._END)
+
+    def cancel(self):
+        """Tell the worker nobody is reading any more."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def __iter__(self):
+        while True:
+            piece = self._pieces.get()
+            if piece is self._END:
+                return
+            yield piece
+
+class BatchScheduler:
+    """
+    Collects prompts submitted by concurrent callers and runs them through the model together.
+
+    A worker thread takes the first waiting prompt, then keeps collecting until the batch is
+    full or max_wait has passed since that prompt arrived. Prompts with the same generation
+    parameters are passed to generate_batch as one list (the model pads them to one batch),
+    and each caller's future receives its own text.
+
+    Requests submitted with a TextStream are passed to generate_batch as streams=[...] (None
+    for the others), so streamed and plain requests share batches and one worker runs every
+    generation. Requests whose future is cancelled before their batch starts are skipped.
+    """
+
+    def __init__(self, generate_batch, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT):
+        """
+        Start the scheduler.
+
+        Args:
+            generate_batch (callable): (prompts, *params) -> list of texts, one per prompt
+            max_batch_size (int): Maximum number of prompts per call of generate_batch
+            max_wait (float): Maximum seconds a prompt waits for the batch to fill
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._recent = deque(maxlen=STATS_WINDOW)
+        self._num_batches = 0
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, prompt, *params, stream=None):
+        """
+        Queue a prompt.
+
+        Args:
+            prompt (str): Prompt text
+            *params: Generation parameters passed to generate_batch after the prompts
+                (e.g. max_tokens, temperature); only prompts with equal parameters share a batch
+            stream (TextStream, optional): Receives the text piece by piece while it is generated
+
+        Returns:
+            concurrent.futures.Future: Resolves to a BatchResult, or raises the model's error
+        """
+        if self._closed:
+            raise RuntimeError("scheduler is closed")
+        future = Future()
+        self._queue.put(_Request(prompt, params, future, time.perf_counter(), stream))
+        return future
+
+    def generate(self, prompt, *params, timeout=None):
+        """Submit a prompt and wait for its BatchResult."""
+        return self.submit(prompt, *params).result(timeout)
+
+    def close(self):
+        """Stop the worker once the queued prompts are done."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._worker.join()
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the wait is over."""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first.submitted + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.params, []).append(request)
+            for params, requests in groups.items():
+                self._run_batch(requests, params)
+
+    def _run_batch(self, requests, params):
+        """Run one batch through the model and resolve each request's future."""
+        # Callers that gave up while queued are dropped
+        requests = [request for request in requests if request.future.set_running_or_notify_cancel()]
+        if not requests:
+            return
+        started = time.perf_counter()
+        try:
+            streams = [request.stream for request in requests]
+            if any(stream is not None for stream in streams):
+                texts = self.generate_batch([request.prompt for request in requests], *params, streams=streams)
+            else:
+                texts = self.generate_batch([request.prompt for request in requests], *params)
+            if len(texts) != len(requests):
+                raise RuntimeError(f"generate_batch returned {len(texts)} texts for {len(requests)} prompts")
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+                if request.stream is not None:
+                    request.stream.end()
+            return
+        finished = time.perf_counter()
+
+        results = [
+            BatchResult(text, started - request.submitted, finished - started, len(requests))
+            for request, text in zip(requests, texts)
+        ]
+        with self._stats_lock:
+            self._num_batches += 1
+            self._recent.extend(results)
+        for request, result in zip(requests, results):
+            request.future.set_result(result)
+
+    def stats(self):
+        """
+        Summarize the most recent requests.
+
+        Returns:
+            dict: batches (total run), requests (in the window), mean_batch_size,
+                mean/max queue_seconds and mean compute_seconds over the window
+        """
+        with self._stats_lock:
+            recent = list(self._recent)
+            num_batches = self._num_batches
+        if not recent:
+            return {"batches": num_batches, "requests": 0}
+        return {
+            "batches": num_batches,
+            "requests": len(recent),
+            "mean_batch_size": sum(r.batch_size for r in recent) / len(recent),
+            "mean_queue_seconds": sum(r.queue_seconds for r in recent) / len(recent),
+            "max_queue_seconds": max(r.queue_seconds for r in recent),
+            "mean_compute_seconds": sum(r.compute_seconds for r in recent) / len(recent),
+        }
@@ -0,0 +1,705 @@
+"""
+Benchmarks for the soil chatbot's data paths.
+
+Usage:
+    python benchmarks.py address_index --sizes 20000 200000 2000000
+    python benchmarks.py pdf_extraction --pages 400 --workers 4
+    python benchmarks.py retrieval --paragraphs 5000
+    python benchmarks.py csv_ingestion --rows 2000000 --chunksize 100000
+    python benchmarks.py csv_cache --rows 23181 200000
+    python benchmarks.py soil_query --sizes 20000 200000 2000000
+    python benchmarks.py intent_routing --turns 2000
+    python benchmarks.py batching --clients 16 --batch-sizes 1 4 8
+    python benchmarks.py quantization --model hf-internal-testing/tiny-random-GPTNeoXForCausalLM --threads 4
+    python benchmarks.py prefix_cache --model models/koalpaca-cpu --precision int8
+    python benchmarks.py response_cache --repeat 200
+    python benchmarks.py conversation_memory --turns 30
+    python benchmarks.py dense_retrieval --sizes 20000 200000 --dim 384
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from address_index import AddressIndex
+import csv_processor
+from csv_processor import process_csv_data, ingest_csv_chunked, clean_csv_data, compact_dataframe
+from dataset_cache import file_digest
+from pdf_processor import extract_text_from_pdf, get_pdf_cache_stats, page_cache
+from chunking import chunk_knowledge_base
+from retrieval import KnowledgeIndex
+from region_index import RegionIndex
+from soil_query import SoilQueryEngine
+from intent_router import get_intent_router
+from batch_scheduler import BatchScheduler
+
+SOIL_CSV_PATH = "chatbot_wanju_reduced.csv"
+
+
+def time_call(func, repeat=1):
+    """
+    Time a function call.
+
+    Args:
+        func (callable): Function taking no arguments
+        repeat (int): Number of calls to average over
+
+    Returns:
+        tuple: (seconds per call, result of the last call)
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+def make_soil_frame(num_rows, seed=0):
+    """
+    Build a synthetic soil table of the requested size from the bundled Wanju CSV.
+    Rows are resampled and given fresh lot numbers so that addresses stay realistic
+    but are mostly distinct, as in the full-county exports.
+
+    Args:
+        num_rows (int): Number of rows to generate
+        seed (int): Random seed
+
+    Returns:
+        pandas.DataFrame: Synthetic soil data
+    """
+    base = pd.read_csv(SOIL_CSV_PATH)
+    rng = np.random.default_rng(seed)
+    df = base.iloc[rng.integers(0, len(base), num_rows)].reset_index(drop=True)
+
+    # Replace the lot number (last token) with a random one
+    prefixes = df["주소"].str.strip().str.rsplit(" ", n=1).str[0]
+    lots = pd.Series(rng.integers(1, 3000, num_rows)).astype(str) + "-" + pd.Series(rng.integers(1, 40, num_rows)).astype(str)
+    df["주소"] = prefixes + " " + lots
+    return df
+
+def bench_address_index(args):
+    """Compare the address index against the row-wise scan the search panel used to run."""
+    queries = ["삼례읍", "전라북도 완주군 삼례읍 삼례리", "상개리", "715-1", "고산면 오산리", "없는주소"]
+
+    for num_rows in args.sizes:
+        df = make_soil_frame(num_rows)
+        build_time, index = time_call(lambda: AddressIndex.from_dataframe(df))
+        print(f"\n{num_rows:,} rows (index build {build_time:.2f} s)")
+        print(f"  {'query':<30} {'matches':>8} {'scan ms':>10} {'index ms':>10}")
+
+        for query in queries:
+            index_time, rows = time_call(lambda: index.search(query), repeat=args.repeat)
+            if args.skip_scan_above and num_rows > args.skip_scan_above:
+                scan_text = "skipped"
+            else:
+                scan_time, scanned = time_call(lambda: df[df.apply(
+                    lambda row: query.lower() in str(row).lower(), axis=1
+                )])
+                scan_text = f"{scan_time * 1000:.1f}"
+            print(f"  {query:<30} {len(rows):>8} {scan_text:>10} {index_time * 1000:>10.3f}")
+
+def make_text_pdf(path, num_pages, lines_per_page=45, seed=0):
+    """
+    Write a multi-page PDF filled with text, standing in for a soil survey handbook.
+
+    Args:
+        path (str): Output path
+        num_pages (int): Number of pages
+        lines_per_page (int): Lines of text per page
+        seed (int): Random seed
+    """
+    words = ["soil", "series", "texture", "loam", "sandy", "clay", "drainage", "depth",
+             "horizon", "parent", "material", "slope", "color", "munsell", "organic", "matter"]
+    rng = np.random.default_rng(seed)
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+
+    for page_num in range(num_pages):
+        page = writer.add_blank_page(width=595, height=842)
+        lines = ["BT /F1 10 Tf 40 800 Td 12 TL"]
+        for _ in range(lines_per_page):
+            line = " ".join(rng.choice(words, 12))
+            lines.append(f"({line}) '")
+        lines.append("ET")
+
+        stream = DecodedStreamObject()
+        stream.set_data("\n".join(lines).encode("latin-1"))
+        page.replace_contents(stream)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+
+    with open(path, "wb") as file:
+        writer.write(file)
+
+def bench_pdf_extraction(args):
+    """Compare serial and process-pool PDF extraction on a generated multi-hundred-page PDF."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, "handbook.pdf")
+        make_text_pdf(pdf_path, args.pages)
+        print(f"{args.pages} pages, {os.path.getsize(pdf_path) / 1024:.0f} KiB")
+
+        serial_time, serial_text = time_call(lambda: extract_text_from_pdf(pdf_path, workers=1, use_cache=False))
+        print(f"  serial      {serial_time:6.2f} s")
+        for workers in args.workers:
+            parallel_time, parallel_text = time_call(
+                lambda: extract_text_from_pdf(pdf_path, workers=workers, use_cache=False)
+            )
+            same = "identical" if parallel_text == serial_text else "DIFFERENT"
+            print(f"  {workers:2d} workers  {parallel_time:6.2f} s  x{serial_time / parallel_time:.2f}  ({same} output)")
+
+        # Cold then warm start through the on-disk page cache
+        page_cache.cache_dir = os.path.join(tmp_dir, "cache")
+        cold_time, _ = time_call(lambda: extract_text_from_pdf(pdf_path, workers=1))
+        warm_time, warm_text = time_call(lambda: extract_text_from_pdf(pdf_path, workers=1))
+        same = "identical" if warm_text == serial_text else "DIFFERENT"
+        print(f"  cache cold  {cold_time:6.2f} s")
+        print(f"  cache warm  {warm_time * 1000:6.1f} ms  ({same} output, {get_pdf_cache_stats()})")
+
+def make_soil_knowledge_base(num_paragraphs, seed=0):
+    """
+    Build a Korean knowledge base with one descriptive paragraph per soil survey row.
+
+    Args:
+        num_paragraphs (int): Number of paragraphs
+        seed (int): Random seed
+
+    Returns:
+        tuple: (knowledge base text, list of the source rows as dicts)
+    """
+    rows = make_soil_frame(num_paragraphs, seed).to_dict("records")
+    paragraphs = [
+        f"{row['주소']} 필지의 토양은 {row['토양통명']} 토양통으로 분류된다. "
+        f"표토의 토성은 {row['표토토성']}이고 심토는 {row['심토토성']}이며, 경사는 {row['경사']}이다. "
+        f"배수등급은 {row['배수등급']}이고 유효토심은 {row['유효토심']}이다. "
+        f"모재는 {row['모암_모재']}이며 {row['분포지형']}에 분포한다."
+        for row in rows
+    ]
+    return "\n\n".join(paragraphs), rows
+
+def scan_paragraphs(user_query, knowledge_base, top_k=3):
+    """The keyword scan create_context_koalpaca used before the retrieval index."""
+    search_terms = [word for word in user_query.lower().split() if len(word) > 2]
+    snippets = []
+    for para in knowledge_base.split('\n\n'):
+        if any(term in para.lower() for term in search_terms):
+            if len(para) > 20:
+                snippets.append(para)
+    return snippets[:top_k]
+
+def bench_retrieval(args):
+    """Compare BM25 retrieval against the paragraph scan: latency and recall@3."""
+    knowledge_base, rows = make_soil_knowledge_base(args.paragraphs)
+    build_time, index = time_call(lambda: KnowledgeIndex(chunk_knowledge_base(knowledge_base)))
+    print(f"{args.paragraphs:,} paragraphs, {len(knowledge_base) / 1024:.0f} KiB (index build {build_time:.2f} s)")
+
+    # Each query asks about one row; the paragraph describing that row is the relevant one
+    rng = np.random.default_rng(1)
+    targets = rng.choice(len(rows), args.queries, replace=False)
+    queries = []
+    for i in targets:
+        parts = rows[i]["주소"].split()
+        queries.append((f"{' '.join(parts[-2:])}의 토양은 어떤가요?", parts[-2] + " " + parts[-1]))
+
+    scan_hits = index_hits = 0
+    scan_time = index_time = 0.0
+    for query, address_tail in queries:
+        elapsed, snippets = time_call(lambda: scan_paragraphs(query, knowledge_base))
+        scan_time += elapsed
+        scan_hits += any(address_tail in snippet for snippet in snippets)
+
+        elapsed, results = time_call(lambda: index.search(query, top_k=3))
+        index_time += elapsed
+        index_hits += any(address_tail in chunk.text for _, chunk in results)
+
+    print(f"  {'method':<8} {'ms/query':>10} {'recall@3':>10}")
+    print(f"  {'scan':<8} {scan_time / len(queries) * 1000:>10.2f} {scan_hits / len(queries):>10.2f}")
+    print(f"  {'bm25':<8} {index_time / len(queries) * 1000:>10.2f} {index_hits / len(queries):>10.2f}")
+
+def peak_rss_bytes():
+    """
+    Peak resident memory of this process.
+    Reads VmHWM on Linux: ru_maxrss survives exec, so a child started by a large parent
+    would report the parent's peak.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # KiB on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+def _ingest_once(csv_path, mode, chunksize):
+    """Run one ingestion mode and print its time and peak RSS (called in a fresh process)."""
+    elapsed, result = time_call(lambda: (
+        process_csv_data(csv_path, chunksize=0) if mode == "read_csv"
+        else ingest_csv_chunked(csv_path, chunksize=chunksize) if mode == "chunked"
+        else ingest_csv_chunked(csv_path, chunksize=chunksize, output_dir=os.path.join(os.path.dirname(csv_path), "chunks"))
+    ))
+    num_rows = len(result) if isinstance(result, pd.DataFrame) else result.num_rows
+    peak_mb = peak_rss_bytes() / (1024 * 1024)
+    print(f"  {mode:<14} {elapsed:8.2f} s {peak_mb:10.0f} MB  ({num_rows:,} rows)")
+
+def bench_csv_ingestion(args):
+    """Compare one-shot and chunked CSV ingestion: wall time and peak resident memory."""
+    if args.worker:
+        _ingest_once(*args.worker[:2], int(args.worker[2]))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "soil.csv")
+        make_soil_frame(args.rows).to_csv(csv_path, index=False)
+        print(f"{args.rows:,} rows, {os.path.getsize(csv_path) / (1024 * 1024):.0f} MB CSV")
+        print(f"  {'mode':<14} {'time':>10} {'peak RSS':>13}")
+        # Each mode runs in its own process so that peak RSS is not shared between them
+        for mode in ["read_csv", "chunked", "chunked_disk"]:
+            subprocess.run([sys.executable, __file__, "csv_ingestion", "--worker", csv_path, mode, str(args.chunksize)],
+                           check=True)
+
+def _generate_once(model_path, precision, threads, max_tokens):
+    """Load the model at one precision and print its decoding speed and memory (called in a fresh process)."""
+    import torch
+    from koalpaca_chatbot import load_causal_lm, model_memory_bytes, WARMUP_PROMPT
+
+    load_time, (tokenizer, model, precision) = time_call(lambda: load_causal_lm(model_path, precision, threads))
+    inputs = tokenizer(WARMUP_PROMPT, return_tensors="pt").to(model.device)
+
+    def generate(num_tokens):
+        with torch.inference_mode():
+            # Greedy and with EOS disabled, so every precision decodes the same number of tokens
+            return model.generate(**inputs, max_new_tokens=num_tokens, min_new_tokens=num_tokens, do_sample=False,
+                                  pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id)
+
+    generate(2)
+    elapsed, _ = time_call(lambda: generate(max_tokens))
+    print(f"  {precision:<8} {torch.get_num_threads():>7} {load_time:>8.1f} {max_tokens / elapsed:>9.1f} "
+          f"{model_memory_bytes(model) / (1024 * 1024):>10.0f} {peak_rss_bytes() / (1024 * 1024):>10.0f}")
+
+def bench_quantization(args):
+    """Compare decoding speed and memory of the model at each weight precision on CPU."""
+    if args.worker:
+        model_path, precision, threads, max_tokens = args.worker
+        _generate_once(model_path, precision, int(threads), int(max_tokens))
+        return
+
+    print(f"{args.model}, {args.tokens} greedy tokens")
+    print(f"  {'weights':<8} {'threads':>7} {'load s':>8} {'tokens/s':>9} {'weights MB':>10} {'peak RSS':>10}")
+    # Each precision runs in its own process so that peak RSS is not shared between them
+    for precision in args.precisions:
+        for threads in args.threads:
+            subprocess.run([sys.executable, __file__, "quantization", "--worker",
+                            args.model, precision, str(threads), str(args.tokens)], check=True)
+
+def bench_prefix_cache(args):
+    """Compare time to first token with and without the prompt prefix KV cache on CPU."""
+    import koalpaca_chatbot
+    from koalpaca_chatbot import KoAlpacaModelManager, build_prompt_koalpaca, load_causal_lm
+
+    df = process_csv_data(SOIL_CSV_PATH)
+    profile = csv_processor.DatasetProfile.from_dataframe(df)
+    questions = ["석천 토양통의 특징이 무엇인가요?", "남계 토양통은 어떤 토양인가요?", "토색이 무엇인가요?",
+                 "양토와 사양토의 차이는?", "토양 관리 방법을 알려주세요", "고천 토양통의 배수는 어떤가요?"]
+    prompts = [build_prompt_koalpaca(q, "", df, profile)[:3] for q in questions]
+
+    manager = KoAlpacaModelManager(demo_mode=False)
+    manager.tokenizer, manager.model, precision = load_causal_lm(args.model, args.precision, args.threads)
+    manager.load_state = koalpaca_chatbot.LOAD_STATE_LOADED
+    cache = manager.prefix_cache
+    lengths = [len(manager.tokenizer(prompt)["input_ids"]) for prompt, _, _ in prompts]
+    print(f"{args.model} ({precision}), prompts of {min(lengths)}-{max(lengths)} tokens, {args.rounds} rounds")
+    print(f"  {'prefix cache':<14} {'mean TTFT ms':>13} {'cached tokens':>14}")
+
+    for enabled in [False, True]:
+        manager.prefix_cache = cache if enabled else None
+        ttfts = []
+        for _ in range(args.rounds):
+            for prompt, intent, prefixes in prompts:
+                timings = {}
+                for _ in manager.stream_response(prompt, max_tokens=args.tokens, intent=intent,
+                                                 timings=timings, prefixes=prefixes):
+                    pass
+                if timings.get("error"):
+                    raise RuntimeError(f"generation failed for {prompt[-40:]!r}")
+                ttfts.append(timings["ttft_seconds"])
+        cached = ""
+        if enabled:
+            ids = [manager.tokenizer(prompt)["input_ids"] for prompt, _, _ in prompts]
+            cached = f"{np.mean([cache.longest_prefix(i)[0] for i in ids]):.0f}"
+        print(f"  {'on' if enabled else 'off':<14} {np.mean(ttfts) * 1000:>13.1f} {cached:>14}")
+    stats = cache.stats()
+    print(f"  cache: {stats['entries']} entries, {stats['bytes'] / (1024 * 1024):.1f} MB")
+
+def bench_response_cache(args):
+    """Compare a response cache lookup against building the prompt context, and check paraphrase hits."""
+    from koalpaca_chatbot import build_prompt_koalpaca, response_cache_key
+    from response_cache import ResponseCache
+
+    df = process_csv_data(SOIL_CSV_PATH)
+    profile = csv_processor.DatasetProfile.from_dataframe(df)
+    region_index = RegionIndex.from_dataframe(df)
+    engine = SoilQueryEngine.from_dataframe(df, region_index)
+    knowledge_base, _ = make_soil_knowledge_base(2000)
+    # (question, paraphrase that should hit, similar question that must miss)
+    cases = [
+        ("토색이 뭐야?", "토색이란 무엇인가요?", "토성이 뭐야?"),
+        ("석천 토양통의 특징이 무엇인가요?", "석천 토양통 특징 알려줘", "남계 토양통의 특징이 무엇인가요?"),
+        ("전라북도 완주군 삼례읍의 토양 특성은 어떤가요?", "완주군 삼례읍 토양 특성은?", "완주군 고산면의 토양 특성은 어떤가요?"),
+        ("양토와 사양토의 차이점은 무엇인가요?", "양토와 사양토 차이점 알려주세요", "양토와 식양토의 차이점은 무엇인가요?"),
+        ("완주군에서 배수가 양호한 지역은 어디인가요?", "완주군 배수 양호한 지역 어디?", "완주군에서 배수가 불량한 지역은 어디인가요?"),
+        # Antonyms outside the signature must not share an answer
+        ("완주군에서 면적이 가장 넓은 토양통은 무엇인가요?", "완주군에서 면적이 가장 넓은 토양통은?",
+         "완주군에서 면적이 가장 좁은 토양통은 무엇인가요?"),
+        ("삼례읍에서 가장 흔한 토성은 무엇인가요?", "삼례읍에서 가장 흔한 토성은?", "삼례읍에서 가장 드문 토성은 무엇인가요?"),
+    ]
+    cache = ResponseCache()
+    keys = {}
+    for question, paraphrase, other in cases:
+        for q in (question, paraphrase, other):
+            keys[q] = response_cache_key(q, knowledge_base, df, profile, region_index, engine)
+        cache.put(keys[question][0], question, f"answer to {question}", keys[question][1])
+
+    print(f"  {'question':<34} {'paraphrase':>10} {'other':>8}")
+    for question, paraphrase, other in cases:
+        hit = cache.get(keys[paraphrase][0], paraphrase, keys[paraphrase][1]) == f"answer to {question}"
+        wrong = cache.get(keys[other][0], other, keys[other][1]) is not None
+        print(f"  {question:<34} {'hit' if hit else 'miss':>10} {'WRONG HIT' if wrong else 'miss':>8}")
+
+    questions = [case[1] for case in cases]
+    key_time, _ = time_call(lambda: [response_cache_key(q, knowledge_base, df, profile, region_index, engine)
+                                     for q in questions], repeat=args.repeat)
+    lookup_time, _ = time_call(lambda: [cache.get(keys[q][0], q, keys[q][1]) for q in questions], repeat=args.repeat)
+    context_time, _ = time_call(lambda: [build_prompt_koalpaca(q, knowledge_base, df, profile, region_index, engine)
+                                         for q in questions], repeat=max(1, args.repeat // 10))
+    print(f"  cache key {key_time / len(questions) * 1000:.3f} ms + lookup {lookup_time / len(questions) * 1000:.3f} ms "
+          f"per question, vs {context_time / len(questions) * 1000:.2f} ms to build the prompt (before generation)")
+    print(f"  {cache.stats()}")
+
+def bench_conversation_memory(args):
+    """Compare prompt size over a long chat with the bounded history against the full transcript."""
+    from koalpaca_chatbot import build_prompt_koalpaca, create_conversation_memory
+    from prompt_builder import estimate_tokens
+
+    df = process_csv_data(SOIL_CSV_PATH)
+    profile = csv_processor.DatasetProfile.from_dataframe(df)
+    region_index = RegionIndex.from_dataframe(df)
+    questions = ["삼례읍의 토성은 어떤가요?", "그럼 배수는?", "석천 토양통의 특징이 무엇인가요?",
+                 "유기물 함량은 어떻게 높이나요?", "토양 산도는 어떻게 관리하나요?"]
+    answer = "해당 지역은 양토와 사양토가 많고 배수가 양호한 편입니다. 유기물을 꾸준히 넣어 주면 보수력이 좋아집니다. " * 3
+
+    memory = create_conversation_memory()
+    transcript = ""
+    print(f"  {'turn':>5} {'bounded tok':>12} {'full tok':>10} {'build ms':>9}")
+    for turn in range(1, args.turns + 1):
+        question = questions[(turn - 1) % len(questions)]
+        build_time, (prompt, _, _, usage) = time_call(
+            lambda: build_prompt_koalpaca(question, "", df, profile, region_index, memory=memory))
+        base = build_prompt_koalpaca(question, "", df, profile, region_index)[0]
+        full = estimate_tokens(base) + estimate_tokens(transcript)
+        if turn == 1 or turn % max(1, args.turns // 6) == 0:
+            print(f"  {turn:>5} {usage['prompt_tokens']:>12,} {full:>10,} {build_time * 1000:>9.2f}")
+        memory.add_turn(question, answer)
+        transcript += f"사용자: {question}\n챗봇: {answer}\n"
+
+def make_embeddings(num_rows, dim, num_topics=256, seed=0):
+    """Unit vectors scattered around num_topics random directions, like embeddings of a real corpus."""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(num_topics, dim)).astype(np.float32)
+    vectors = topics[rng.integers(num_topics, size=num_rows)] + 0.6 * rng.normal(size=(num_rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def bench_dense_retrieval(args):
+    """Compare exact float32 search with the memory-mapped float16/int8 flat and inverted file indexes."""
+    from dense_retrieval import DenseIndex
+
+    print(f"  {'rows':>9} {'index':<13} {'disk MB':>8} {'build s':>8} {'query ms':>9} {'recall@10':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_rows in args.sizes:
+            vectors = make_embeddings(num_rows + args.queries, args.dim)
+            vectors, queries = vectors[:num_rows], vectors[num_rows:]
+            exact_time, exact = time_call(lambda: [np.argsort(-(vectors @ q))[:10] for q in queries])
+            print(f"  {num_rows:>9,} {'float32 exact':<13} {vectors.nbytes / 2**20:>8.1f} {'':>8} "
+                  f"{exact_time / len(queries) * 1000:>9.2f} {1.0:>10.3f}")
+
+            for dtype in ("float16", "int8"):
+                for num_lists in (0, None):
+                    build_time, index = time_call(lambda: DenseIndex.build(vectors, dtype=dtype, num_lists=num_lists))
+                    directory = os.path.join(tmp_dir, f"{num_rows}-{dtype}-{num_lists}")
+                    index.save(directory)
+                    index = DenseIndex.load(directory)
+                    disk = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+                    query_time, results = time_call(lambda: [index.search(q, 10, args.nprobe) for q in queries])
+                    recall = np.mean([len(set(int(i) for i in truth) & {i for _, i in found}) / 10
+                                      for truth, found in zip(exact, results)])
+                    name = f"{dtype} {'ivf' if index.centroids is not None else 'flat'}"
+                    print(f"  {'':>9} {name:<13} {disk / 2**20:>8.1f} {build_time:>8.2f} "
+                          f"{query_time / len(queries) * 1000:>9.2f} {recall:>10.3f}")
+
+def bench_csv_cache(args):
+    """Compare parsing and cleaning the CSV against loading the cached Feather table."""
+    print(f"  {'rows':>10} {'parse ms':>10} {'cached ms':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_processor.CSV_CACHE_DIR = os.path.join(tmp_dir, "cache")
+        for num_rows in args.rows:
+            csv_path = os.path.join(tmp_dir, f"soil_{num_rows}.csv")
+            make_soil_frame(num_rows).to_csv(csv_path, index=False)
+            digest = file_digest(csv_path)
+
+            parse_time, parsed = time_call(lambda: process_csv_data(csv_path, chunksize=0))
+            process_csv_data(csv_path, chunksize=0, digest=digest)
+            cached_time, cached = time_call(lambda: process_csv_data(csv_path, digest=digest), repeat=args.repeat)
+            same = "identical" if parsed.equals(cached) else "DIFFERENT"
+            print(f"  {num_rows:>10,} {parse_time * 1000:>10.1f} {cached_time * 1000:>10.1f}  ({same})")
+
+def bench_soil_query(args):
+    """Compare the bitmap query engine against pandas boolean filtering of the table."""
+    questions = [
+        ("완주군에서 배수가 양호한 지역은 어디인가요?", {"배수등급": ["양호"]}, None),
+        ("삼례읍에서 사양토인 곳은?", {"표토토성": ["사양토"]}, "삼례읍"),
+        ("경사 15% 이상이고 변성암인 필지", {"경사": ["15-30%", "30-60%", "60-100%"], "모암_모재": ["변성암"]}, None),
+    ]
+    for num_rows in args.sizes:
+        df = clean_csv_data(make_soil_frame(num_rows), copy=False)
+        compact_dataframe(df)
+        build_time, engine = time_call(lambda: SoilQueryEngine(df, RegionIndex.from_dataframe(df)))
+        print(f"\n{num_rows:,} rows (engine build {build_time:.2f} s)")
+        print(f"  {'question':<32} {'rows':>8} {'pandas ms':>10} {'engine ms':>10}")
+        for question, constraints, eupmyeon in questions:
+            def pandas_filter():
+                mask = np.ones(len(df), dtype=bool)
+                for col, values in constraints.items():
+                    mask &= df[col].isin(values).to_numpy()
+                if eupmyeon:
+                    mask &= df["주소"].astype(str).str.contains(eupmyeon, regex=False).to_numpy()
+                matched = df[mask]
+                matched["주소"].astype(str).str.split().str[2].value_counts()
+                return matched
+            pandas_time, expected = time_call(pandas_filter, repeat=args.repeat)
+            engine_time, result = time_call(lambda: engine.query(question), repeat=args.repeat)
+            same = "" if result.count == len(expected) else "  (count differs)"
+            print(f"  {question:<32} {result.count:>8} {pandas_time * 1000:>10.2f} {engine_time * 1000:>10.3f}{same}")
+
+def legacy_context_topic(user_query):
+    """The keyword chain create_context_koalpaca used before the intent router."""
+    if "토색" in user_query.lower() or "흙 색깔" in user_query.lower() or "토양 색" in user_query.lower():
+        return "soil_color"
+    elif "토양통" in user_query.lower() or "석천" in user_query.lower() or "남계" in user_query.lower() or "고천" in user_query.lower():
+        return "soil_series"
+    elif "토성" in user_query.lower() or "양토" in user_query.lower() or "사양토" in user_query.lower():
+        return "soil_texture"
+    elif "완주" in user_query.lower() or "삼례" in user_query.lower() or "주소" in user_query.lower():
+        return "address"
+    return "general"
+
+def legacy_prompt_topic(prompt):
+    """The keyword chain generate_response ran over the whole prompt before the intent router."""
+    if "토색" in prompt.lower() or "토양 색" in prompt.lower():
+        return "soil_color"
+    elif "토양통" in prompt.lower() or "석천" in prompt.lower():
+        return "soil_series"
+    elif "토성" in prompt.lower():
+        return "soil_texture"
+    return "general"
+
+def bench_intent_routing(args):
+    """Compare the two keyword chains of a chat turn against one pass of the intent router."""
+    from koalpaca_chatbot import create_context_koalpaca, create_koalpaca_prompt
+
+    df = process_csv_data(SOIL_CSV_PATH)
+    profile = csv_processor.DatasetProfile.from_dataframe(df)
+    questions = ["토색이 무엇인가요?", "석천 토양통의 특징이 무엇인가요?", "삼례읍의 토성은 어떤가요?",
+                 "완주군에서 배수가 양호한 지역은 어디인가요?", "고산면 토양은?", "토양 관리 방법을 알려주세요"]
+    prompts = [create_koalpaca_prompt("당신은 토양 정보 전문가입니다.", create_context_koalpaca(q, "", df, profile) + q)
+               for q in questions]
+    router = get_intent_router(profile.frequencies)
+    turns = [(questions[i % len(questions)], prompts[i % len(questions)]) for i in range(args.turns)]
+
+    legacy_time, _ = time_call(lambda: [(legacy_context_topic(q), legacy_prompt_topic(p)) for q, p in turns])
+    router_time, _ = time_call(lambda: [router.top(q) for q, _ in turns])
+    prompt_time, _ = time_call(lambda: [router.top(p) for _, p in turns])
+    lookup_time, _ = time_call(lambda: [get_intent_router(profile.frequencies) for _ in turns])
+
+    print(f"{len(router._keywords)} keywords, prompts of {min(map(len, prompts))}-{max(map(len, prompts))} characters")
+    print(f"  {'method':<36} {'us/turn':>8}")
+    print(f"  {'if/elif chains (query + prompt)':<36} {legacy_time / args.turns * 1e6:>8.1f}")
+    print(f"  {'router (query, once per turn)':<36} {router_time / args.turns * 1e6:>8.1f}")
+    print(f"  {'router cache lookup':<36} {lookup_time / args.turns * 1e6:>8.1f}")
+    print(f"  {'router over the whole prompt':<36} {prompt_time / args.turns * 1e6:>8.1f}")
+    changed = [q for q in questions if legacy_context_topic(q) != router.top(q).name]
+    print(f"  routed differently from the old chain: {changed or 'none'}")
+
+class TinyCausalModel:
+    """
+    Stand-in for the language model: byte tokens, a small residual MLP per decoding step and
+    greedy decoding, all in numpy. Like the real model, one decoding step costs a pass over
+    the weights whatever the batch size, so it shows what batching buys on CPU.
+    """
+
+    def __init__(self, dim=512, layers=4, seed=0):
+        rng = np.random.default_rng(seed)
+        self.embedding = rng.standard_normal((256, dim)).astype(np.float32) / np.sqrt(dim)
+        self.layers = [
+            (rng.standard_normal((dim, 4 * dim)).astype(np.float32) / np.sqrt(dim),
+             rng.standard_normal((4 * dim, dim)).astype(np.float32) / np.sqrt(4 * dim))
+            for _ in range(layers)
+        ]
+
+    def step(self, hidden):
+        """One decoding step for a (batch, dim) hidden state; returns the new state and next tokens."""
+        for w_in, w_out in self.layers:
+            hidden = hidden + np.tanh(hidden @ w_in) @ w_out
+        return hidden, np.argmax(hidden @ self.embedding.T, axis=1)
+
+    def generate_batch(self, prompts, max_tokens, temperature=0.0):
+        """Greedy-decode max_tokens bytes for each prompt (temperature is accepted and ignored)."""
+        tokens = [np.frombuffer(prompt.encode("utf-8"), dtype=np.uint8) for prompt in prompts]
+        # Prompt state: mean of the byte embeddings (each row is independent of the padding)
+        hidden = np.stack([self.embedding[t].mean(axis=0) for t in tokens])
+        generated = []
+        for _ in range(max_tokens):
+            hidden, next_tokens = self.step(hidden)
+            hidden = hidden + self.embedding[next_tokens]
+            generated.append(next_tokens)
+        generated = np.stack(generated, axis=1).astype(np.uint8) if generated else np.zeros((len(prompts), 0), np.uint8)
+        return [row.tobytes().hex() for row in generated]
+
+def bench_batching(args):
+    """Compare request throughput and latency through the batch scheduler at several batch sizes."""
+    model = TinyCausalModel(dim=args.dim)
+    prompts = [f"### 명령어:\n질문 {i}: 삼례읍 토양의 특징은?\n\n### 응답:\n" for i in range(args.clients * args.requests)]
+    expected = {prompt: model.generate_batch([prompt], args.max_tokens)[0] for prompt in prompts[:args.clients]}
+
+    print(f"{args.clients} concurrent clients x {args.requests} requests, {args.max_tokens} tokens each, "
+          f"max wait {args.max_wait_ms:g} ms")
+    print(f"  {'batch':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'queue ms':>9} {'compute ms':>11} {'mean batch':>11}")
+    for max_batch_size in args.batch_sizes:
+        scheduler = BatchScheduler(model.generate_batch, max_batch_size=max_batch_size,
+                                   max_wait=args.max_wait_ms / 1000)
+        latencies = []
+        mismatches = []
+        lock = threading.Lock()
+
+        def client(client_id):
+            for i in range(args.requests):
+                prompt = prompts[client_id * args.requests + i]
+                start = time.perf_counter()
+                result = scheduler.generate(prompt, args.max_tokens, 0.0)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+                    if prompt in expected and result.text != expected[prompt]:
+                        mismatches.append(prompt)
+
+        threads = [threading.Thread(target=client, args=(c,)) for c in range(args.clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stats = scheduler.stats()
+        scheduler.close()
+
+        p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+        same = "" if not mismatches else f"  ({len(mismatches)} outputs differ from unbatched)"
+        print(f"  {max_batch_size:>5} {len(latencies) / elapsed:>8.1f} {p50:>8.1f} {p95:>8.1f} "
+              f"{stats['mean_queue_seconds'] * 1000:>9.1f} {stats['mean_compute_seconds'] * 1000:>11.1f} "
+              f"{stats['mean_batch_size']:>11.2f}{same}")
+
+BENCHMARKS = {
+    "address_index": (bench_address_index, [
+        (("--sizes",), {"type": int, "nargs": "+", "default": [20_000, 200_000, 2_000_000]}),
+        (("--repeat",), {"type": int, "default": 100}),
+        (("--skip-scan-above",), {"type": int, "default": 200_000,
+                                  "help": "skip the (slow) row-wise scan above this many rows"}),
+    ]),
+    "pdf_extraction": (bench_pdf_extraction, [
+        (("--pages",), {"type": int, "default": 400}),
+        (("--workers",), {"type": int, "nargs": "+", "default": [2, 4, os.cpu_count() or 1]}),
+    ]),
+    "retrieval": (bench_retrieval, [
+        (("--paragraphs",), {"type": int, "default": 5000}),
+        (("--queries",), {"type": int, "default": 200}),
+    ]),
+    "csv_ingestion": (bench_csv_ingestion, [
+        (("--rows",), {"type": int, "default": 2_000_000}),
+        (("--chunksize",), {"type": int, "default": 100_000}),
+        (("--worker",), {"nargs": 3, "help": argparse.SUPPRESS}),
+    ]),
+    "soil_query": (bench_soil_query, [
+        (("--sizes",), {"type": int, "nargs": "+", "default": [20_000, 200_000, 2_000_000]}),
+        (("--repeat",), {"type": int, "default": 20}),
+    ]),
+    "intent_routing": (bench_intent_routing, [
+        (("--turns",), {"type": int, "default": 2000}),
+    ]),
+    "csv_cache": (bench_csv_cache, [
+        (("--rows",), {"type": int, "nargs": "+", "default": [23_181, 200_000]}),
+        (("--repeat",), {"type": int, "default": 10}),
+    ]),
+    "batching": (bench_batching, [
+        (("--clients",), {"type": int, "default": 16}),
+        (("--requests",), {"type": int, "default": 8}),
+        (("--max-tokens",), {"type": int, "default": 32}),
+        (("--batch-sizes",), {"type": int, "nargs": "+", "default": [1, 4, 8, 16]}),
+        (("--max-wait-ms",), {"type": float, "default": 20.0}),
+        (("--dim",), {"type": int, "default": 512}),
+    ]),
+    "quantization": (bench_quantization, [
+        (("--model",), {"default": "hf-internal-testing/tiny-random-GPTNeoXForCausalLM",
+                        "help": "local directory or Hugging Face repository of a causal LM"}),
+        (("--precisions",), {"nargs": "+", "default": ["float32", "int8"]}),
+        (("--threads",), {"type": int, "nargs": "+", "default": [os.cpu_count() or 1]}),
+        (("--tokens",), {"type": int, "default": 64}),
+        (("--worker",), {"nargs": 4, "help": argparse.SUPPRESS}),
+    ]),
+    "prefix_cache": (bench_prefix_cache, [
+        (("--model",), {"default": "hf-internal-testing/tiny-random-GPTNeoXForCausalLM",
+                        "help": "local directory or Hugging Face repository of a causal LM"}),
+        (("--precision",), {"default": "float32"}),
+        (("--threads",), {"type": int, "default": 0}),
+        (("--rounds",), {"type": int, "default": 3}),
+        (("--tokens",), {"type": int, "default": 4}),
+    ]),
+    "response_cache": (bench_response_cache, [
+        (("--repeat",), {"type": int, "default": 200}),
+    ]),
+    "conversation_memory": (bench_conversation_memory, [
+        (("--turns",), {"type": int, "default": 30}),
+    ]),
+    "dense_retrieval": (bench_dense_retrieval, [
+        (("--sizes",), {"type": int, "nargs": "+", "default": [20000, 200000]}),
+        (("--dim",), {"type": int, "default": 384}),
+        (("--queries",), {"type": int, "default": 50}),
+        (("--nprobe",), {"type": int, "default": 8}),
+    ]),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    for name, (func, arguments) in BENCHMARKS.items():
+        subparser = subparsers.add_parser(name, help=func.__doc__)
+        for flags, options in arguments:
+            subparser.add_argument(*flags, **options)
+        subparser.set_defaults(func=func)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import re
+from typing import NamedTuple, Optional
+
+# Default chunk size and overlap, in (estimated) model tokens
+CHUNK_MAX_TOKENS = 200
+CHUNK_OVERLAP_TOKENS = 40
+
+# Chunks shorter than this carry no useful context (stray headings, page numbers)
+MIN_CHUNK_LENGTH = 20
+
+_PAGE_MARKER_RE = re.compile(r'\n--- Page (\d+) ---\n')
+_PARAGRAPH_RE = re.compile(r'\n\s*\n')
+_SENTENCE_RE = re.compile(r'(?<=[.!?。])\s+')
+_TOKEN_RE = re.compile(r'[가-힣]|[^\s가-힣]+')
+
+
+class Chunk(NamedTuple):
+    """A retrievable piece of the knowledge base."""
+    text: str
+    page: Optional[int]
+    num_tokens: int
+
+def estimate_tokens(text):
+    """
+    Estimate the number of model tokens in a text without loading a tokenizer.
+    Every Hangul syllable and every other whitespace-separated run counts as one token,
+    which slightly overestimates for Korean subword tokenizers.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    return len(_TOKEN_RE.findall(text))
+
+def split_pages(knowledge_base):
+    """
+    Split a knowledge base into the text of each page.
+    Text outside any "--- Page N ---" section (e.g. the appended CSV summary) gets page None.
+
+    Args:
+        knowledge_base (str): Knowledge base text
+
+    Returns:
+        list: (page number or None, text) tuples
+    """
+    parts = _PAGE_MARKER_RE.split(knowledge_base)
+    pages = [(None, parts[0])]
+    for i in range(1, len(parts) - 1, 2):
+        # clean_text leaves at most one blank line inside a page, so a run of three newlines
+        # marks the end of the page section and the start of text appended after the PDF
+        text, _, rest = parts[i + 1].partition('\n\n\n')
+        pages.append((int(parts[i]), text))
+        if rest:
+            pages.append((None, rest))
+    return [(page, text.strip()) for page, text in pages if text.strip()]
+
+def _split_long(text, max_tokens, count_tokens):
+    """Split a single sentence that exceeds the budget, by lines and then by words."""
+    pieces = []
+    for line in text.split('\n'):
+        if count_tokens(line) <= max_tokens:
+            pieces.append(line)
+            continue
+        current = []
+        for word in line.split(' '):
+            if current and count_tokens(' '.join(current + [word])) > max_tokens:
+                pieces.append(' '.join(current))
+                current = []
+            current.append(word)
+        if current:
+            pieces.append(' '.join(current))
+    return [piece for piece in pieces if piece.strip()]
+
+def _sentences(page_text, max_tokens, count_tokens):
+    """Split page text into (sentence, token count, starts_paragraph) units that each fit the budget."""
+    units = []
+    for paragraph in _PARAGRAPH_RE.split(page_text):
+        first = True
+        for sentence in _SENTENCE_RE.split(paragraph.strip()):
+            if not sentence:
+                continue
+            num_tokens = count_tokens(sentence)
+            pieces = [sentence] if num_tokens <= max_tokens else _split_long(sentence, max_tokens, count_tokens)
+            for piece in pieces:
+                units.append((piece, num_tokens if len(pieces) == 1 else count_tokens(piece), first))
+                first = False
+    return units
+
+def chunk_knowledge_base(knowledge_base, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                         count_tokens=estimate_tokens):
+    """
+    Cut the knowledge base into chunks of at most max_tokens tokens.
+    Chunks are built from whole sentences and never span two pages; paragraph breaks inside
+    a chunk are kept. Consecutive chunks of a page share up to overlap_tokens tokens of
+    trailing sentences, so a fact split across a boundary is still retrievable.
+
+    Args:
+        knowledge_base (str): Knowledge base text with "--- Page N ---" markers
+        max_tokens (int): Token budget per chunk
+        overlap_tokens (int): Tokens repeated from the end of the previous chunk
+        count_tokens (callable): Function returning the token count of a text
+
+    Returns:
+        list: Chunk objects in document order
+    """
+    chunks = []
+    for page, page_text in split_pages(knowledge_base):
+        current = []
+        current_tokens = 0
+
+        def flush():
+            text = ''.join(
+                ('\n\n' if starts_paragraph else ' ') + sentence if i else sentence
+                for i, (sentence, _, starts_paragraph) in enumerate(current)
+            )
+            if len(text) >= MIN_CHUNK_LENGTH:
+                chunks.append(Chunk(text, page, current_tokens))
+
+        for unit in _sentences(page_text, max_tokens, count_tokens):
+            if current and current_tokens + unit[1] > max_tokens:
+                flush()
+                # Carry the trailing sentences of the finished chunk over as overlap
+                overlap = []
+                overlap_total = 0
+                for previous in reversed(current):
+                    if overlap_total + previous[1] > overlap_tokens or overlap_total + previous[1] + unit[1] > max_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_total += previous[1]
+                current, current_tokens = overlap, overlap_total
+            current.append(unit)
+            current_tokens += unit[1]
+        if current:
+            flush()
+    return chunks
@@ -0,0 +1,141 @@
+import re
+
+from prompt_builder import estimate_tokens
+
+# Turns kept word for word; older turns are folded into the summary
+DEFAULT_RECENT_TURNS = 3
+
+# Token cap of the whole history block
+DEFAULT_MAX_TOKENS = 400
+
+# Characters of an answer kept in its summary line
+SUMMARY_ANSWER_CHARS = 60
+
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?다요])\s')
+
+
+def summarize_turn(question, answer, max_chars=SUMMARY_ANSWER_CHARS):
+    """
+    Compact a turn into one line: the question and the first sentence of the answer.
+    Extractive, so it costs no model call.
+
+    Args:
+        question (str): User question
+        answer (str): Chatbot answer
+        max_chars (int): Maximum characters kept from the answer
+
+    Returns:
+        str: Summary line
+    """
+    answer = " ".join(answer.split())
+    first = _SENTENCE_END_RE.split(answer, maxsplit=1)[0]
+    if len(first) > max_chars:
+        first = first[:max_chars].rstrip() + "…"
+    return f"- {' '.join(question.split())} → {first}"
+
+class ConversationMemory:
+    """
+    Bounded history of one conversation for the model prompt.
+
+    The last recent_turns turns are kept verbatim; each older turn is compacted into a
+    summary line. The rendered block never exceeds max_tokens: the oldest summary lines
+    go first, then the oldest verbatim turns. Token counts of unchanged lines are
+    remembered between turns.
+    """
+
+    def __init__(self, recent_turns=DEFAULT_RECENT_TURNS, max_tokens=DEFAULT_MAX_TOKENS, count_tokens=estimate_tokens):
+        """
+        Create an empty memory.
+
+        Args:
+            recent_turns (int): Turns kept verbatim
+            max_tokens (int): Token cap of the rendered history
+            count_tokens (callable): text -> number of tokens
+        """
+        self.recent_turns = recent_turns
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self.summary = []
+        self.turns = []
+        self._token_counts = {}
+
+    def __len__(self):
+        return len(self.summary) + len(self.turns)
+
+    def add_turn(self, question, answer):
+        """
+        Record a finished turn, compacting the oldest verbatim turn if there are too many.
+        Summary lines that no longer fit in max_tokens even on their own are forgotten,
+        since render() would always drop them, so the stored history stays bounded.
+
+        Args:
+            question (str): User question
+            answer (str): Chatbot answer
+        """
+        self.turns.append((question, answer))
+        while len(self.turns) > self.recent_turns:
+            self.summary.append(summarize_turn(*self.turns.pop(0)))
+        while self.summary and sum(map(self._tokens, self.summary)) > self.max_tokens:
+            self._token_counts.pop(self.summary.pop(0), None)
+
+    def last_question(self):
+        """The previous user question, or None."""
+        return self.turns[-1][0] if self.turns else None
+
+    def clear(self):
+        """Forget the conversation."""
+        self.summary = []
+        self.turns = []
+        self._token_counts = {}
+
+    def set_counter(self, count_tokens):
+        """Switch to another token counter (e.g. once the real tokenizer is loaded)."""
+        if count_tokens != self.count_tokens:
+            self.count_tokens = count_tokens
+            self._token_counts = {}
+
+    def _tokens(self, line):
+        """Token count of a line, remembered while the line stays in the history."""
+        count = self._token_counts.get(line)
+        if count is None:
+            count = self._token_counts[line] = self.count_tokens(line)
+        return count
+
+    def render(self):
+        """
+        The history as prompt text.
+
+        Returns:
+            str: "이전 대화 요약" and "최근 대화" sections, or "" if there is no history
+        """
+        summary = list(self.summary)
+        turns = [f"사용자: {question}\n챗봇: {answer}\n" for question, answer in self.turns]
+
+        def total():
+            return sum(map(self._tokens, summary)) + sum(map(self._tokens, turns))
+
+        while summary and total() > self.max_tokens:
+            summary.pop(0)
+        while len(turns) > 1 and total() > self.max_tokens:
+            turns.pop(0)
+        if turns and total() > self.max_tokens:
+            # A single long turn: keep the question and as much of the answer as fits
+            question, answer = self.turns[-1]
+            while len(answer) > 1 and total() > self.max_tokens:
+                answer = answer[:len(answer) * 4 // 5]
+                turns = [f"사용자: {question}\n챗봇: {answer}…\n"]
+
+        # Drop counts of lines that left the history
+        live = set(summary) | set(turns)
+        self._token_counts = {line: count for line, count in self._token_counts.items() if line in live}
+
+        text = ""
+        if summary:
+            text += "이전 대화 요약:\n" + "\n".join(summary) + "\n"
+        if turns:
+            text += "최근 대화:\n" + "".join(turns)
+        return text
+
+    def fingerprint(self):
+        """Hashable identity of the current history (for caches keyed on the conversation)."""
+        return hash((tuple(self.summary), tuple(self.turns)))
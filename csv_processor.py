@@ -1,63 +1,461 @@
 import pandas as pd
 import streamlit as st
+import hashlib
 import io
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
 
-def process_csv_data(csv_file):
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # the columnar cache is skipped without pyarrow
+    pa = feather = None
+
+from address_index import AddressIndex, factorize_regions, find_address_column
+
+# Ordinal soil attributes, from lowest to highest. Values outside these lists
+# (e.g. "기타", "Unknown") become missing values when the column is compacted,
+# so comparisons and sorts never rank them above the top level.
+ORDERED_CATEGORIES = {
+    "경사": ["0-2%", "2-7%", "7-15%", "15-30%", "30-60%", "60-100%"],
+    "유효토심": ["매우얕음_0-20cm", "얕음_20-50cm", "보통_50-100cm", "깊음_100cm이상"],
+    "배수등급": ["매우불량", "불량", "약간불량", "약간양호", "양호", "매우양호"],
+}
+
+# Files larger than this are ingested in chunks of CSV_CHUNK_ROWS rows
+CSV_CHUNKED_MIN_BYTES = 64 * 1024 * 1024
+CSV_CHUNK_ROWS = 100_000
+
+# Cleaned tables are cached as uncompressed Feather files, keyed by the source file's SHA-256.
+# Bump CLEANER_VERSION whenever clean_csv_data or the dtype rules change.
+CLEANER_VERSION = "3"
+CSV_CACHE_DIR = os.environ.get("CSV_TABLE_CACHE_DIR", os.path.join(".cache", "csv_table"))
+
+# Text columns with more distinct values than this stop being tracked during the schema scan
+CSV_SCAN_MAX_DISTINCT = 100_000
+
+# Text columns with at most this share of distinct values are stored as categoricals
+CATEGORICAL_MAX_UNIQUE_RATIO = 0.5
+
+# Category dictionaries per dataset (keyed by the source file's SHA-256), so loads and chunks
+# of one table get identical dtypes and concatenate cheaply, while values of one upload never
+# end up in another dataset's dtypes. Only the most recently used datasets are kept.
+CATEGORY_SCOPES = 8
+_category_scopes = OrderedDict()
+_category_lock = threading.Lock()
+
+def get_category_dtype(col, values, digest=None):
+    """
+    Get the categorical dtype of a column, extending its dataset's dictionary with any new values.
+    
+    Args:
+        col (str): Column name
+        values (iterable): Distinct values that must be representable
+        digest (str, optional): SHA-256 of the dataset; tables with the same digest share dtypes.
+            Without one the dtype holds just the ordinal categories and these values.
+        
+    Returns:
+        pandas.CategoricalDtype: Dtype whose categories include every value seen for the dataset
+            (for ordinal columns, exactly the levels of ORDERED_CATEGORIES)
+    """
+    with _category_lock:
+        if digest is None:
+            categories, dtypes = {}, {}
+        else:
+            scope = _category_scopes.get(digest)
+            if scope is None:
+                scope = _category_scopes[digest] = ({}, {})
+                while len(_category_scopes) > CATEGORY_SCOPES:
+                    _category_scopes.popitem(last=False)
+            _category_scopes.move_to_end(digest)
+            categories, dtypes = scope
+        
+        known = categories.setdefault(col, list(ORDERED_CATEGORIES.get(col, [])))
+        if col not in ORDERED_CATEGORIES:
+            new_values = sorted(set(str(value) for value in values) - set(known))
+            known.extend(new_values)
+        
+        key = (col, len(known))
+        if key not in dtypes:
+            dtypes[key] = pd.CategoricalDtype(list(known), ordered=col in ORDERED_CATEGORIES)
+        return dtypes[key]
+
+def compact_dataframe(df, digest=None):
+    """
+    Convert low-cardinality text columns to categoricals in place.
+    Ordinal columns (경사, 유효토심, 배수등급) become ordered categoricals; their values
+    outside the ordinal levels become missing.
+    
+    Args:
+        df (pandas.DataFrame): Cleaned dataframe
+        digest (str, optional): SHA-256 of the source file, scoping the shared categories
+        
+    Returns:
+        dict: Memory report with "before" and "after" sizes in bytes, overall and per column
+    """
+    report = {"columns": {}}
+    before_total = int(df.memory_usage(deep=True, index=False).sum())
+    
+    for col in df.columns:
+        if not (pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col])):
+            continue
+        num_unique = df[col].nunique()
+        if col not in ORDERED_CATEGORIES and num_unique > CATEGORICAL_MAX_UNIQUE_RATIO * len(df):
+            continue
+        
+        before = int(df[col].memory_usage(deep=True, index=False))
+        df[col] = df[col].astype(str).astype(get_category_dtype(col, df[col].unique(), digest))
+        report["columns"][col] = {"before": before, "after": int(df[col].memory_usage(deep=True, index=False))}
+    
+    report["before"] = before_total
+    report["after"] = int(df.memory_usage(deep=True, index=False).sum())
+    return report
+
+def _table_cache_path(digest, compact):
+    suffix = "" if compact else "-raw"
+    return os.path.join(CSV_CACHE_DIR, f"{digest}-v{CLEANER_VERSION}{suffix}.feather")
+
+def load_cached_table(digest, compact=True):
+    """
+    Load a cleaned table saved by save_cached_table.
+    The file is memory-mapped, and numeric columns and categorical codes are handed to pandas
+    without copying, so processes loading the same file share those pages through the OS cache.
+    
+    Args:
+        digest (str): SHA-256 of the source CSV
+        compact (bool): Whether the table was cleaned with compact=True
+        
+    Returns:
+        pandas.DataFrame or None: The cleaned table, or None if it is not cached
+    """
+    path = _table_cache_path(digest, compact)
+    if feather is None or not os.path.exists(path):
+        return None
+    
+    table = feather.read_table(path, memory_map=True)
+    df = table.to_pandas(split_blocks=True)
+    
+    # Re-register the categories so every load of this file shares the same dtypes
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            dtype = get_category_dtype(col, df[col].cat.categories, digest)
+            if not df[col].dtype == dtype:
+                df[col] = df[col].cat.set_categories(dtype.categories, ordered=dtype.ordered)
+    
+    metadata = table.schema.metadata or {}
+    if b"memory_report" in metadata:
+        df.attrs["memory_report"] = json.loads(metadata[b"memory_report"])
+    return df
+
+def save_cached_table(df, digest, compact=True):
+    """
+    Save a cleaned table as an uncompressed Feather file so later starts can memory-map it.
+    The file is written under a temporary name and renamed, so readers never see a partial file.
+    
+    Args:
+        df (pandas.DataFrame): Cleaned table
+        digest (str): SHA-256 of the source CSV
+        compact (bool): Whether the table was cleaned with compact=True
+        
+    Returns:
+        bool: True if the table was saved
+    """
+    if feather is None:
+        return False
+    path = _table_cache_path(digest, compact)
+    os.makedirs(CSV_CACHE_DIR, exist_ok=True)
+    
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if "memory_report" in df.attrs:
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"memory_report"] = json.dumps(df.attrs["memory_report"]).encode("utf-8")
+        table = table.replace_schema_metadata(metadata)
+    
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
+
+def process_csv_data(csv_file, compact=True, chunksize=None, digest=None):
     """
     Process CSV data containing soil characteristics by address.
     
     Args:
-        csv_file: Uploaded CSV file object
+        csv_file: Uploaded CSV file object or path
+        compact (bool): Store low-cardinality columns as categoricals.
+            The memory report is kept in df.attrs["memory_report"].
+        chunksize (int, optional): Rows per chunk for bounded-memory ingestion
+            (see ingest_csv_chunked). By default files larger than CSV_CHUNKED_MIN_BYTES
+            are read in chunks of CSV_CHUNK_ROWS rows.
+        digest (str, optional): SHA-256 of the file. If given, the cleaned table is loaded
+            from (or saved to) the columnar cache instead of parsing the CSV again,
+            and is kept in df.attrs["digest"] (see dataframe_digest).
         
     Returns:
         pandas.DataFrame: Processed CSV data
     """
     try:
-        # Read CSV file
-        df = pd.read_csv(csv_file)
+        if digest:
+            df = load_cached_table(digest, compact)
+            if df is not None:
+                df.attrs["digest"] = digest
+                return df
         
-        # Basic data cleaning
-        df = clean_csv_data(df)
+        if chunksize is None and _source_size(csv_file) > CSV_CHUNKED_MIN_BYTES:
+            chunksize = CSV_CHUNK_ROWS
+        if chunksize:
+            df = ingest_csv_chunked(csv_file, chunksize=chunksize, compact=compact, digest=digest)
+        else:
+            # Read CSV file
+            df = pd.read_csv(csv_file)
+            
+            # Basic data cleaning (df was just read, so it can be cleaned in place)
+            df = clean_csv_data(df, copy=False)
+            
+            # Categorical columns
+            if compact:
+                df.attrs["memory_report"] = compact_dataframe(df, digest)
         
+        if digest:
+            try:
+                save_cached_table(df, digest, compact)
+            except (OSError, pa.ArrowException) as e:
+                st.warning(f"Could not cache the processed CSV: {str(e)}")
+            df.attrs["digest"] = digest
         return df
     except Exception as e:
         st.error(f"Error processing CSV file: {str(e)}")
         return None
 
-def clean_csv_data(df):
+def dataframe_digest(df):
+    """
+    Identity of a table's contents: the SHA-256 of its source file when process_csv_data
+    was given one, otherwise a hash of the values (computed once and kept in df.attrs).
+    
+    Args:
+        df (pandas.DataFrame): The CSV data
+        
+    Returns:
+        str: Hex digest
+    """
+    digest = df.attrs.get("digest")
+    if digest is None:
+        sha256 = hashlib.sha256("\0".join(map(str, df.columns)).encode("utf-8"))
+        sha256.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        digest = df.attrs["digest"] = sha256.hexdigest()
+    return digest
+
+def normalize_column_name(col):
+    """Lowercase a column name and replace spaces with underscores."""
+    return col.lower().replace(' ', '_')
+
+def clean_csv_data(df, copy=True, fill_values=None):
     """
     Clean the CSV data.
     
     Args:
         df (pandas.DataFrame): Original dataframe
+        copy (bool): Clean a copy and leave df untouched; pass False to clean df itself
+        fill_values (dict, optional): Value used for the missing entries of each column.
+            By default numeric columns use their median and other columns "Unknown".
         
     Returns:
         pandas.DataFrame: Cleaned dataframe
     """
     # Make a copy to avoid modifying the original
-    cleaned_df = df.copy()
+    cleaned_df = df.copy() if copy else df
     
     # Convert column names to lowercase and replace spaces with underscores
-    cleaned_df.columns = [col.lower().replace(' ', '_') for col in cleaned_df.columns]
+    cleaned_df.columns = [normalize_column_name(col) for col in cleaned_df.columns]
     
     # Handle missing values
     for col in cleaned_df.columns:
+        # Ordinal categoricals leave unknown values missing (see ORDERED_CATEGORIES)
+        if isinstance(cleaned_df[col].dtype, pd.CategoricalDtype) and cleaned_df[col].dtype.ordered:
+            continue
+        if fill_values is not None and col in fill_values:
+            fill_value = fill_values[col]
         # For numeric columns, fill NaN with median
-        if pd.api.types.is_numeric_dtype(cleaned_df[col]):
-            cleaned_df[col] = cleaned_df[col].fillna(cleaned_df[col].median())
+        elif pd.api.types.is_numeric_dtype(cleaned_df[col]):
+            fill_value = cleaned_df[col].median()
         # For string columns, fill NaN with "Unknown"
         else:
-            cleaned_df[col] = cleaned_df[col].fillna("Unknown")
+            fill_value = "Unknown"
+        if cleaned_df[col].hasnans:
+            cleaned_df[col] = cleaned_df[col].fillna(fill_value)
     
     return cleaned_df
 
-def get_soil_data_by_address(df, address_query):
+def _source_size(csv_file):
+    """Size in bytes of a CSV path or uploaded file, or 0 if unknown."""
+    if isinstance(csv_file, (str, os.PathLike)):
+        return os.path.getsize(csv_file)
+    return getattr(csv_file, "size", 0) or 0
+
+def _rewind(csv_file):
+    """Move a file object back to the start so it can be read again."""
+    if hasattr(csv_file, "seek"):
+        csv_file.seek(0)
+
+def scan_csv_schema(csv_file, chunksize=CSV_CHUNK_ROWS, digest=None):
+    """
+    First pass of chunked ingestion: work out column types and fill values without
+    holding the table in memory. Only numeric columns' values are kept (as float64, for
+    the exact median); text columns keep their distinct values, up to CSV_SCAN_MAX_DISTINCT,
+    to decide which become categoricals.
+    
+    Args:
+        csv_file: CSV path or file object
+        chunksize (int): Rows per chunk
+        digest (str, optional): SHA-256 of the file, scoping the shared categories
+        
+    Returns:
+        dict: {"dtypes": read_csv dtypes by original column name,
+               "fill_values": fill value by cleaned column name,
+               "rows": number of rows}
+    """
+    numeric_values = {}
+    distinct = {}
+    non_numeric = set()
+    num_rows = 0
+    columns = None
+    
+    _rewind(csv_file)
+    for chunk in pd.read_csv(csv_file, chunksize=chunksize):
+        columns = list(chunk.columns)
+        num_rows += len(chunk)
+        for col in columns:
+            values = chunk[col]
+            if col not in non_numeric and pd.api.types.is_numeric_dtype(values):
+                numeric_values.setdefault(col, []).append(values.dropna().to_numpy(dtype=np.float64))
+                continue
+            
+            # A column is numeric only if every chunk parsed as numeric. The text form of
+            # numbers seen in earlier chunks is gone, so such a column stays plain text
+            non_numeric.add(col)
+            earlier = numeric_values.pop(col, None)
+            if earlier and any(len(part) for part in earlier):
+                distinct[col] = None
+            if distinct.get(col, set()) is not None:
+                seen = distinct.setdefault(col, set())
+                seen.update(values.dropna().astype(str).unique())
+                if col not in ORDERED_CATEGORIES and len(seen) > CSV_SCAN_MAX_DISTINCT:
+                    distinct[col] = None
+    _rewind(csv_file)
+    
+    dtypes = {}
+    fill_values = {}
+    for col in columns or []:
+        cleaned = normalize_column_name(col)
+        if col in numeric_values:
+            dtypes[col] = np.float64
+            values = np.concatenate(numeric_values[col]) if numeric_values[col] else np.empty(0)
+            fill_values[cleaned] = float(np.median(values)) if len(values) else np.nan
+        elif distinct.get(col) is not None and (
+            col in ORDERED_CATEGORIES or len(distinct[col]) <= CATEGORICAL_MAX_UNIQUE_RATIO * num_rows
+        ):
+            # The fill value is always a category, whether or not the scan saw missing values
+            dtypes[col] = get_category_dtype(cleaned, distinct[col] | {"Unknown"}, digest)
+            fill_values[cleaned] = "Unknown"
+        else:
+            dtypes[col] = object
+            fill_values[cleaned] = "Unknown"
+    return {"dtypes": dtypes, "fill_values": fill_values, "rows": num_rows}
+
+class CsvChunkStore:
+    """
+    Cleaned CSV chunks on disk, for tables too large to hold in memory.
+    Chunks are pickled DataFrames (categorical dtypes survive), listed in manifest.json.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as file:
+            manifest = json.load(file)
+        self.chunk_files = manifest["chunks"]
+        self.columns = manifest["columns"]
+        self.num_rows = manifest["rows"]
+    
+    def iter_chunks(self):
+        """Yield the stored chunks one at a time."""
+        for name in self.chunk_files:
+            yield pd.read_pickle(os.path.join(self.path, name))
+    
+    def to_dataframe(self):
+        """Load the whole table (the shared categorical dtypes make the concat cheap)."""
+        return pd.concat(self.iter_chunks(), ignore_index=True)
+
+def ingest_csv_chunked(csv_file, chunksize=CSV_CHUNK_ROWS, compact=True, output_dir=None, profile=None, digest=None):
+    """
+    Load a large soil CSV with bounded memory.
+    A first pass (scan_csv_schema) fixes the dtypes and the fill values; the second pass
+    reads chunks with those explicit dtypes, so low-cardinality columns arrive as categoricals
+    directly, and fills missing values chunk by chunk without copying the table.
+    
+    Args:
+        csv_file: CSV path or file object
+        chunksize (int): Rows per chunk
+        compact (bool): Read low-cardinality columns as categoricals
+        output_dir (str, optional): Write cleaned chunks to a CsvChunkStore here instead of
+            building one in-memory DataFrame
+        profile (DatasetProfile, optional): Profile to update with every chunk
+        digest (str, optional): SHA-256 of the file, scoping the shared categories
+        
+    Returns:
+        pandas.DataFrame or CsvChunkStore: The cleaned table
+    """
+    schema = scan_csv_schema(csv_file, chunksize, digest)
+    dtypes = schema["dtypes"]
+    if not compact:
+        dtypes = {col: (object if isinstance(dtype, pd.CategoricalDtype) else dtype) for col, dtype in dtypes.items()}
+    
+    chunks = []
+    chunk_files = []
+    columns = None
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    for i, chunk in enumerate(pd.read_csv(csv_file, chunksize=chunksize, dtype=dtypes)):
+        chunk = clean_csv_data(chunk, copy=False, fill_values=schema["fill_values"])
+        columns = list(chunk.columns)
+        if profile is not None:
+            profile.update(chunk)
+        if output_dir:
+            name = f"chunk_{i:05d}.pkl"
+            chunk.to_pickle(os.path.join(output_dir, name))
+            chunk_files.append(name)
+        else:
+            chunks.append(chunk)
+    _rewind(csv_file)
+    
+    if output_dir:
+        with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as file:
+            json.dump({"chunks": chunk_files, "columns": columns, "rows": schema["rows"]}, file, ensure_ascii=False)
+        return CsvChunkStore(output_dir)
+    
+    if not chunks:
+        return pd.DataFrame(columns=[normalize_column_name(col) for col in dtypes])
+    df = pd.concat(chunks, ignore_index=True, copy=False) if len(chunks) > 1 else chunks[0]
+    df.attrs["ingest_report"] = {"chunks": len(chunks), "rows": schema["rows"]}
+    return df
+
+def get_soil_data_by_address(df, address_query, address_index=None):
     """
     Search for soil data by address in the CSV data.
     
     Args:
         df (pandas.DataFrame): The CSV data
         address_query (str): Address query string
+        address_index (AddressIndex, optional): Prebuilt index over df's address column.
+            Building one is O(rows), so callers that search repeatedly should keep it.
         
     Returns:
         pandas.DataFrame: Filtered dataframe containing matching rows
@@ -65,59 +463,221 @@ def get_soil_data_by_address(df, address_query):
     if df is None:
         return None
     
-    # Identify address columns
-    address_cols = [col for col in df.columns if 
-                    any(term in col for term in ['address', 'location', 'site', 'place'])]
+    # Use the address index when the data has an address column
+    if address_index is None:
+        address_index = AddressIndex.from_dataframe(df)
+    if address_index is not None:
+        return df.iloc[address_index.search(address_query)]
     
-    # If no specific address columns found, search all string columns
-    if not address_cols:
-        address_cols = [col for col in df.columns if pd.api.types.is_string_dtype(df[col])]
+    # Otherwise search all string and categorical columns
+    address_cols = [col for col in df.columns
+                    if pd.api.types.is_string_dtype(df[col]) or isinstance(df[col].dtype, pd.CategoricalDtype)]
     
     # Create a mask for matching rows
     mask = pd.Series(False, index=df.index)
     
     # Search for the address query in each address column
     for col in address_cols:
-        mask = mask | df[col].astype(str).str.contains(address_query, case=False, na=False)
+        mask = mask | df[col].astype(str).str.contains(address_query, case=False, na=False, regex=False)
     
     # Return the filtered dataframe
     return df[mask]
 
-def summarize_csv_data(df):
+def format_csv_knowledge(df):
+    """
+    Format the short CSV summary that is appended to the chatbot knowledge base.
+    
+    Args:
+        df (pandas.DataFrame): The CSV data
+        
+    Returns:
+        str: Summary text, starting with a blank line so it can follow the PDF text
+    """
+    if df is None:
+        return ""
+    
+    csv_summary = f"CSV 데이터 요약:\n총 레코드: {len(df)}\n컬럼: {', '.join(df.columns)}\n"
+    csv_sample = df.head(5).to_string()
+    return "\n\n" + csv_summary + csv_sample
+
+def describe_soil_types(df, max_regions=3):
+    """
+    Describe each distinct combination of soil attributes in one sentence, for retrieval.
+    Rows repeat the same few hundred combinations, so this embeds far fewer texts than one
+    per row; each description names how many parcels have it and the 읍/면 where it is most common.
+
+    Args:
+        df (pandas.DataFrame): The CSV data
+        max_regions (int): Number of 읍/면 named per description
+
+    Returns:
+        list: Description strings, most common combination first
+    """
+    if df is None or len(df) == 0:
+        return []
+
+    address_col = find_address_column(df)
+    columns = [col for col in df.columns if col != address_col and not pd.api.types.is_numeric_dtype(df[col])]
+    if not columns:
+        return []
+    # Missing values (unknown ordinal levels) are left out of the descriptions
+    keys = df[columns].astype(str).where(df[columns].notna(), "")
+    if address_col is not None:
+        codes, parsed = factorize_regions(df[address_col].to_numpy())
+        keys["_region"] = np.array([parts["eupmyeon"] for parts in parsed], dtype=object)[codes]
+        counts = keys.groupby(columns + ["_region"], sort=False).size()
+    else:
+        counts = keys.groupby(columns, sort=False).size()
+
+    descriptions = []
+    groups = counts.groupby(level=list(range(len(columns))), sort=False) if address_col is not None else counts.items()
+    for key, group in groups:
+        values = key if isinstance(key, tuple) else (key,)
+        if address_col is not None:
+            total = int(group.sum())
+            top = group.sort_values(ascending=False, kind="stable").head(max_regions)
+            regions = [name[-1] for name in top.index if name[-1]]
+        else:
+            total, regions = int(group), []
+        attributes = ", ".join(f"{col} {value}" for col, value in zip(columns, values) if value)
+        text = f"{attributes} (필지 {total:,}개"
+        text += f"; 주로 {', '.join(regions)})" if regions else ")"
+        descriptions.append((total, text))
+    descriptions.sort(key=lambda item: -item[0])
+    return [text for _, text in descriptions]
+
+class DatasetProfile:
+    """
+    Statistics of a soil dataframe, computed once at load time and reused by every query.
+    
+    Holds per-column frequency tables for non-numeric columns, count/sum/min/max for numeric
+    columns, and frequency tables per 읍/면 parsed from the address column. Profiles are
+    additive: update() folds in more rows without revisiting the rows already counted.
+    """
+    
+    def __init__(self):
+        self.num_rows = 0
+        self.columns = []
+        self.frequencies = {}
+        self.numeric = {}
+        self.region_column = None
+        self.region_frequencies = {}
+    
+    @classmethod
+    def from_dataframe(cls, df):
+        """
+        Build a profile of a dataframe.
+        
+        Args:
+            df (pandas.DataFrame): The CSV data
+            
+        Returns:
+            DatasetProfile: Profile of df
+        """
+        profile = cls()
+        profile.update(df)
+        return profile
+    
+    def update(self, df):
+        """
+        Add the statistics of more rows (e.g. another chunk or file with the same columns).
+        
+        Args:
+            df (pandas.DataFrame): Rows to add
+        """
+        if df is None or len(df) == 0:
+            return
+        
+        for col in df.columns:
+            if col not in self.columns:
+                self.columns.append(col)
+        self.num_rows += len(df)
+        
+        for col in df.columns:
+            if pd.api.types.is_numeric_dtype(df[col]):
+                values = df[col].dropna()
+                if len(values) == 0:
+                    continue
+                stats = self.numeric.setdefault(col, {"count": 0, "sum": 0.0, "min": values.min(), "max": values.max()})
+                stats["count"] += len(values)
+                stats["sum"] += float(values.sum())
+                stats["min"] = min(stats["min"], values.min())
+                stats["max"] = max(stats["max"], values.max())
+            else:
+                counts = df[col].value_counts(sort=False)
+                self.frequencies.setdefault(col, Counter()).update(counts[counts > 0].to_dict())
+        
+        # Per-읍/면 breakdowns, parsing each distinct region once
+        address_col = find_address_column(df)
+        if address_col is None:
+            return
+        self.region_column = address_col
+        codes, parsed = factorize_regions(df[address_col].to_numpy())
+        regions = np.array([parts["eupmyeon"] for parts in parsed], dtype=object)[codes]
+        for region, group in df.groupby(regions, sort=False):
+            region_counts = self.region_frequencies.setdefault(region, {"rows": 0})
+            region_counts["rows"] += len(group)
+            for col in group.columns:
+                if col != address_col and not pd.api.types.is_numeric_dtype(group[col]):
+                    counts = group[col].value_counts(sort=False)
+                    region_counts.setdefault(col, Counter()).update(counts[counts > 0].to_dict())
+    
+    def top_values(self, col, n=5, region=None):
+        """
+        Most frequent values of a non-numeric column.
+        
+        Args:
+            col (str): Column name
+            n (int): Number of values
+            region (str, optional): Restrict to one 읍/면 (e.g. "삼례읍")
+            
+        Returns:
+            list: (value, count) tuples, most frequent first
+        """
+        frequencies = self.frequencies if region is None else self.region_frequencies.get(region, {})
+        return frequencies.get(col, Counter()).most_common(n)
+    
+    def mean(self, col):
+        """Mean of a numeric column."""
+        stats = self.numeric[col]
+        return stats["sum"] / stats["count"]
+
+def summarize_csv_data(df, profile=None):
     """
     Generate a summary of the CSV data.
     
     Args:
         df (pandas.DataFrame): The CSV data
+        profile (DatasetProfile, optional): Precomputed profile of df; built on the fly if omitted
         
     Returns:
         str: Text summary of the CSV data
     """
     if df is None:
         return "No CSV data available."
+    if profile is None:
+        profile = DatasetProfile.from_dataframe(df)
     
     # Create a summary text
     summary = f"CSV Data Summary:\n"
-    summary += f"Total records: {len(df)}\n"
-    summary += f"Columns: {', '.join(df.columns)}\n\n"
+    summary += f"Total records: {profile.num_rows}\n"
+    summary += f"Columns: {', '.join(profile.columns)}\n\n"
     
     # Add basic statistics for numeric columns
-    numeric_cols = df.select_dtypes(include=['number']).columns
-    if len(numeric_cols) > 0:
+    if profile.numeric:
         summary += "Numeric Column Statistics:\n"
-        for col in numeric_cols:
+        for col, stats in profile.numeric.items():
             summary += f"  {col}:\n"
-            summary += f"    Mean: {df[col].mean():.2f}\n"
-            summary += f"    Min: {df[col].min():.2f}\n"
-            summary += f"    Max: {df[col].max():.2f}\n"
+            summary += f"    Mean: {profile.mean(col):.2f}\n"
+            summary += f"    Min: {stats['min']:.2f}\n"
+            summary += f"    Max: {stats['max']:.2f}\n"
     
     # Add value counts for categorical columns (top 5 values)
-    categorical_cols = df.select_dtypes(include=['object']).columns
-    if len(categorical_cols) > 0:
+    if profile.frequencies:
         summary += "\nCategorical Column Top Values:\n"
-        for col in categorical_cols:
+        for col in profile.frequencies:
             summary += f"  {col}:\n"
-            for value, count in df[col].value_counts().head(5).items():
+            for value, count in profile.top_values(col, 5):
                 summary += f"    {value}: {count}\n"
     
     return summary
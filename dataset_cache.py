@@ -0,0 +1,252 @@
+import hashlib
+import os
+import sys
+import threading
+from dataclasses import dataclass, field
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from pdf_processor import extract_text_from_pdf
+from csv_processor import process_csv_data, format_csv_knowledge, DatasetProfile
+from address_index import AddressIndex
+from region_index import RegionIndex
+from soil_query import SoilQueryEngine
+
+# Candidate locations of the preloaded files, in order of preference
+PRELOADED_PDF_PATHS = ["attached_assets/KSIC_9rd_handbook.pdf", "data/KSIC_9rd_handbook.pdf"]
+PRELOADED_CSV_PATHS = ["data/chatbot_wanju_reduced.csv", "chatbot_wanju_reduced.csv"]
+
+# (path, mtime_ns, size) -> sha256, so unchanged files are not re-hashed on every rerun
+_digest_cache = {}
+_digest_lock = threading.Lock()
+
+
+def file_digest(path):
+    """
+    Compute the SHA-256 of a file, reusing the previous result while its mtime and size are unchanged.
+
+    Args:
+        path (str): Path to the file
+
+    Returns:
+        str: Hex digest of the file contents
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _digest_lock:
+        if key in _digest_cache:
+            return _digest_cache[key]
+
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(block)
+    digest = sha256.hexdigest()
+
+    with _digest_lock:
+        # Drop digests of older versions of the same file
+        for stale in [k for k in _digest_cache if k[0] == key[0]]:
+            del _digest_cache[stale]
+        _digest_cache[key] = digest
+    return digest
+
+def first_existing_path(paths):
+    """
+    Return the first path in the list that exists.
+
+    Args:
+        paths (list): Candidate paths
+
+    Returns:
+        str or None: The first existing path, or None
+    """
+    for path in paths:
+        if os.path.exists(path):
+            return path
+    return None
+
+def object_memory_bytes(obj, seen=None):
+    """
+    Estimate the memory held by a cached object, following its attributes and contents.
+
+    Args:
+        obj: DataFrame, array, string, container or index object
+        seen (set, optional): ids of objects already counted; pass the same set across
+            calls so objects shared between them (e.g. an index kept by another) count once
+
+    Returns:
+        int: Size in bytes
+    """
+    if seen is None:
+        seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if item is None or id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, pd.DataFrame):
+            total += int(item.memory_usage(deep=True).sum())
+            # deep=True already counted the strings of object columns
+            for name in item.columns[item.dtypes == object]:
+                seen.update(map(id, item[name].to_numpy()))
+        elif isinstance(item, pd.Series):
+            total += int(item.memory_usage(deep=True))
+        elif isinstance(item, np.ndarray):
+            total += sys.getsizeof(item) if item.base is None else item.nbytes
+            if item.dtype == object:
+                stack.extend(item.ravel())
+        elif isinstance(item, (str, bytes, int, float, bool)):
+            total += sys.getsizeof(item)
+        elif isinstance(item, dict):
+            total += sys.getsizeof(item)
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            total += sys.getsizeof(item)
+            stack.extend(item)
+        else:
+            total += sys.getsizeof(item)
+            if hasattr(item, "__dict__"):
+                stack.append(item.__dict__)
+            for name in getattr(type(item), "__slots__", ()):
+                stack.append(getattr(item, name, None))
+    return total
+
+def freeze_dataframe(df):
+    """
+    Rebuild a dataframe on read-only arrays, so in-place writes raise instead of
+    silently changing the data other sessions see.
+
+    Args:
+        df (pandas.DataFrame): The dataframe to share; it must not be used afterwards
+
+    Returns:
+        pandas.DataFrame: The same data and attrs, backed by non-writeable arrays
+    """
+    columns = {}
+    for name in df.columns:
+        values = df[name].array
+        if isinstance(values, pd.Categorical):
+            # codes is already a read-only view of the category codes
+            values = pd.Categorical.from_codes(values.codes, dtype=values.dtype)
+        elif isinstance(df[name].dtype, np.dtype):
+            values = df[name].to_numpy(copy=False)
+            values.flags.writeable = False
+        columns[name] = values
+    frozen = pd.DataFrame(columns, index=df.index, copy=False)
+    frozen.attrs.update(df.attrs)
+    return frozen
+
+@dataclass(frozen=True)
+class SharedDataset:
+    """
+    Preloaded soil data shared by every session of the server process.
+
+    The same instance is handed to all sessions, so its contents must be treated as
+    read-only: sessions may rebind their own session_state entries, but must never
+    modify csv_data in place (its arrays are non-writeable, so such writes raise).
+    """
+    pdf_path: str = None
+    pdf_digest: str = None
+    pdf_content: str = ""
+    csv_path: str = None
+    csv_digest: str = None
+    csv_data: pd.DataFrame = None
+    csv_summary: str = ""
+    address_index: AddressIndex = None
+    profile: DatasetProfile = None
+    region_index: RegionIndex = None
+    query_engine: SoilQueryEngine = None
+    errors: tuple = field(default_factory=tuple)
+
+    @property
+    def knowledge_base(self):
+        """Knowledge base text built from the preloaded PDF and CSV."""
+        return self.pdf_content + self.csv_summary
+
+    @cached_property
+    def _memory_sizes(self):
+        # Indexes keep references to the dataframe and to each other; count shared objects once
+        seen = set()
+        return {
+            name: object_memory_bytes(getattr(self, name), seen)
+            for name in ("pdf_content", "csv_data", "csv_summary", "address_index",
+                         "profile", "region_index", "query_engine")
+        }
+
+    def memory_report(self):
+        """
+        Report the memory held by each cached object. Computed once, as the dataset never changes.
+
+        Returns:
+            dict: Object name -> size in bytes
+        """
+        return dict(self._memory_sizes)
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def _load_shared_dataset(pdf_path, pdf_digest, csv_path, csv_digest):
+    """
+    Parse the preloaded files. Cached per process; the digests are part of the cache key,
+    so a changed file produces a new entry instead of serving stale data.
+    """
+    pdf_content = ""
+    if pdf_path:
+        pdf_content = extract_text_from_pdf(pdf_path, workers=None)
+
+    csv_data = None
+    csv_summary = ""
+    address_index = None
+    profile = None
+    region_index = None
+    query_engine = None
+    errors = []
+    if csv_path:
+        try:
+            csv_data = process_csv_data(csv_path, digest=csv_digest)
+            if csv_data is not None:
+                csv_data = freeze_dataframe(csv_data)
+                csv_summary = format_csv_knowledge(csv_data)
+                address_index = AddressIndex.from_dataframe(csv_data)
+                profile = DatasetProfile.from_dataframe(csv_data)
+                region_index = RegionIndex.from_dataframe(csv_data)
+                query_engine = SoilQueryEngine.from_dataframe(csv_data, region_index)
+        except Exception as e:
+            errors.append(f"CSV 파일 처리 오류: {str(e)}")
+
+    return SharedDataset(
+        pdf_path=pdf_path,
+        pdf_digest=pdf_digest,
+        pdf_content=pdf_content,
+        csv_path=csv_path,
+        csv_digest=csv_digest,
+        csv_data=csv_data,
+        csv_summary=csv_summary,
+        address_index=address_index,
+        profile=profile,
+        region_index=region_index,
+        query_engine=query_engine,
+        errors=tuple(errors),
+    )
+
+def get_shared_dataset(pdf_paths=PRELOADED_PDF_PATHS, csv_paths=PRELOADED_CSV_PATHS):
+    """
+    Get the preloaded dataset, parsing the files only if no session has done so yet
+    or if a file's contents changed since.
+
+    Args:
+        pdf_paths (list): Candidate locations of the soil survey PDF
+        csv_paths (list): Candidate locations of the soil CSV
+
+    Returns:
+        SharedDataset: The shared, read-only dataset
+    """
+    pdf_path = first_existing_path(pdf_paths)
+    csv_path = first_existing_path(csv_paths)
+    pdf_digest = file_digest(pdf_path) if pdf_path else None
+    csv_digest = file_digest(csv_path) if csv_path else None
+    return _load_shared_dataset(pdf_path, pdf_digest, csv_path, csv_digest)
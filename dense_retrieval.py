@@ -0,0 +1,457 @@
+import hashlib
+import os
+import shutil
+import threading
+
+import numpy as np
+
+# Small multilingual sentence-embedding model that runs on CPU (384 dimensions)
+DEFAULT_EMBEDDING_MODEL = "intfloat/multilingual-e5-small"
+
+# Texts encoded per forward pass
+EMBEDDING_BATCH_SIZE = 32
+
+# Longest text the encoder reads, in tokens (chunks are ~200 estimated tokens)
+EMBEDDING_MAX_LENGTH = 512
+
+# Stored precisions of the document vectors
+VECTOR_DTYPES = ("float16", "int8")
+
+# Persisted indexes, one directory per document set, encoder and precision
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", os.path.join(".cache", "embeddings"))
+
+# Below this many vectors a full scan is as fast as probing an inverted file
+IVF_MIN_VECTORS = 2048
+
+# Training rows per inverted file list for k-means (the rest are only assigned)
+KMEANS_SAMPLE_PER_LIST = 32
+
+# Inverted file lists searched per query
+DEFAULT_NPROBE = 8
+
+# Rows scored per block when scanning the memory-mapped matrix
+SCAN_BLOCK_ROWS = 65536
+
+# Reciprocal rank fusion constant (larger values flatten the rank weights)
+RRF_K = 60
+
+# Candidates taken from each ranking before fusion
+FUSION_CANDIDATES = 20
+
+# Bump when the on-disk layout changes, so older indexes are rebuilt
+INDEX_VERSION = 1
+
+
+class TransformerEncoder:
+    """
+    Sentence encoder: mean-pooled, L2-normalized hidden states of a transformers model.
+
+    Texts are sorted by length before batching so each batch pads to similar lengths.
+    Requires torch and transformers; the model is downloaded on first use.
+    """
+
+    def __init__(self, model_name=DEFAULT_EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE,
+                 max_length=EMBEDDING_MAX_LENGTH, threads=0, query_prefix=None, passage_prefix=None):
+        """
+        Load the encoder.
+
+        Args:
+            model_name (str): Local directory or Hugging Face repository of the model
+            batch_size (int): Texts encoded per forward pass
+            max_length (int): Tokens read per text
+            threads (int): CPU threads (0 keeps the torch default)
+            query_prefix (str, optional): Prepended to queries; E5 models expect "query: "
+            passage_prefix (str, optional): Prepended to documents; E5 models expect "passage: "
+        """
+        from transformers import AutoModel, AutoTokenizer
+        import torch
+
+        if threads:
+            torch.set_num_threads(threads)
+        is_e5 = "e5" in model_name.lower()
+        self.name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.query_prefix = query_prefix if query_prefix is not None else ("query: " if is_e5 else "")
+        self.passage_prefix = passage_prefix if passage_prefix is not None else ("passage: " if is_e5 else "")
+        self._torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).eval()
+        self.dim = self.model.config.hidden_size
+
+    def encode(self, texts, kind="passage"):
+        """
+        Embed texts.
+
+        Args:
+            texts (list): Strings to embed
+            kind (str): "query" or "passage", selecting the prefix
+
+        Returns:
+            numpy.ndarray: float32 matrix of unit-length rows, one per text
+        """
+        torch = self._torch
+        prefix = self.query_prefix if kind == "query" else self.passage_prefix
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        with torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                encoded = self.tokenizer([prefix + texts[i] for i in batch], padding=True, truncation=True,
+                                         max_length=self.max_length, return_tensors="pt")
+                hidden = self.model(**encoded).last_hidden_state
+                mask = encoded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+                pooled = torch.nn.functional.normalize(pooled, dim=-1)
+                vectors[batch] = pooled.float().numpy()
+        return vectors
+
+def quantize_int8(vectors):
+    """
+    Quantize rows to int8 with one scale per row (symmetric, by the row's largest magnitude).
+
+    Args:
+        vectors (numpy.ndarray): float32 matrix
+
+    Returns:
+        tuple: (int8 codes, float32 scales) with vectors ≈ codes * scales[:, None]
+    """
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def assign_lists(vectors, centroids):
+    """Index of the closest centroid of each row, computed block by block."""
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+def spherical_kmeans(vectors, num_lists, iterations=10, seed=0):
+    """
+    Cluster unit vectors by cosine similarity.
+
+    Args:
+        vectors (numpy.ndarray): float32 matrix of unit-length rows
+        num_lists (int): Number of clusters
+        iterations (int): Assignment/update rounds
+        seed (int): Seed of the initial centroid sample
+
+    Returns:
+        numpy.ndarray: float32 matrix of unit-length centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), num_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = assign_lists(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        sizes = np.bincount(assignment, minlength=num_lists)
+        # Empty lists restart from a random vector
+        empty = np.flatnonzero(sizes == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, 1e-12)
+    return centroids.astype(np.float32)
+
+class DenseIndex:
+    """
+    Approximate nearest-neighbour index over unit-length document vectors.
+
+    Vectors are stored as float16, or int8 with a scale per row, and can be memory-mapped
+    from disk. Large indexes are an inverted file: rows are clustered with spherical k-means
+    and stored grouped by cluster, so a query reads only the nprobe lists whose centroids
+    are closest. Small indexes are scanned in full.
+    """
+
+    def __init__(self, vectors, ids, scales=None, centroids=None, offsets=None):
+        """
+        Wrap stored arrays (use build or load to create an index).
+
+        Args:
+            vectors (numpy.ndarray): float16 or int8 matrix, rows grouped by list
+            ids (numpy.ndarray): Document id of each row
+            scales (numpy.ndarray, optional): Row scales of int8 vectors
+            centroids (numpy.ndarray, optional): List centroids; None for a flat index
+            offsets (numpy.ndarray, optional): Start row of each list, plus the total
+        """
+        self.vectors = vectors
+        self.ids = ids
+        self.scales = scales
+        self.centroids = centroids
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dtype(self):
+        return "int8" if self.scales is not None else "float16"
+
+    @classmethod
+    def build(cls, vectors, dtype="float16", num_lists=None, iterations=10, seed=0):
+        """
+        Build an index from float vectors.
+
+        Args:
+            vectors (numpy.ndarray): float32 matrix of unit-length rows
+            dtype (str): Stored precision, one of VECTOR_DTYPES
+            num_lists (int, optional): Inverted file lists; by default about 4·√n,
+                or a flat index below IVF_MIN_VECTORS rows
+            iterations (int): k-means rounds
+            seed (int): k-means seed
+
+        Returns:
+            DenseIndex: The index
+        """
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype}")
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        centroids = offsets = None
+        ids = np.arange(len(vectors), dtype=np.int64)
+        if num_lists is None and len(vectors) >= IVF_MIN_VECTORS:
+            num_lists = int(4 * np.sqrt(len(vectors)))
+        if num_lists:
+            num_lists = min(num_lists, len(vectors))
+            # Centroids are trained on a sample; every row is then assigned once
+            rng = np.random.default_rng(seed)
+            sample = rng.choice(len(vectors), min(len(vectors), KMEANS_SAMPLE_PER_LIST * num_lists), replace=False)
+            centroids = spherical_kmeans(vectors[np.sort(sample)], num_lists, iterations, seed)
+            assignment = assign_lists(vectors, centroids)
+            ids = np.argsort(assignment, kind="stable")
+            vectors = vectors[ids]
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=len(centroids)))])
+
+        if dtype == "int8":
+            stored, scales = quantize_int8(vectors)
+        else:
+            stored, scales = vectors.astype(np.float16), None
+        return cls(stored, ids, scales, centroids, offsets)
+
+    def _scores(self, start, stop, query):
+        """Similarity of rows start..stop to the query, in float32."""
+        scores = self.vectors[start:stop].astype(np.float32) @ query
+        if self.scales is not None:
+            scores *= self.scales[start:stop]
+        return scores
+
+    def search(self, query, top_k=3, nprobe=DEFAULT_NPROBE):
+        """
+        Find the documents most similar to a query vector.
+
+        Args:
+            query (numpy.ndarray): Unit-length query vector
+            top_k (int): Maximum number of results
+            nprobe (int): Inverted file lists to read (ignored by a flat index)
+
+        Returns:
+            list: (cosine similarity, document id) tuples, best first
+        """
+        if len(self) == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        if self.centroids is None:
+            ranges = [(start, min(start + SCAN_BLOCK_ROWS, len(self))) for start in range(0, len(self), SCAN_BLOCK_ROWS)]
+        else:
+            closest = np.argsort(-(self.centroids @ query))[:nprobe]
+            ranges = [(self.offsets[i], self.offsets[i + 1]) for i in sorted(closest) if self.offsets[i + 1] > self.offsets[i]]
+
+        rows = np.concatenate([np.arange(start, stop) for start, stop in ranges])
+        scores = np.concatenate([self._scores(start, stop, query) for start, stop in ranges])
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(float(scores[i]), int(self.ids[rows[i]])) for i in best]
+
+    def save(self, directory):
+        """
+        Write the index to a directory (atomically: readers never see a partial index).
+
+        Args:
+            directory (str): Target directory
+        """
+        tmp_dir = f"{directory}.{os.getpid()}.tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            np.save(os.path.join(tmp_dir, "vectors.npy"), self.vectors)
+            np.save(os.path.join(tmp_dir, "ids.npy"), self.ids)
+            if self.scales is not None:
+                np.save(os.path.join(tmp_dir, "scales.npy"), self.scales)
+            if self.centroids is not None:
+                np.save(os.path.join(tmp_dir, "centroids.npy"), self.centroids)
+                np.save(os.path.join(tmp_dir, "offsets.npy"), self.offsets)
+            os.replace(tmp_dir, directory)
+        finally:
+            # Another process may have saved the same index first
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Open a saved index, memory-mapping the vector matrix.
+
+        Args:
+            directory (str): Directory written by save
+
+        Returns:
+            DenseIndex: The index
+        """
+        def optional(name, **kwargs):
+            path = os.path.join(directory, name)
+            return np.load(path, **kwargs) if os.path.exists(path) else None
+
+        return cls(
+            np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r"),
+            np.load(os.path.join(directory, "ids.npy")),
+            scales=optional("scales.npy", mmap_mode="r"),
+            centroids=optional("centroids.npy"),
+            offsets=optional("offsets.npy"),
+        )
+
+def documents_digest(texts, encoder_name, dtype):
+    """SHA-256 identifying a document set embedded by one encoder at one precision."""
+    sha256 = hashlib.sha256(f"v{INDEX_VERSION}\0{encoder_name}\0{dtype}".encode("utf-8"))
+    for text in texts:
+        sha256.update(b"\0")
+        sha256.update(text.encode("utf-8"))
+    return sha256.hexdigest()
+
+def load_or_build_index(texts, encoder, dtype="float16", cache_dir=None):
+    """
+    Get the index of a document set, embedding it only if no index was saved for its hash.
+
+    Args:
+        texts (list): Document texts
+        encoder: Object with name and encode(texts, kind)
+        dtype (str): Stored precision, one of VECTOR_DTYPES
+        cache_dir (str, optional): Index directory root (EMBEDDING_CACHE_DIR by default)
+
+    Returns:
+        DenseIndex: The index, memory-mapped from disk when it could be saved
+    """
+    cache_dir = cache_dir or EMBEDDING_CACHE_DIR
+    directory = os.path.join(cache_dir, documents_digest(texts, encoder.name, dtype))
+    if os.path.exists(os.path.join(directory, "vectors.npy")):
+        return DenseIndex.load(directory)
+
+    index = DenseIndex.build(encoder.encode(texts, kind="passage"), dtype=dtype)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        index.save(directory)
+    except OSError:
+        # Read-only deployment: keep the index in memory
+        return index
+    return DenseIndex.load(directory)
+
+class DenseRetriever:
+    """Embedding search over documents (chunks with a text attribute)."""
+
+    def __init__(self, documents, index, encoder, nprobe=DEFAULT_NPROBE):
+        """
+        Args:
+            documents (list): Documents, in the order they were embedded
+            index (DenseIndex): Index of the documents' vectors
+            encoder: Object with encode(texts, kind)
+            nprobe (int): Inverted file lists read per query
+        """
+        self.documents = list(documents)
+        self.index = index
+        self.encoder = encoder
+        self.nprobe = nprobe
+
+    def rank(self, query, top_k=3):
+        """
+        Rank documents by cosine similarity to the query.
+
+        Returns:
+            list: (similarity, document id) tuples, best first; dissimilar documents are left out
+        """
+        query_vector = self.encoder.encode([query], kind="query")[0]
+        return [(score, i) for score, i in self.index.search(query_vector, top_k, self.nprobe) if score > 0]
+
+    def search(self, query, top_k=3):
+        """
+        Find the documents most similar to a query.
+
+        Args:
+            query (str): Query text
+            top_k (int): Maximum number of documents to return
+
+        Returns:
+            list: (score, document) tuples, best first
+        """
+        return [(score, self.documents[i]) for score, i in self.rank(query, top_k)]
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Merge rankings by summing 1 / (k + rank) over the rankings each item appears in.
+    Only ranks are used, so BM25 scores and cosine similarities need no common scale.
+
+    Args:
+        rankings (list): Lists of item ids, best first
+        k (int): Rank offset
+
+    Returns:
+        list: (fused score, item id) tuples, best first
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(((score, item) for item, score in fused.items()), key=lambda pair: -pair[0])
+
+class HybridRetriever:
+    """Keyword (BM25) and embedding search over the same documents, merged by reciprocal rank fusion."""
+
+    def __init__(self, keyword_index, dense, candidates=FUSION_CANDIDATES):
+        """
+        Args:
+            keyword_index (KnowledgeIndex): BM25 index built over dense.documents
+            dense (DenseRetriever): Embedding search over the same documents
+            candidates (int): Results taken from each ranking before fusion
+        """
+        self.keyword_index = keyword_index
+        self.dense = dense
+        self.documents = dense.documents
+        self.candidates = candidates
+
+    def search(self, query, top_k=3):
+        """
+        Find the documents most relevant to a query by either keywords or meaning.
+
+        Args:
+            query (str): Query text
+            top_k (int): Maximum number of documents to return
+
+        Returns:
+            list: (fused score, document) tuples, best first
+        """
+        keyword_ids = [i for _, i in self.keyword_index.rank(query, self.candidates)]
+        dense_ids = [i for _, i in self.dense.rank(query, self.candidates)]
+        fused = reciprocal_rank_fusion([keyword_ids, dense_ids])[:top_k]
+        return [(score, self.documents[i]) for score, i in fused]
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+def get_encoder(model_name=DEFAULT_EMBEDDING_MODEL, threads=0):
+    """
+    Get a loaded encoder, loading each model only once per process.
+
+    Args:
+        model_name (str): Local directory or Hugging Face repository of the model
+        threads (int): CPU threads (0 keeps the torch default)
+
+    Returns:
+        TransformerEncoder: The encoder
+    """
+    with _encoders_lock:
+        encoder = _encoders.get(model_name)
+        if encoder is None:
+            encoder = _encoders[model_name] = TransformerEncoder(model_name, threads=threads)
+        return encoder
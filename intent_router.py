@@ -0,0 +1,202 @@
+import json
+import os
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+# Topic keywords, canned context and demo responses, one entry per intent
+INTENTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intents.json")
+
+# Keywords taken from the data (e.g. soil series names) count less than curated ones
+DATA_KEYWORD_WEIGHT = 0.5
+
+# Data values that are never keywords
+IGNORED_KEYWORDS = {"기타", "Unknown"}
+
+# A data keyword directly followed by one of these is part of a region name ("고산면", not the 고산 series)
+REGION_SUFFIX_CHARS = "도시군구읍면동리"
+_REGION_SUFFIXES = frozenset(REGION_SUFFIX_CHARS)
+
+
+class Intent(NamedTuple):
+    """A question topic and the canned text used for it."""
+    name: str
+    priority: int
+    context: str
+    demo_response: Optional[str] = None
+    search_terms: str = ""
+    data_column: Optional[str] = None
+    region_profile: bool = False
+
+def compile_keywords(keywords):
+    """
+    Compile keywords into one regular expression shaped like a trie ("토(?:색|성|양통)"),
+    so the text is scanned once and each position only follows the branches that can still match.
+
+    Args:
+        keywords (iterable of str): Keywords to match
+
+    Returns:
+        re.Pattern: Pattern matching the longest keyword at each position
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def to_pattern(node):
+        branches = [re.escape(char) + to_pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Keywords ending here: the longer continuation is optional (and tried first)
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return re.compile(to_pattern(trie) or r"(?!)")
+
+class IntentRouter:
+    """
+    Ranks the intents of a question with one pass of a compiled keyword matcher.
+    Every keyword hit adds its weight to its intent; intents are ranked by score, ties going
+    to the order of the intents file (the order the old if/elif chains checked them in).
+    """
+
+    def __init__(self, intents, default, data_keywords=None):
+        """
+        Build the router.
+
+        Args:
+            intents (list): (Intent, keywords) tuples, in priority order
+            default (Intent): Intent used when no keyword matches
+            data_keywords (dict, optional): Intent name -> extra keywords taken from the data
+        """
+        self.intents = [intent for intent, _ in intents]
+        self.default = default
+        self._keywords = {}
+        by_name = {intent.name: intent for intent in self.intents}
+
+        for name, keywords in (data_keywords or {}).items():
+            for keyword in keywords:
+                if len(keyword) >= 2:
+                    self._keywords[keyword.lower()] = (by_name[name], DATA_KEYWORD_WEIGHT, True)
+        # Curated keywords take precedence over data keywords
+        for intent, keywords in intents:
+            for keyword in keywords:
+                self._keywords[keyword.lower()] = (intent, 1.0, False)
+
+        self._pattern = compile_keywords(self._keywords)
+
+    def route(self, text):
+        """
+        Rank the intents whose keywords appear in a text.
+
+        Args:
+            text (str): Question (or prompt) text
+
+        Returns:
+            list: (score, Intent) tuples, best first; empty if nothing matched
+        """
+        scores = {}
+        for keyword in self.keywords(text):
+            intent, weight, _ = self._keywords[keyword]
+            scores[intent] = scores.get(intent, 0.0) + weight
+        return sorted(((score, intent) for intent, score in scores.items()), key=lambda item: (-item[0], item[1].priority))
+
+    def keywords(self, text):
+        """
+        The keywords found in a text, in order of appearance.
+
+        Args:
+            text (str): Question (or prompt) text
+
+        Returns:
+            list: Matched keywords (lowercased); data keywords that are part of a region name are left out
+        """
+        text = text.lower()
+        found = []
+        for match in self._pattern.finditer(text):
+            if self._keywords[match.group()][2] and text[match.end():match.end() + 1] in _REGION_SUFFIXES:
+                continue
+            found.append(match.group())
+        return found
+
+    def top(self, text):
+        """The best intent of a text, or the default intent if nothing matched."""
+        ranked = self.route(text)
+        return ranked[0][1] if ranked else self.default
+
+def load_intents(path=INTENTS_PATH):
+    """
+    Read the intents file.
+
+    Args:
+        path (str): JSON file with "intents" (in priority order) and "default"
+
+    Returns:
+        tuple: (list of (Intent, keywords) tuples, default Intent)
+    """
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+
+    def make_intent(entry, priority):
+        return Intent(
+            name=entry["name"],
+            priority=priority,
+            context=entry.get("context", ""),
+            demo_response=entry.get("demo_response"),
+            search_terms=entry.get("search_terms", ""),
+            data_column=entry.get("data_column"),
+            region_profile=entry.get("region_profile", False),
+        )
+
+    intents = [(make_intent(entry, i), entry.get("keywords", [])) for i, entry in enumerate(data["intents"])]
+    return intents, make_intent(data["default"], len(intents))
+
+# (path, mtime_ns, id(column_values)) -> (column_values, router); the values object is kept
+# so that its id cannot be reused by another object while the entry exists
+_routers_by_source = {}
+
+@lru_cache(maxsize=4)
+def _load_intents(path, mtime_ns):
+    return load_intents(path)
+
+@lru_cache(maxsize=8)
+def _build_router(path, mtime_ns, data_keywords):
+    intents, default = _load_intents(path, mtime_ns)
+    return IntentRouter(intents, default, {name: list(keywords) for name, keywords in data_keywords})
+
+def get_intent_router(column_values=None, path=INTENTS_PATH):
+    """
+    Get the router for the intents file. It is compiled once per set of data keywords,
+    and again after the file changes.
+
+    Args:
+        column_values (dict, optional): Column -> distinct values of the loaded data
+            (e.g. DatasetProfile.frequencies); intents with a "data_column" add that
+            column's values as keywords. The mapping must not change after the first call.
+        path (str): Intents file
+
+    Returns:
+        IntentRouter: The router
+    """
+    mtime_ns = os.stat(path).st_mtime_ns
+    # Most calls pass the same (read-only) profile table as the previous turn
+    key = (path, mtime_ns, id(column_values))
+    cached = _routers_by_source.get(key)
+    if cached is not None and cached[0] is column_values:
+        return cached[1]
+
+    intents, _ = _load_intents(path, mtime_ns)
+    data_keywords = []
+    for intent, _ in intents:
+        if intent.data_column and column_values and intent.data_column in column_values:
+            values = sorted(str(value) for value in column_values[intent.data_column] if str(value) not in IGNORED_KEYWORDS)
+            data_keywords.append((intent.name, tuple(values)))
+    router = _build_router(path, mtime_ns, tuple(data_keywords))
+
+    if len(_routers_by_source) >= 8:
+        _routers_by_source.clear()
+    _routers_by_source[key] = (column_values, router)
+    return router
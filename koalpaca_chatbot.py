@@ -1,30 +1,243 @@
+import copy
 import os
 import streamlit as st
-import pandas as pd
+import threading
 import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 
-# 참고: 실제 구현에서는 huggingface_hub 패키지가 필요합니다
-# from huggingface_hub import hf_hub_download, snapshot_download
+from retrieval import KnowledgeIndex, get_knowledge_index
+from chunking import Chunk, chunk_knowledge_base, estimate_tokens as estimate_chunk_tokens
+from dense_retrieval import (
+    DEFAULT_EMBEDDING_MODEL, DenseRetriever, HybridRetriever, get_encoder, load_or_build_index
+)
+from intent_router import get_intent_router
+from csv_processor import DatasetProfile, dataframe_digest, describe_soil_types
+from region_index import RegionIndex
+from soil_query import SoilQueryEngine
+from batch_scheduler import BatchScheduler, TextStream
+from prefix_cache import PrefixCache
+from response_cache import ResponseCache
+from prompt_builder import ContextSection, build_budgeted_prompt, estimate_tokens, join_sections
+from conversation_memory import ConversationMemory
+
+# 컨텍스트에 추가할 검색 문단 수
+RETRIEVAL_TOP_K = 3
+
+# 문서 검색 방식: bm25 (키워드), dense (임베딩), hybrid (둘을 순위 융합)
+# dense/hybrid는 문서 청크와 CSV 토양 유형 설명을 임베딩하며 torch가 필요합니다 (실패하면 bm25 사용)
+RETRIEVAL_MODES = ("bm25", "dense", "hybrid")
+KOALPACA_RETRIEVAL = os.environ.get("KOALPACA_RETRIEVAL", "bm25")
+KOALPACA_EMBEDDING_MODEL = os.environ.get("KOALPACA_EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+# 임베딩 행렬 저장 정밀도: float16 또는 int8 (행별 스케일, 메모리 절반)
+KOALPACA_EMBEDDING_DTYPE = os.environ.get("KOALPACA_EMBEDDING_DTYPE", "float16")
+
+# 컨텍스트 출처별 관련도 (토큰 예산이 부족하면 낮은 것부터 제외)
+# 검색 문단은 retrieval 값에 가장 높은 검색 점수 대비 비율을 곱함
+CONTEXT_SCORES = {
+    "query": 1.0,
+    "region": 0.9,
+    "retrieval": 0.8,
+    "topic": 0.7,
+    "csv_summary": 0.3,
+    "default_topic": 0.2,
+}
+
+# 응답 생성 최대 토큰 수 (프롬프트 예산에서 미리 빼 둠)
+RESPONSE_MAX_TOKENS = 300
+
+# 대화 기록: 그대로 넣을 최근 턴 수 (그 이전은 요약), 프롬프트에 넣을 대화 기록의 최대 토큰 수
+KOALPACA_HISTORY_TURNS = int(os.environ.get("KOALPACA_HISTORY_TURNS", "3"))
+KOALPACA_HISTORY_TOKENS = int(os.environ.get("KOALPACA_HISTORY_TOKENS", "400"))
+
+# 실제 모델 대신 시뮬레이션 응답을 쓰는 데모 모드 (KOALPACA_DEMO_MODE=0 이면 실제 모델 로드)
+# 실제 모드에는 transformers, torch, huggingface_hub 패키지가 필요합니다
+KOALPACA_DEMO_MODE = os.environ.get("KOALPACA_DEMO_MODE", "1") != "0"
+
+# 서버 시작 시 백그라운드에서 모델을 미리 로드 (KOALPACA_WARMUP=1 로 사용)
+KOALPACA_WARMUP = os.environ.get("KOALPACA_WARMUP", "0") == "1"
+
+# 워밍업 생성에 쓰는 짧은 프롬프트와 토큰 수 (지연 초기화되는 커널과 캐시 준비용)
+WARMUP_PROMPT = "### 명령어:\n토양이란 무엇인가요?\n\n### 응답:\n"
+WARMUP_MAX_TOKENS = 8
+
+# 로드할 모델 (model_info의 이름; CPU 서버에서는 koalpaca-cpu 권장)
+KOALPACA_MODEL = os.environ.get("KOALPACA_MODEL", "koalpaca-small")
+
+# 가중치 정밀도: auto (GPU는 float16, CPU는 int8), float16, float32, int8
+# int8은 CPU 전용 동적 양자화로, Linear 가중치를 int8로 저장하고 활성값은 실행 중에 양자화합니다
+KOALPACA_PRECISION = os.environ.get("KOALPACA_PRECISION", "auto")
+PRECISIONS = ("auto", "float16", "float32", "int8")
+
+# CPU 추론 스레드 수 (0이면 torch 기본값)
+KOALPACA_THREADS = int(os.environ.get("KOALPACA_THREADS", "0"))
+
+# 동시 세션의 질문을 모아 한 배치로 생성 (최대 배치 크기, 첫 질문이 배치를 기다리는 최대 시간)
+KOALPACA_MAX_BATCH_SIZE = int(os.environ.get("KOALPACA_MAX_BATCH_SIZE", "8"))
+KOALPACA_BATCH_WAIT_MS = float(os.environ.get("KOALPACA_BATCH_WAIT_MS", "20"))
+
+# 공통 프롬프트 접두사(명령어 블록, 주제별 고정 컨텍스트)의 어텐션 KV 캐시 메모리 상한 (MB, 0이면 사용 안 함)
+KOALPACA_PREFIX_CACHE_MB = int(os.environ.get("KOALPACA_PREFIX_CACHE_MB", "512"))
+
+# 반복 질문의 응답 캐시: 최대 항목 수 (0이면 사용 안 함), 유효 시간 (초),
+# 비슷한 질문으로 인정할 문자 bigram 유사도 (0이면 정규화한 질문이 같을 때만 사용)
+KOALPACA_RESPONSE_CACHE_SIZE = int(os.environ.get("KOALPACA_RESPONSE_CACHE_SIZE", "512"))
+KOALPACA_RESPONSE_CACHE_TTL = float(os.environ.get("KOALPACA_RESPONSE_CACHE_TTL", "3600"))
+KOALPACA_RESPONSE_CACHE_SIMILARITY = float(os.environ.get("KOALPACA_RESPONSE_CACHE_SIMILARITY", "0.8"))
+
+# 데모 모드 스트리밍: 첫 토큰까지의 시간과 단어 사이 간격 (초)
+DEMO_FIRST_TOKEN_SECONDS = 0.3
+DEMO_TOKEN_INTERVAL_SECONDS = 0.02
+
+# 모델 로드 상태
+LOAD_STATE_NOT_LOADED = "not_loaded"
+LOAD_STATE_LOADING = "loading"
+LOAD_STATE_LOADED = "loaded"
+LOAD_STATE_FAILED = "failed"
+
+def resolve_precision(precision=KOALPACA_PRECISION):
+    """
+    가중치 정밀도 결정 (auto는 GPU가 있으면 float16, 없으면 int8; int8은 GPU가 있어도 CPU에서 실행)
+    
+    Args:
+        precision (str): PRECISIONS 중 하나
+        
+    Returns:
+        str: float16, float32 또는 int8
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"지원하지 않는 정밀도입니다: {precision} (가능한 값: {', '.join(PRECISIONS)})")
+    import torch
+    
+    if precision == "auto":
+        return "float16" if torch.cuda.is_available() else "int8"
+    return precision
+
+def load_causal_lm(model_path, precision=KOALPACA_PRECISION, threads=KOALPACA_THREADS, progress=None):
+    """
+    토크나이저와 모델을 지정한 정밀도로 로드
+    
+    float16은 GPU가 있으면 GPU로 옮기고, float32와 int8은 CPU에서 실행합니다. int8은 float32로
+    읽은 뒤 Linear 층을 torch 동적 양자화(qint8)로 바꿉니다 (Linear 가중치 메모리가 약 1/4).
+    
+    Args:
+        model_path (str): 모델 디렉터리 (또는 Hugging Face 저장소 이름)
+        precision (str): PRECISIONS 중 하나
+        threads (int): CPU 추론 스레드 수 (0이면 torch 기본값 유지)
+        progress (callable, optional): (진행률, 단계) 를 받는 함수
+        
+    Returns:
+        tuple: (tokenizer, model, 실제 사용한 정밀도)
+    """
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+    import torch
+    
+    progress = progress or (lambda value, stage: None)
+    precision = resolve_precision(precision)
+    if threads:
+        torch.set_num_threads(threads)
+    
+    progress(0.2, "토크나이저 로드")
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    progress(0.3, "모델 가중치 로드")
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path, 
+        torch_dtype=torch.float16 if precision == "float16" else torch.float32, 
+        low_cpu_mem_usage=True
+    )
+    if precision == "int8":
+        progress(0.7, "int8 양자화")
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    progress(0.8, "장치 배치")
+    if precision == "float16" and torch.cuda.is_available():
+        model = model.cuda()
+    model.eval()
+    return tokenizer, model, precision
+
+def model_memory_bytes(model):
+    """
+    모델 가중치와 버퍼의 메모리 (양자화된 Linear의 packed 가중치 포함)
+    
+    Returns:
+        int: 바이트 수
+    """
+    import torch
+    
+    def tensor_bytes(value):
+        if isinstance(value, torch.Tensor):
+            return value.numel() * value.element_size()
+        if isinstance(value, (tuple, list)):
+            return sum(tensor_bytes(item) for item in value)
+        return 0
+    
+    return sum(tensor_bytes(value) for value in model.state_dict().values())
+
+def kv_cache_bytes(past_key_values):
+    """
+    어텐션 KV 캐시(past_key_values)의 메모리
+    
+    Args:
+        past_key_values: transformers Cache 객체 또는 (key, value) 튜플의 튜플
+        
+    Returns:
+        int: 바이트 수
+    """
+    if hasattr(past_key_values, "key_cache"):
+        tensors = list(past_key_values.key_cache) + list(past_key_values.value_cache)
+    else:
+        tensors = [tensor for layer in past_key_values for tensor in layer]
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
 
 # KoAlpaca 모델 관리 클래스 
 class KoAlpacaModelManager:
-    """KoAlpaca 모델 관리 클래스"""
+    """
+    KoAlpaca 모델 관리 클래스 (프로세스당 하나, 여러 세션 스레드에서 공유)
+    
+    모델은 프로세스에서 한 번만 로드됩니다. 로드 중에 다른 스레드가 load_model을 호출하면
+    새로 로드하지 않고 진행 중인 로드(Future)의 결과를 기다립니다. 이 클래스는 st.* 를
+    호출하지 않으며, 로드 상태/시간/메모리는 status()로 조회해서 UI에서 표시합니다.
+    """
     
     # 싱글톤 인스턴스
     _instance = None
+    _instance_lock = threading.Lock()
     
     @classmethod
     def get_instance(cls):
-        """싱글톤 인스턴스 반환"""
+        """싱글톤 인스턴스 반환 (동시에 호출되어도 인스턴스는 하나만 생성)"""
         if cls._instance is None:
-            cls._instance = KoAlpacaModelManager()
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
         return cls._instance
     
-    def __init__(self):
+    def __init__(self, demo_mode=None):
         """초기화 - 모델 로딩 상태 설정"""
         self.model = None
         self.tokenizer = None
-        self.is_loaded = False
+        self.demo_mode = KOALPACA_DEMO_MODE if demo_mode is None else demo_mode
+        
+        # 로드 상태 (_load_lock 아래에서 변경)
+        self._load_lock = threading.Lock()
+        self._load_future = None
+        self.load_state = LOAD_STATE_NOT_LOADED
+        self.model_name = None
+        self.load_seconds = None
+        self.memory_bytes = None
+        self.precision = None
+        self.load_error = None
+        self.load_progress = 0.0
+        self.load_stage = ""
+        self.warmed_up = False
+        self._warmup_thread = None
+        
+        # 실제 모드의 생성 요청 배치 스케줄러 (모델 로드 후 생성)
+        self.scheduler = None
+        
+        # 프롬프트 접두사 토큰 ID -> 어텐션 KV 상태 (LRU, 메모리 상한)
+        self.prefix_cache = None
+        if KOALPACA_PREFIX_CACHE_MB > 0:
+            self.prefix_cache = PrefixCache(kv_cache_bytes, max_bytes=KOALPACA_PREFIX_CACHE_MB * 1024 * 1024)
+        self._prefix_token_ids = {}
         
         # 모델 정보
         self.model_info = {
@@ -33,185 +246,513 @@ class KoAlpacaModelManager:
                 "model_files": ["pytorch_model.bin", "config.json", "tokenizer.json", "tokenizer_config.json"],
                 "path": "models/koalpaca-small",
                 "context_size": 2048
+            },
+            # CPU 서버용 작은 모델 (int8 양자화 시 약 6GB); 샤딩된 가중치라 저장소 전체를 받음
+            "koalpaca-cpu": {
+                "repo_id": "beomi/KoAlpaca-Polyglot-5.8B",
+                "path": "models/koalpaca-cpu",
+                "context_size": 2048
             }
         }
     
-    def download_model(self, model_name="koalpaca-small"):
-        """모델 파일 다운로드 시도"""
-        st.info("KoAlpaca 모델은 큰 용량으로 인해 실제 다운로드는 비활성화되었습니다.")
-        st.info("실제 구현 시에는 Hugging Face에서 모델을 다운로드하거나 사전 설치해야 합니다.")
+    @property
+    def is_loaded(self):
+        """모델 로드 완료 여부"""
+        return self.load_state == LOAD_STATE_LOADED
+    
+    def status(self):
+        """
+        모델 로드 상태 조회
         
-        # 실제 구현에서는 아래 코드를 활성화할 수 있습니다.
+        Returns:
+            dict: state, progress (0-1), stage, model_name, demo_mode, precision, threads,
+                load_seconds, memory_bytes, warmed_up, error, prefix_cache (캐시 통계)
         """
-        try:
-            repo_id = self.model_info[model_name]["repo_id"]
-            local_dir = self.model_info[model_name]["path"]
-            
-            os.makedirs(local_dir, exist_ok=True)
-            
-            with st.spinner(f"KoAlpaca 모델 다운로드 중... ({model_name})"):
-                for file in self.model_info[model_name]["model_files"]:
-                    hf_hub_download(
-                        repo_id=repo_id,
-                        filename=file,
-                        local_dir=local_dir
-                    )
-                st.success(f"모델 다운로드 완료: {model_name}")
-                return True
-                
-        except Exception as e:
-            st.error(f"모델 다운로드 실패: {str(e)}")
-            return False
+        with self._load_lock:
+            return {
+                "state": self.load_state,
+                "progress": self.load_progress,
+                "stage": self.load_stage,
+                "warmed_up": self.warmed_up,
+                "model_name": self.model_name,
+                "demo_mode": self.demo_mode,
+                "precision": self.precision,
+                "threads": self._threads(),
+                "load_seconds": self.load_seconds,
+                "memory_bytes": self.memory_bytes,
+                "error": self.load_error,
+                "prefix_cache": self.prefix_cache.stats() if self.prefix_cache is not None else None,
+            }
+    
+    def count_tokens(self, text):
+        """텍스트의 토큰 수 (토크나이저가 없는 데모 모드에서는 추정값)"""
+        if self.tokenizer is None:
+            return estimate_tokens(text)
+        return len(self.tokenizer(text)["input_ids"])
+    
+    def context_size(self):
+        """로드된 (또는 로드할) 모델의 컨텍스트 길이 (토큰)"""
+        return self.model_info[self.model_name or KOALPACA_MODEL]["context_size"]
+    
+    def _threads(self):
+        """CPU 추론 스레드 수 (실제 모드에서 torch를 불러온 뒤에만 알 수 있음)"""
+        if self.demo_mode or self.model is None:
+            return KOALPACA_THREADS or None
+        import torch
+        return torch.get_num_threads()
+    
+    def download_model(self, model_name=KOALPACA_MODEL):
         """
+        모델 파일 다운로드 (데모 모드에서는 건너뜀)
         
-        # 데모 목적으로 성공했다고 가정
+        Returns:
+            bool: 모델 파일 준비 여부 (실패 시 예외 발생)
+        """
+        if self.demo_mode:
+            return True
+        
+        from huggingface_hub import hf_hub_download, snapshot_download
+        
+        repo_id = self.model_info[model_name]["repo_id"]
+        local_dir = self.model_info[model_name]["path"]
+        os.makedirs(local_dir, exist_ok=True)
+        if "model_files" not in self.model_info[model_name]:
+            snapshot_download(repo_id=repo_id, local_dir=local_dir)
+            return True
+        for file in self.model_info[model_name]["model_files"]:
+            hf_hub_download(repo_id=repo_id, filename=file, local_dir=local_dir)
         return True
         
-    def load_model(self, model_name="koalpaca-small"):
-        """KoAlpaca 모델 로드"""
-        # 데모 환경에서는 실제 로드 대신 성공했다고 가정
-        try:
-            # 실제 구현에서는 아래와 같이 모델을 로드합니다.
-            """
-            from transformers import AutoTokenizer, AutoModelForCausalLM
-            import torch
-            
-            model_path = self.model_info[model_name]["path"]
-            
-            # 모델 다운로드 확인 및 시도
-            if not os.path.exists(model_path) or not os.listdir(model_path):
-                if not self.download_model(model_name):
-                    return False
+    def _set_progress(self, progress, stage):
+        """로드 진행률과 단계 기록"""
+        with self._load_lock:
+            self.load_progress = progress
+            self.load_stage = stage
+    
+    def start_background_load(self, model_name=KOALPACA_MODEL, warmup=True):
+        """
+        백그라운드 스레드에서 모델 로드 (및 워밍업 생성) 시작
+        이미 시작했거나 로드되었으면 아무것도 하지 않습니다. 진행 상황은 status()로 확인합니다.
+        
+        Args:
+            model_name (str): model_info의 모델 이름
+            warmup (bool): 로드 후 짧은 생성을 한 번 실행
             
-            # 토크나이저 및 모델 로드
-            with st.spinner(f"KoAlpaca 모델을 로드하는 중... ({model_name})"):
-                self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    model_path, 
-                    torch_dtype=torch.float16, 
-                    low_cpu_mem_usage=True
+        Returns:
+            threading.Thread: 로드 스레드
+        """
+        with self._load_lock:
+            if self._warmup_thread is None:
+                self._warmup_thread = threading.Thread(
+                    target=self.load_model, args=(model_name, None, warmup),
+                    name="koalpaca-warmup", daemon=True
                 )
-                if torch.cuda.is_available():
-                    self.model = self.model.cuda()
-                self.is_loaded = True
-                st.success(f"KoAlpaca 모델 로드 완료: {model_name}")
-                return True
-            """
+                self._warmup_thread.start()
+            return self._warmup_thread
+    
+    def load_model(self, model_name=KOALPACA_MODEL, timeout=None, warmup=False):
+        """
+        KoAlpaca 모델 로드 (프로세스당 한 번)
+        
+        처음 호출한 스레드가 로드하고, 그동안 호출한 다른 스레드는 같은 로드를 기다립니다.
+        이미 로드되었으면 바로 True를 반환하고, 이전 로드가 실패했으면 다시 시도합니다.
+        
+        Args:
+            model_name (str): model_info의 모델 이름
+            timeout (float, optional): 다른 스레드의 로드를 기다릴 최대 시간 (초)
+            warmup (bool): 이 호출이 로드를 시작하는 경우, 완료 전에 워밍업 생성 실행
             
-            # 데모 목적으로 로드에 성공했다고 가정
-            time.sleep(2)  # 로딩 시간 시뮬레이션
-            self.is_loaded = True
-            st.success(f"KoAlpaca 모델 로드 완료: {model_name} (데모 모드)")
-            return True
+        Returns:
+            bool: 로드 성공 여부
+        """
+        with self._load_lock:
+            future = self._load_future
+            owner = future is None or (future.done() and not future.result())
+            if owner:
+                future = Future()
+                self._load_future = future
+                self.load_state = LOAD_STATE_LOADING
+                self.model_name = model_name
+                self.load_error = None
+                self.load_progress = 0.0
+                self.load_stage = "준비 중"
+        
+        if owner:
+            self._load(model_name, future, warmup)
+        
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            return False
+    
+    def _load(self, model_name, future, warmup=False):
+        """실제 로드 수행 후 상태를 기록하고 future에 결과 전달"""
+        start_time = time.perf_counter()
+        try:
+            if self.demo_mode:
+                # 데모 목적으로 로드에 성공했다고 가정 (로딩 시간 2초 시뮬레이션)
+                for step, stage in enumerate(["토크나이저 로드", "모델 가중치 로드", "모델 가중치 로드", "장치 배치"]):
+                    self._set_progress(step / 4, stage)
+                    time.sleep(0.5)
+                memory_bytes = None
+            else:
+                model_path = self.model_info[model_name]["path"]
+                
+                # 모델 다운로드 확인 및 시도
+                if not os.path.exists(model_path) or not os.listdir(model_path):
+                    self._set_progress(0.05, "모델 다운로드")
+                    self.download_model(model_name)
+                
+                # 토크나이저 및 모델 로드 (CPU 서버에서는 int8 양자화)
+                tokenizer, model, precision = load_causal_lm(model_path, progress=self._set_progress)
+                memory_bytes = model_memory_bytes(model)
+                self.tokenizer, self.model = tokenizer, model
+                with self._load_lock:
+                    self.precision = precision
+                # 이전 모델의 KV 상태는 쓸 수 없음
+                if self.prefix_cache is not None:
+                    self.prefix_cache.clear()
+                self._prefix_token_ids = {}
+                
+                if warmup:
+                    # 첫 질문이 지연 초기화 비용을 치르지 않도록 짧게 한 번 생성
+                    self._set_progress(0.9, "워밍업 생성")
+                    self._generate(WARMUP_PROMPT, WARMUP_MAX_TOKENS, temperature=0.7)
             
+            with self._load_lock:
+                self.load_seconds = time.perf_counter() - start_time
+                self.memory_bytes = memory_bytes
+                self.load_state = LOAD_STATE_LOADED
+                self.load_progress = 1.0
+                self.load_stage = "완료"
+                self.warmed_up = warmup and not self.demo_mode
+            if not self.demo_mode:
+                self._get_scheduler()
+            future.set_result(True)
         except Exception as e:
-            st.error(f"모델 로드 실패: {str(e)}")
-            return False
+            with self._load_lock:
+                self.load_seconds = time.perf_counter() - start_time
+                self.load_error = str(e)
+                self.load_state = LOAD_STATE_FAILED
+                self.load_stage = "실패"
+                # 실패한 백그라운드 로드는 다시 시작할 수 있게 함
+                self._warmup_thread = None
+            future.set_result(False)
+    
+    def _get_scheduler(self):
+        """생성 요청 배치 스케줄러 (처음 필요할 때 생성; 모델을 직접 설정한 경우도 포함)"""
+        with self._load_lock:
+            if self.scheduler is None:
+                self.scheduler = BatchScheduler(
+                    self._generate_batch,
+                    max_batch_size=KOALPACA_MAX_BATCH_SIZE,
+                    max_wait=KOALPACA_BATCH_WAIT_MS / 1000
+                )
+            return self.scheduler
     
-    def generate_response(self, prompt, max_tokens=300, temperature=0.7):
-        """응답 생성"""
+    def _generate(self, prompt, max_tokens, temperature):
+        """실제 모델로 응답 하나 생성 (프롬프트 부분을 제외한 텍스트 반환)"""
+        return self._generate_batch([prompt], max_tokens, temperature)[0]
+    
+    def _generate_batch(self, prompts, max_tokens, temperature, streams=None):
+        """
+        여러 프롬프트를 패딩해서 한 번에 생성
+        
+        Args:
+            prompts (list): 프롬프트 목록
+            max_tokens (int): 생성할 최대 토큰 수
+            temperature (float): 샘플링 온도
+            streams (list, optional): 프롬프트별 TextStream 또는 None; 스트림에는 생성되는 대로
+                텍스트 조각을 보내고, 취소된 스트림의 행은 그 자리에서 생성을 멈춤
+            
+        Returns:
+            list: 프롬프트별 응답 텍스트 (프롬프트 부분 제외)
+        """
+        try:
+            return self._run_generate(prompts, max_tokens, temperature, streams)
+        finally:
+            for stream in streams or ():
+                if stream is not None:
+                    stream.end()
+    
+    def _run_generate(self, prompts, max_tokens, temperature, streams):
+        """_generate_batch의 실제 생성 (스트림 종료는 호출한 쪽에서 처리)"""
+        import torch
+        from transformers import StoppingCriteriaList
+        
+        # 디코더 모델은 왼쪽에 패딩해야 모든 프롬프트가 같은 위치에서 생성을 이어감
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        
+        # 입력 인코딩
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
+        
+        # 프롬프트가 하나면 캐시된 가장 긴 접두사의 KV 상태에서 시작 (패딩된 배치는 위치가 달라 제외)
+        past_key_values = None
+        if len(prompts) == 1:
+            prefixes = getattr(streams[0], "prefixes", ()) if streams and streams[0] is not None else ()
+            _, past_key_values = self._prefix_state(inputs["input_ids"], prefixes)
+        
+        # 스트림이 있으면 토큰마다 조각을 보내고, 읽는 쪽이 떠난 행은 멈춤
+        streamer = stopping_criteria = None
+        if streams and any(stream is not None for stream in streams):
+            streamer = _BatchTextStreamer(self.tokenizer, streams)
+            stopping_criteria = StoppingCriteriaList([_CancelledStreams(streams)])
+        
+        # 응답 생성
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                past_key_values=past_key_values,
+                max_new_tokens=max_tokens,
+                temperature=temperature,
+                top_p=0.9,
+                do_sample=True,
+                eos_token_id=self.tokenizer.eos_token_id,
+                pad_token_id=self.tokenizer.pad_token_id,
+                streamer=streamer,
+                stopping_criteria=stopping_criteria
+            )
+        
+        # 프롬프트 토큰(패딩 포함)을 제외하고 응답만 디코딩
+        prompt_length = inputs["input_ids"].shape[1]
+        return [
+            self.tokenizer.decode(output[prompt_length:], skip_special_tokens=True).strip()
+            for output in outputs
+        ]
+    
+    def generate_response(self, prompt, max_tokens=RESPONSE_MAX_TOKENS, temperature=0.7, intent=None, timings=None):
+        """
+        응답 생성
+        
+        실제 모드에서는 배치 스케줄러를 거치므로 동시에 들어온 다른 세션의 질문과 함께 생성됩니다.
+        
+        Args:
+            prompt (str): 모델 프롬프트
+            max_tokens (int): 생성할 최대 토큰 수
+            temperature (float): 샘플링 온도
+            intent (Intent, optional): 데모 응답을 고를 질문 의도 (없으면 프롬프트에서 판별)
+            timings (dict, optional): 주어지면 queue_seconds, compute_seconds, batch_size 기록
+                (오류가 나면 error=True)
+            
+        Returns:
+            str: 응답 텍스트
+        """
         if not self.is_loaded:
             return "모델이 로드되지 않았습니다. 먼저 모델을 로드해주세요."
             
         try:
-            # 실제 구현에서는 아래와 같이 모델로 응답을 생성합니다.
-            """
-            import torch
-            
-            with st.spinner("KoAlpaca 모델이 응답을 생성하는 중..."):
-                start_time = time.time()
-                
-                # 입력 인코딩
-                inputs = self.tokenizer(prompt, return_tensors="pt")
-                if torch.cuda.is_available():
-                    inputs = {k: v.cuda() for k, v in inputs.items()}
-                
-                # 응답 생성
-                outputs = self.model.generate(
-                    inputs["input_ids"],
-                    max_new_tokens=max_tokens,
-                    temperature=temperature,
-                    top_p=0.9,
-                    do_sample=True,
-                    eos_token_id=self.tokenizer.eos_token_id,
-                    pad_token_id=self.tokenizer.pad_token_id
-                )
-                
-                # 결과 디코딩
-                result = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-                
-                # 프롬프트 제거하고 응답만 반환
-                response = result[len(prompt):].strip()
-                
-                end_time = time.time()
-                st.session_state.response_time = f"{end_time - start_time:.2f} 초"
-                
-                return response
-            """
+            if not self.demo_mode:
+                result = self._get_scheduler().generate(prompt, max_tokens, temperature)
+                if timings is not None:
+                    timings.update(result._asdict())
+                    del timings["text"]
+                return result.text
             
             # 데모 목적의 응답 생성
             time.sleep(1)  # 응답 생성 시간 시뮬레이션
-            
-            # 일부 미리 정의된 응답 (토양 관련)
-            if "토색" in prompt.lower() or "토양 색" in prompt.lower():
-                response = """
-토색은 토양의 색깔을 의미합니다. 토양의 색깔은 토양의 구성 성분과 특성을 나타내는 중요한 지표입니다.
-
-토색의 주요 특징:
-1. 토양의 색은 먼셀 컬러 시스템으로 측정하며, 색상, 명도, 채도로 표현합니다.
-2. 토색을 통해 유기물 함량, 광물 함량, 배수 상태 등을 추정할 수 있습니다.
-
-주요 토색과 의미:
-- 검은색/짙은 갈색: 유기물 함량이 높음, 비옥한 토양
-- 붉은색/적갈색: 철 산화물 함량이 높음, 배수가 잘됨
-- 회색/청회색: 환원 상태, 배수 불량
-- 황갈색: 배수 양호, 철 화합물 함유
-- 밝은 색/회백색: 규소, 점토, 탄산염, 석고 등 함유
-
-토색은 농업에서 작물 재배 적합성을 평가하는 데 중요한 요소입니다.
-"""
-            elif "토양통" in prompt.lower() or "석천" in prompt.lower():
-                response = """
-토양통은 토양 분류 체계에서 사용하는 기본 단위입니다. 같은 토양통에 속하는 토양은 비슷한 특성을 가집니다.
-
-석천 토양통은 다음과 같은 특성이 있습니다:
-- 양토 또는 사양토로 구성
-- 배수 상태가 양호하거나 매우 양호함
-- 유효토심은 50-100cm로 보통 수준
-- 주로 산성암을 모재로 함
-- 산악지나 구릉지에 주로 분포
-
-이러한 특성으로 석천 토양통은 다양한 작물 재배에 적합합니다.
-"""
-            elif "토성" in prompt.lower():
-                response = """
-토성(Soil Texture)은 토양의 물리적 특성을 나타내는 것으로, 모래, 미사, 점토의 비율에 따라 결정됩니다.
-
-주요 토성 분류:
-- 사토(Sand): 모래 함량이 높음, 배수 양호, 보수력 낮음
-- 양토(Loam): 모래, 미사, 점토가 균형적으로 분포, 이상적인 토양 구조
-- 식토(Clay): 점토 함량이 높음, 배수 불량, 보수력 높음
-- 사양토(Sandy Loam): 모래가 많고 점토가 적은 양토
-- 미사질양토(Silty Loam): 미사가 많은 양토
-
-완주군 지역은 주로 양토와 사양토가 분포하고 있어 농업에 유리한 조건을 갖추고 있습니다.
-"""
-            else:
-                response = f"""
-안녕하세요, 저는 토양 정보 전문가입니다. '{prompt.strip()}'에 대한 질문이군요.
-
-토양에 관한 질문을 구체적으로 해주시면 더 정확한 정보를 제공해드릴 수 있습니다.
-예를 들어 토색, 토성, 배수 등 특정 토양 특성이나 지역에 대해 질문해주세요.
-
-완주군 지역의 토양은 주로 석천, 고천 등의 토양통으로 이루어져 있으며, 
-양호한 배수와 적절한 유효토심을 가진 곳이 많습니다.
-"""
-            
-            st.session_state.response_time = "1.2 초 (데모 모드)"
-            return response.strip()
+            return self._demo_response(prompt, intent)
             
         except Exception as e:
+            if timings is not None:
+                timings["error"] = True
             return f"응답 생성 중 오류 발생: {str(e)}"
+    
+    def _demo_response(self, prompt, intent=None):
+        """질문 의도별 미리 정의된 데모 응답 (intents.json)"""
+        if intent is None:
+            intent = get_intent_router().top(prompt)
+        if intent.demo_response:
+            response = intent.demo_response
+        else:
+            response = get_intent_router().default.demo_response.replace("{question}", prompt.strip())
+        return response.strip()
+    
+    def stream_response(self, prompt, max_tokens=RESPONSE_MAX_TOKENS, temperature=0.7, intent=None, timings=None, prefixes=()):
+        """
+        응답을 생성되는 대로 조금씩 반환하는 제너레이터
+        
+        실제 모드에서는 토큰이 생성될 때마다 디코딩된 텍스트 조각을 내보냅니다. 요청은 배치
+        스케줄러를 거치므로 여러 세션의 질문이 한 배치로 생성되고 동시에 도는 생성은 하나뿐입니다.
+        제너레이터를 중간에 닫으면 (사용자가 떠나면) 대기 중인 요청은 취소되고 생성 중인 요청은
+        다음 토큰에서 멈춥니다.
+        
+        Args:
+            prompt (str): 모델 프롬프트
+            max_tokens (int): 생성할 최대 토큰 수
+            temperature (float): 샘플링 온도
+            intent (Intent, optional): 데모 응답을 고를 질문 의도 (없으면 프롬프트에서 판별)
+            timings (dict, optional): 주어지면 ttft_seconds (첫 조각까지), total_seconds 기록,
+                실제 모드는 queue_seconds, compute_seconds, batch_size도 기록 (오류가 나면 error=True)
+            prefixes (iterable of str): 여러 질문이 공유하는 프롬프트 앞부분; KV 상태를 캐시해서
+                다음 질문부터는 나머지 부분만 인코딩
+            
+        Yields:
+            str: 응답 텍스트 조각 (이어 붙이면 전체 응답)
+        """
+        start_time = time.perf_counter()
+        first = True
+        try:
+            for piece in self._stream_pieces(prompt, max_tokens, temperature, intent, prefixes, timings):
+                if not piece:
+                    continue
+                if first and timings is not None:
+                    timings["ttft_seconds"] = time.perf_counter() - start_time
+                first = False
+                yield piece
+        except Exception as e:
+            if timings is not None:
+                timings["error"] = True
+            yield f"응답 생성 중 오류 발생: {str(e)}"
+        finally:
+            if timings is not None:
+                timings["total_seconds"] = time.perf_counter() - start_time
+                timings.setdefault("ttft_seconds", timings["total_seconds"])
+    
+    def _stream_pieces(self, prompt, max_tokens, temperature, intent, prefixes=(), timings=None):
+        """stream_response의 텍스트 조각 생성 (데모 모드는 미리 정의된 응답을 단어 단위로 전달)"""
+        if not self.is_loaded:
+            yield "모델이 로드되지 않았습니다. 먼저 모델을 로드해주세요."
+            return
+        
+        if self.demo_mode:
+            time.sleep(DEMO_FIRST_TOKEN_SECONDS)
+            response = self._demo_response(prompt, intent)
+            start = 0
+            # 공백을 포함해서 단어 단위로 잘라 원문 그대로 이어지게 함
+            while start < len(response):
+                end = response.find(" ", start + 1)
+                end = len(response) if end == -1 else end
+                yield response[start:end]
+                start = end
+                time.sleep(DEMO_TOKEN_INTERVAL_SECONDS)
+            return
+        
+        stream = TextStream(prefixes=tuple(prefixes))
+        future = self._get_scheduler().submit(prompt, max_tokens, temperature, stream=stream)
+        try:
+            yield from stream
+            result = future.result()
+            if timings is not None:
+                timings.update(result._asdict())
+                del timings["text"]
+        finally:
+            # 끝까지 읽지 않고 닫힌 경우: 대기 중이면 취소, 생성 중이면 다음 토큰에서 멈춤
+            future.cancel()
+            stream.cancel()
+
+    def _prefix_state(self, input_ids, prefixes=()):
+        """
+        프롬프트 앞부분의 어텐션 KV 상태 (생성에 넘길 복사본)
+        
+        주어진 접두사는 짧은 것부터 캐시를 찾고, 없으면 바로 앞 접두사의 상태에 이어서 나머지
+        토큰만 인코딩해서 저장합니다. 접두사가 없으면 캐시된 것 중 가장 긴 일치 접두사를 씁니다.
+        
+        Args:
+            input_ids (torch.Tensor): (1, 길이) 프롬프트 토큰
+            prefixes (iterable of str): 공유되는 프롬프트 앞부분
+            
+        Returns:
+            tuple: (캐시된 접두사 토큰 수, past_key_values 복사본 또는 None)
+        """
+        if self.prefix_cache is None:
+            return 0, None
+        import torch
+        
+        token_ids = input_ids[0].tolist()
+        length, past = 0, None
+        for prefix in sorted(prefixes, key=len):
+            n = self._aligned_prefix_length(token_ids, prefix)
+            # 마지막 토큰 하나 이상은 generate가 직접 인코딩해야 함
+            if n <= length or n >= len(token_ids):
+                continue
+            cached = self.prefix_cache.get(token_ids[:n])
+            if cached is None:
+                with torch.inference_mode():
+                    outputs = self.model(
+                        input_ids=input_ids[:, length:n],
+                        past_key_values=copy.deepcopy(past) if past is not None else None,
+                        use_cache=True
+                    )
+                cached = outputs.past_key_values
+                self.prefix_cache.put(token_ids[:n], cached)
+            length, past = n, cached
+        
+        if past is None:
+            length, past = self.prefix_cache.longest_prefix(token_ids)
+            if past is None:
+                return 0, None
+        # generate는 KV 상태에 토큰을 덧붙이므로 캐시된 원본 대신 복사본 전달
+        with torch.inference_mode():
+            return length, copy.deepcopy(past)
+    
+    def _aligned_prefix_length(self, token_ids, prefix):
+        """접두사 텍스트의 토큰 중 프롬프트 토큰과 앞에서부터 일치하는 개수 (경계에서 토큰이 합쳐지는 경우 대비)"""
+        prefix_ids = self._prefix_token_ids.get(prefix)
+        if prefix_ids is None:
+            prefix_ids = self.tokenizer(prefix)["input_ids"]
+            if len(self._prefix_token_ids) >= 256:
+                self._prefix_token_ids.clear()
+            self._prefix_token_ids[prefix] = prefix_ids
+        n = 0
+        for a, b in zip(token_ids, prefix_ids):
+            if a != b:
+                break
+            n += 1
+        return n
+
+class _BatchTextStreamer:
+    """
+    model.generate의 streamer: 배치의 행마다 새로 디코딩된 텍스트를 그 행의 TextStream에 전달
+    (transformers의 TextIteratorStreamer는 배치 크기 1만 지원)
+    """
+    
+    def __init__(self, tokenizer, streams):
+        self.tokenizer = tokenizer
+        self.streams = streams
+        self.token_ids = [[] for _ in streams]
+        self.sent = [0] * len(streams)
+        self.finished = [stream is None for stream in streams]
+        self.prompt_skipped = False
+    
+    def put(self, value):
+        """generate가 처음에는 프롬프트 토큰 전체, 이후에는 스텝마다 행별 새 토큰 하나를 전달"""
+        if not self.prompt_skipped:
+            self.prompt_skipped = True
+            return
+        for row, token_id in enumerate(value.reshape(-1).tolist()):
+            if self.finished[row]:
+                continue
+            if token_id == self.tokenizer.eos_token_id or self.streams[row].cancelled:
+                self.finished[row] = True
+                continue
+            self.token_ids[row].append(token_id)
+            text = self.tokenizer.decode(self.token_ids[row], skip_special_tokens=True)
+            # 한 글자가 여러 토큰에 걸친 경우 글자가 완성될 때까지 보류
+            if text.endswith("\ufffd"):
+                continue
+            if len(text) > self.sent[row]:
+                self.streams[row].put(text[self.sent[row]:])
+                self.sent[row] = len(text)
+    
+    def end(self):
+        """스트림 종료는 _generate_batch가 처리"""
+
+class _CancelledStreams:
+    """model.generate의 stopping criterion: 읽는 쪽이 떠난 스트림의 행은 생성을 마친 것으로 처리"""
+    
+    def __init__(self, streams):
+        self.streams = streams
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        return torch.tensor(
+            [stream is not None and stream.cancelled for stream in self.streams],
+            dtype=torch.bool, device=input_ids.device
+        )
 
 def create_koalpaca_prompt(instruction, input_text=""):
     """KoAlpaca 모델용 프롬프트 생성"""
@@ -221,156 +762,395 @@ def create_koalpaca_prompt(instruction, input_text=""):
         prompt = f"### 명령어:\n{instruction}\n\n### 응답:\n"
     return prompt
 
-def create_context_koalpaca(user_query, knowledge_base, csv_data=None):
+def route_query(user_query, profile=None):
     """
-    KoAlpaca 모델용 컨텍스트 생성 (chatbot.py의 create_context 대체)
+    질문의 의도를 점수 순으로 판별 (토양통명 등은 로드된 데이터의 값도 키워드로 사용)
+    
+    Args:
+        user_query (str): 사용자 질문
+        profile (DatasetProfile, optional): 로드된 CSV 데이터의 통계
+        
+    Returns:
+        list: (점수, Intent) 튜플 목록
+    """
+    column_values = profile.frequencies if profile is not None else None
+    return get_intent_router(column_values).route(user_query)
+
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+_retrieval_status = {"mode": "bm25", "documents": None, "error": None}
+
+def get_retriever_koalpaca(knowledge_base, csv_data=None, mode=None):
+    """
+    지식 베이스 검색기 (KOALPACA_RETRIEVAL 설정에 따라 BM25, 임베딩, 또는 하이브리드)
+    
+    임베딩 검색기는 지식 베이스 청크와 CSV 토양 유형 설명을 문서로 사용하며, 문서 집합마다
+    한 번만 임베딩해 디스크에 저장합니다 (같은 문서 집합은 다음 실행에서 저장된 행렬을 메모리 매핑).
+    임베딩 모델을 쓸 수 없으면 BM25 검색기를 사용합니다.
+    
+    Args:
+        knowledge_base (str): 지식 베이스 텍스트
+        csv_data (pandas.DataFrame, optional): 처리된 CSV 데이터
+        mode (str, optional): RETRIEVAL_MODES 중 하나 (없으면 KOALPACA_RETRIEVAL)
+        
+    Returns:
+        search(query, top_k) 메서드를 가진 검색기
+    """
+    mode = mode or KOALPACA_RETRIEVAL
+    if mode not in RETRIEVAL_MODES[1:]:
+        return get_knowledge_index(knowledge_base)
+    
+    # csv_data는 항목에 함께 보관하므로 id가 다른 데이터프레임에 재사용되지 않음
+    key = (mode, knowledge_base, id(csv_data))
+    with _retrievers_lock:
+        entry = _retrievers.get(key)
+        if entry is not None and entry[0] is csv_data:
+            return entry[1]
+    
+    documents = chunk_knowledge_base(knowledge_base)
+    documents += [Chunk(text, None, estimate_chunk_tokens(text)) for text in describe_soil_types(csv_data)]
+    try:
+        encoder = get_encoder(KOALPACA_EMBEDDING_MODEL)
+        index = load_or_build_index([document.text for document in documents], encoder, KOALPACA_EMBEDDING_DTYPE)
+        retriever = DenseRetriever(documents, index, encoder)
+        if mode == "hybrid":
+            retriever = HybridRetriever(KnowledgeIndex(documents), retriever)
+        _retrieval_status.update(mode=mode, documents=len(documents), error=None)
+    except Exception as e:
+        retriever = get_knowledge_index(knowledge_base)
+        _retrieval_status.update(mode="bm25", documents=None, error=f"{mode} 검색 사용 불가: {e}")
+    
+    with _retrievers_lock:
+        # 지식 베이스 버전은 몇 개만 유지
+        while len(_retrievers) >= 4:
+            _retrievers.pop(next(iter(_retrievers)))
+        _retrievers[key] = (csv_data, retriever)
+    return retriever
+
+def get_retrieval_status():
+    """현재 문서 검색 방식 (mode, documents, error)"""
+    return dict(_retrieval_status)
+
+def context_sections_koalpaca(user_query, knowledge_base, csv_data=None, profile=None, region_index=None,
+                              query_engine=None, intents=None):
+    """
+    KoAlpaca 모델용 컨텍스트를 출처별 조각으로 생성 (프롬프트 토큰 예산 배분용)
     
     Args:
         user_query (str): 사용자 질문
         knowledge_base (str): 추출된 문서 텍스트
         csv_data (pandas.DataFrame, optional): 처리된 CSV 데이터
+        profile (DatasetProfile, optional): csv_data의 사전 계산된 통계 (없으면 매번 계산)
+        region_index (RegionIndex, optional): csv_data의 행정구역별 토양 분포 (없으면 매번 계산)
+        query_engine (SoilQueryEngine, optional): csv_data의 속성 조건 검색기 (없으면 매번 생성)
+        intents (list, optional): route_query 결과 (없으면 여기서 계산)
         
     Returns:
-        str: 생성된 컨텍스트
+        list: ContextSection 목록 (프롬프트에 들어갈 순서; score는 질문과의 관련도)
     """
-    # 초기 컨텍스트
-    context = ""
-    
-    # 토색 관련 질문인지 확인
-    if "토색" in user_query.lower() or "흙 색깔" in user_query.lower() or "토양 색" in user_query.lower():
-        context = """
-토색(Soil Color)은 토양의 색깔을 의미합니다. 토양의 색은 유기물 함량, 광물질, 배수 상태 등 토양의 특성을 반영합니다.
-주요 토색과 의미:
-- 검은색/짙은 갈색: 유기물 함량이 높음
-- 붉은색/적갈색: 철 산화물 함량이 높음, 배수 양호
-- 회색/청회색: 환원 상태, 배수 불량
-- 황갈색: 배수 양호, 철 화합물 함유
-- 밝은 색/회백색: 규소, 점토, 탄산염, 석고 등 함유
-"""
-    # 토양통 관련 질문인지 확인
-    elif "토양통" in user_query.lower() or "석천" in user_query.lower() or "남계" in user_query.lower() or "고천" in user_query.lower():
-        context = """
-토양통은 토양 분류의 기본 단위로, 같은 특성을 가진 토양을 하나의 그룹으로 분류한 것입니다.
-완주군 지역에는 석천, 남계, 고천 등의 토양통이 분포합니다.
-- 석천: 양토, 사양질, 배수 양호, 산성암 기원
-- 남계: 사양토, 사질, 배수 양호, 변성암 기원
-- 고천: 사양토, 사양질, 배수 매우양호, 변성암 기원
-"""
-    # 토성 관련 질문인지 확인
-    elif "토성" in user_query.lower() or "양토" in user_query.lower() or "사양토" in user_query.lower():
-        context = """
-토성은 토양의 물리적 특성으로, 모래, 미사, 점토의 비율에 따라 결정됩니다.
-주요 토성:
-- 사토: 모래 함량 높음, 배수 양호, 보수력 낮음
-- 양토: 모래, 미사, 점토 균형적 분포, 이상적 토양
-- 식토: 점토 함량 높음, 배수 불량, 보수력 높음
-- 사양토: 모래가 많은 양토, 배수 양호
-"""
-    # 주소 관련 질문인지 확인
-    elif "완주" in user_query.lower() or "삼례" in user_query.lower() or "주소" in user_query.lower():
-        context = """
-완주군은 전라북도에 위치한 지역으로, 다양한 토양 특성을 가지고 있습니다.
-삼례읍의 토양은 주로 석천, 남계, 고천 토양통으로 구성되어 있으며, 
-대체로 사양토에서 양토의 토성을 가지고 있고 배수 상태는 양호합니다.
-"""
-    # 기본 컨텍스트
-    else:
-        context = """
-토양은 식물이 자라는 기반이 되는 자연체로, 다양한 특성을 가집니다.
-주요 토양 특성에는 토색, 토성, 구조, 배수, 유효토심, 비옥도 등이 있습니다.
-토양은 농업, 환경, 생태계에 중요한 영향을 미치는 자원입니다.
-"""
+    sections = []
+    
+    # 로드 시 계산된 프로파일 사용 (없으면 한 번 계산)
+    if csv_data is not None and profile is None:
+        profile = DatasetProfile.from_dataframe(csv_data)
+    
+    # 질문에 언급된 지역(도/군/읍면/리)의 실제 토양 분포
+    regions = []
+    if csv_data is not None:
+        if region_index is None:
+            region_index = RegionIndex.from_dataframe(csv_data)
+        if region_index is not None:
+            regions = region_index.find(user_query)
+    
+    # 질문 의도 (intents.json의 키워드를 한 번에 매칭, 점수 순)
+    if intents is None:
+        intents = route_query(user_query, profile)
+    intent = intents[0][1] if intents else get_intent_router().default
+    
+    # 지역 관련 질문: 고정 문구 대신 아래에서 데이터 기반 지역 프로필을 추가
+    if not (regions and intent.region_profile) and intent.context:
+        score = CONTEXT_SCORES["topic"] if intents else CONTEXT_SCORES["default_topic"]
+        sections.append(ContextSection("topic", intent.context, score))
+    
+    # 질문에 언급된 지역의 토양 프로필 (사전 집계된 분포, 데이터프레임 재검색 없음)
+    for i, region in enumerate(regions):
+        text = ("\n" if i == 0 else "\n\n") + region.describe() + ("\n" if i == len(regions) - 1 else "")
+        sections.append(ContextSection("region", text, CONTEXT_SCORES["region"]))
     
-    # CSV 데이터에서 관련 정보 추가
+    # 속성 조건(배수등급, 토성, 경사 등)이 있는 질문은 실제 데이터를 필터링한 결과 추가
     if csv_data is not None:
-        context += "\n토양 조사 데이터 요약:\n"
-        context += f"총 레코드 수: {len(csv_data)}\n"
+        if query_engine is None:
+            query_engine = SoilQueryEngine.from_dataframe(csv_data, region_index)
+        query_result = query_engine.query(user_query, regions)
+        if query_result is not None:
+            sections.append(ContextSection("query", "\n" + query_result.describe() + "\n", CONTEXT_SCORES["query"]))
+    
+    # CSV 데이터에서 관련 정보 추가 (로드 시 계산된 프로파일 사용)
+    if csv_data is not None:
+        summary = "\n토양 조사 데이터 요약:\n"
+        summary += f"총 레코드 수: {profile.num_rows}\n"
         
         # 토양통 분포 확인
-        if '토양통명' in csv_data.columns:
-            soil_types = csv_data['토양통명'].value_counts()
-            context += f"주요 토양통: {', '.join(soil_types.index[:3])}\n"
+        if '토양통명' in profile.frequencies:
+            soil_types = [value for value, _ in profile.top_values('토양통명', 3)]
+            summary += f"주요 토양통: {', '.join(soil_types)}\n"
         
         # 토성 분포 확인
-        if '표토토성' in csv_data.columns:
-            texture_types = csv_data['표토토성'].value_counts()
-            context += f"주요 표토토성: {', '.join(texture_types.index[:3])}\n"
+        if '표토토성' in profile.frequencies:
+            texture_types = [value for value, _ in profile.top_values('표토토성', 3)]
+            summary += f"주요 표토토성: {', '.join(texture_types)}\n"
+        sections.append(ContextSection("csv_summary", summary, CONTEXT_SCORES["csv_summary"]))
     
-    # 현재 문서에서 키워드 검색하여 추가정보 얻기
+    # 현재 문서에서 관련 문단 검색하여 추가정보 얻기 (지식 베이스 버전별로 한 번만 색인)
     if knowledge_base:
-        relevant_snippets = []
-        
-        # 검색 키워드 생성
-        search_terms = []
-        for word in user_query.lower().split():
-            if len(word) > 2:
-                search_terms.append(word)
-        
-        # 특별 키워드
-        if "토색" in user_query.lower():
-            search_terms.extend(["토색", "색깔", "색상"])
-        if "토성" in user_query.lower():
-            search_terms.extend(["토성", "양토", "사토", "점토"])
-            
-        # 문서 내용 검색
-        if search_terms:
-            paragraphs = knowledge_base.split('\n\n')
-            for para in paragraphs:
-                if any(term in para.lower() for term in search_terms):
-                    if len(para) > 20:  # 너무 짧은 문단 제외
-                        relevant_snippets.append(para)
-        
-        # 관련 내용 추가
-        if relevant_snippets:
-            context += "\n\n문서에서 발견된 관련 정보:\n"
-            # 너무 많은 정보가 추가되지 않도록 제한
-            for snippet in relevant_snippets[:3]:
-                context += snippet + "\n\n"
-    
-    return context
-
-def get_chat_response_koalpaca(user_query, knowledge_base, csv_data=None):
+        # 질문 의도별 검색어로 확장
+        search_query = user_query
+        for _, matched in intents:
+            if matched.search_terms:
+                search_query += " " + matched.search_terms
+        
+        # 검색 점수가 높은 순으로 최대 3개 청크 (관련도는 가장 높은 점수 대비 비율)
+        relevant_chunks = get_retriever_koalpaca(knowledge_base, csv_data).search(search_query, top_k=RETRIEVAL_TOP_K)
+        
+        # 관련 내용 추가 (출처 페이지 표시)
+        for chunk_score, chunk in relevant_chunks:
+            text = f"[{chunk.page}쪽] " if chunk.page is not None else ""
+            text += chunk.text + "\n\n"
+            score = CONTEXT_SCORES["retrieval"] * chunk_score / relevant_chunks[0][0]
+            sections.append(ContextSection("retrieval", text, score, header="\n\n문서에서 발견된 관련 정보:\n"))
+    
+    return sections
+
+def create_context_koalpaca(user_query, knowledge_base, csv_data=None, profile=None, region_index=None,
+                            query_engine=None, intents=None):
     """
-    KoAlpaca 모델을 사용하여 채팅 응답 생성
+    KoAlpaca 모델용 컨텍스트 생성 (chatbot.py의 create_context 대체)
     
     Args:
         user_query (str): 사용자 질문
         knowledge_base (str): 추출된 문서 텍스트
         csv_data (pandas.DataFrame, optional): 처리된 CSV 데이터
+        profile (DatasetProfile, optional): csv_data의 사전 계산된 통계 (없으면 매번 계산)
+        region_index (RegionIndex, optional): csv_data의 행정구역별 토양 분포 (없으면 매번 계산)
+        query_engine (SoilQueryEngine, optional): csv_data의 속성 조건 검색기 (없으면 매번 생성)
+        intents (list, optional): route_query 결과 (없으면 여기서 계산)
+        
+    Returns:
+        str: 생성된 컨텍스트 (토큰 예산을 적용하지 않은 전체)
+    """
+    return join_sections(context_sections_koalpaca(
+        user_query, knowledge_base, csv_data, profile, region_index, query_engine, intents
+    ))
+
+def create_conversation_memory():
+    """세션별 대화 기록 생성 (KOALPACA_HISTORY_TURNS, KOALPACA_HISTORY_TOKENS 설정 사용)"""
+    return ConversationMemory(recent_turns=KOALPACA_HISTORY_TURNS, max_tokens=KOALPACA_HISTORY_TOKENS)
+
+def build_prompt_koalpaca(user_query, knowledge_base, csv_data=None, profile=None, region_index=None,
+                          query_engine=None, max_tokens=RESPONSE_MAX_TOKENS, memory=None):
+    """
+    사용자 질문에 대한 KoAlpaca 프롬프트 생성
+    
+    모델의 컨텍스트 길이(model_info의 context_size)에서 응답용 max_tokens와 명령어/질문을 뺀
+    토큰 예산 안에서, 관련도가 높은 컨텍스트 조각부터 채웁니다. 토큰 수는 로드된 토크나이저로
+    세고, 데모 모드에서는 글자 수로 추정합니다.
+    
+    Args:
+        user_query (str): 사용자 질문
+        knowledge_base (str): 추출된 문서 텍스트
+        csv_data (pandas.DataFrame, optional): 처리된 CSV 데이터
+        profile (DatasetProfile, optional): csv_data의 사전 계산된 통계
+        region_index (RegionIndex, optional): csv_data의 행정구역별 토양 분포
+        query_engine (SoilQueryEngine, optional): csv_data의 속성 조건 검색기
+        max_tokens (int): 응답 생성에 남겨 둘 토큰 수
+        memory (ConversationMemory, optional): 이 세션의 이전 대화 (요약과 최근 턴을 프롬프트에 추가)
+        
+    Returns:
+        tuple: (프롬프트, 질문 의도 Intent, 다른 질문과 공유되는 프롬프트 앞부분 목록,
+            토큰 사용량 dict: sources (출처별 토큰), prompt_tokens, budget, dropped)
+    """
+    model_manager = KoAlpacaModelManager.get_instance()
+    
+    # 질문 의도는 한 번만 판별해서 컨텍스트와 응답 생성에 함께 사용
+    context_query = user_query
+    intents = route_query(user_query, profile)
+    
+    # "그럼 배수는?" 같은 후속 질문: 주제나 지역이 없으면 이전 질문과 합쳐서 컨텍스트 검색
+    history = ""
+    if memory is not None and len(memory):
+        memory.set_counter(model_manager.count_tokens)
+        history = memory.render()
+        previous = memory.last_question()
+        if previous and not intents and (region_index is None or not region_index.find(user_query)):
+            context_query = f"{previous} {user_query}"
+            intents = route_query(context_query, profile)
+    
+    # 자체 컨텍스트 생성 함수 사용 (chatbot.py에 대한 의존성 제거)
+    sections = context_sections_koalpaca(context_query, knowledge_base, csv_data, profile, region_index, query_engine, intents)
+    
+    # 명령어와 입력 설정
+    instruction = f"당신은 토양 정보 전문가입니다. 다음 정보를 바탕으로 사용자의 토양 관련 질문에 정확하게 답변해주세요."
+    
+    # 대화 기록은 컨텍스트 뒤에 두어, 그 앞까지의 프롬프트가 세션과 상관없이 공유되게 함
+    def make_prompt(context):
+        input_text = f"""
+컨텍스트 정보:
+{context}
+
+{history + chr(10) if history else ""}사용자 질문: {user_query}
+"""
+        return create_koalpaca_prompt(instruction, input_text)
+    
+    # KoAlpaca 프롬프트 생성 (토큰 예산 안에서 관련도 순으로 컨텍스트 선택, 대화 기록은 예산에서 먼저 뺌)
+    built = build_budgeted_prompt(
+        make_prompt, sections, model_manager.count_tokens, model_manager.context_size(), max_tokens
+    )
+    intent = intents[0][1] if intents else get_intent_router().default
+    prompt = built.prompt
+    
+    # 모든 질문이 공유하는 명령어 블록과 같은 주제의 질문이 공유하는 고정 컨텍스트까지 (KV 캐시 대상)
+    # 대화 기록이 들어간 앞부분은 한 턴에만 쓰이므로 캐시하지 않음
+    instruction_end = prompt.index("### 입력:\n") + len("### 입력:\n")
+    prefixes = [prompt[:instruction_end]]
+    head = prompt[:prompt.index("컨텍스트 정보:\n") + len("컨텍스트 정보:\n")]
+    prefixes.append(head)
+    if intent.context and built.context.startswith(intent.context):
+        prefixes.append(head + intent.context)
+    return prompt, intent, prefixes, built.usage
+
+# 프로세스 전체에서 공유하는 응답 캐시
+_response_cache = None
+if KOALPACA_RESPONSE_CACHE_SIZE > 0:
+    _response_cache = ResponseCache(
+        max_entries=KOALPACA_RESPONSE_CACHE_SIZE,
+        ttl_seconds=KOALPACA_RESPONSE_CACHE_TTL,
+        similarity=KOALPACA_RESPONSE_CACHE_SIMILARITY or None
+    )
+
+def get_response_cache():
+    """응답 캐시 (사용하지 않으면 None; stats()로 적중률 확인)"""
+    return _response_cache
+
+def response_cache_key(user_query, knowledge_base, csv_data=None, profile=None, region_index=None,
+                       query_engine=None, memory=None):
+    """
+    응답 캐시의 버전과 질문 서명
+    
+    버전은 모델과 지식 베이스(문자열 해시는 객체에 저장되므로 재계산 없음), CSV 내용의 SHA-256으로 정하고,
+    서명은 질문에 나온 키워드(토양통명 등), 지역, 속성 조건입니다. 서명이 다른 질문은
+    비슷해 보여도 ("석천 토양통" / "남계 토양통") 같은 응답을 쓰지 않습니다.
+    키워드도 지역도 없는 후속 질문("그럼 배수는?")은 이전 대화에 따라 뜻이 달라지므로
+    대화 기록도 버전에 포함합니다.
+    
+    Returns:
+        tuple: (버전, 서명)
+    """
+    model_manager = KoAlpacaModelManager.get_instance()
+    version = (
+        model_manager.model_name, model_manager.demo_mode,
+        len(knowledge_base), hash(knowledge_base),
+        None if csv_data is None else dataframe_digest(csv_data)
+    )
+    
+    column_values = profile.frequencies if profile is not None else None
+    keywords = tuple(sorted(set(get_intent_router(column_values).keywords(user_query))))
+    regions = tuple(region.full_name for region in region_index.find(user_query)) if region_index is not None else ()
+    constraints = ()
+    if query_engine is not None:
+        constraints = tuple(sorted((col, tuple(values)) for col, values in query_engine.parse(user_query).items()))
+    if memory is not None and len(memory) and not keywords and not regions:
+        version += (memory.fingerprint(),)
+    return version, (keywords, regions, constraints)
+
+def get_chat_response_koalpaca(user_query, knowledge_base, csv_data=None, profile=None, region_index=None,
+                               query_engine=None, memory=None):
+    """
+    KoAlpaca 모델을 사용하여 채팅 응답 생성 (stream_chat_response_koalpaca의 조각을 모아 반환)
+    
+    Args:
+        user_query (str): 사용자 질문
+        knowledge_base (str): 추출된 문서 텍스트
+        csv_data (pandas.DataFrame, optional): 처리된 CSV 데이터
+        profile (DatasetProfile, optional): csv_data의 사전 계산된 통계
+        region_index (RegionIndex, optional): csv_data의 행정구역별 토양 분포
+        query_engine (SoilQueryEngine, optional): csv_data의 속성 조건 검색기
+        memory (ConversationMemory, optional): 이 세션의 대화 기록 (프롬프트에 추가하고 응답 후 이번 턴 기록)
         
     Returns:
         str: 챗봇 응답
     """
+    with st.spinner("KoAlpaca 모델이 응답을 생성하는 중..."):
+        return "".join(stream_chat_response_koalpaca(
+            user_query, knowledge_base, csv_data, profile, region_index, query_engine, memory
+        ))
+
+def stream_chat_response_koalpaca(user_query, knowledge_base, csv_data=None, profile=None, region_index=None,
+                                  query_engine=None, memory=None):
+    """
+    KoAlpaca 모델의 채팅 응답을 생성되는 대로 반환 (get_chat_response_koalpaca의 스트리밍 버전)
+    
+    응답이 끝나면 전체 시간과 첫 조각까지의 시간(TTFT)을 st.session_state.response_time에 기록합니다.
+    
+    Args:
+        user_query (str): 사용자 질문
+        knowledge_base (str): 추출된 문서 텍스트
+        csv_data (pandas.DataFrame, optional): 처리된 CSV 데이터
+        profile (DatasetProfile, optional): csv_data의 사전 계산된 통계
+        region_index (RegionIndex, optional): csv_data의 행정구역별 토양 분포
+        query_engine (SoilQueryEngine, optional): csv_data의 속성 조건 검색기
+        memory (ConversationMemory, optional): 이 세션의 대화 기록 (프롬프트에 추가하고 응답 후 이번 턴 기록)
+        
+    Yields:
+        str: 응답 텍스트 조각
+    """
     try:
-        # 모델 관리자 가져오기
         model_manager = KoAlpacaModelManager.get_instance()
         
         # 모델 로드 확인
         if not model_manager.is_loaded:
             if not model_manager.load_model():
-                return "KoAlpaca 모델 로드에 실패했습니다. 다시 시도해주세요."
-
-        # 자체 컨텍스트 생성 함수 사용 (chatbot.py에 대한 의존성 제거)
-        context = create_context_koalpaca(user_query, knowledge_base, csv_data)
+                yield "KoAlpaca 모델 로드에 실패했습니다. 다시 시도해주세요."
+                return
         
-        # 명령어와 입력 설정
-        instruction = f"당신은 토양 정보 전문가입니다. 다음 정보를 바탕으로 사용자의 토양 관련 질문에 정확하게 답변해주세요."
+        # 같은(비슷한) 질문의 응답이 캐시에 있으면 한 번에 반환
+        if _response_cache is not None:
+            start_time = time.perf_counter()
+            version, signature = response_cache_key(user_query, knowledge_base, csv_data, profile, region_index, query_engine, memory)
+            cached = _response_cache.get(version, user_query, signature)
+            if cached is not None:
+                st.session_state.response_time = f"{(time.perf_counter() - start_time) * 1000:.1f} ms (캐시된 응답)"
+                st.session_state.prompt_tokens = None
+                if memory is not None:
+                    memory.add_turn(user_query, cached)
+                yield cached
+                return
         
-        input_text = f"""
-컨텍스트 정보:
-{context}
-
-사용자 질문: {user_query}
-"""
+        prompt, intent, prefixes, token_usage = build_prompt_koalpaca(
+            user_query, knowledge_base, csv_data, profile, region_index, query_engine, memory=memory
+        )
+        st.session_state.prompt_tokens = token_usage
         
-        # KoAlpaca 프롬프트 생성
-        prompt = create_koalpaca_prompt(instruction, input_text)
+        timings = {}
+        pieces = []
+        for piece in model_manager.stream_response(prompt, intent=intent, timings=timings, prefixes=prefixes):
+            pieces.append(piece)
+            yield piece
+        st.session_state.response_time = (
+            f"{timings['total_seconds']:.2f} 초 (첫 토큰 {timings['ttft_seconds']:.2f} 초)"
+            + (" (데모 모드)" if model_manager.demo_mode else "")
+        )
+        if "queue_seconds" in timings:
+            st.session_state.response_time += (
+                f" (대기 {timings['queue_seconds']:.2f} 초, 생성 {timings['compute_seconds']:.2f} 초,"
+                f" 배치 {timings['batch_size']}개)"
+            )
         
-        # 응답 생성
-        with st.spinner("KoAlpaca 모델이 응답을 생성하는 중..."):
-            response = model_manager.generate_response(prompt)
-            
-        return response
+        if not timings.get("error"):
+            response = "".join(pieces)
+            if _response_cache is not None:
+                _response_cache.put(version, user_query, response, signature)
+            if memory is not None:
+                memory.add_turn(user_query, response)
             
     except Exception as e:
-        return f"죄송합니다, 오류가 발생했습니다: {str(e)}. 나중에 다시 시도해주세요."
\ No newline at end of file
+        yield f"죄송합니다, 오류가 발생했습니다: {str(e)}. 나중에 다시 시도해주세요."
@@ -1,73 +1,375 @@
 from pypdf import PdfReader
+import gzip
+import hashlib
+import json
 import os
 import re
+import tempfile
+import threading
 import streamlit as st
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def extract_text_from_pdf(pdf_path):
+# Documents with fewer pages than this are always extracted serially,
+# since starting worker processes would cost more than it saves
+MIN_PAGES_FOR_PARALLEL = 16
+
+# Number of page ranges handed to each worker, so progress is reported
+# in reasonably small steps and slow pages do not leave workers idle
+RANGES_PER_WORKER = 4
+
+# Worker processes for PDFs uploaded during a session, capped so one upload
+# does not take every CPU away from the model and the other sessions
+UPLOAD_WORKERS = min(4, os.cpu_count() or 1)
+
+# Part of the cache key; bump whenever extraction or clean_text changes their output
+EXTRACTOR_VERSION = "2"
+
+# On-disk cache of per-page cleaned text
+PDF_CACHE_DIR = os.environ.get("PDF_TEXT_CACHE_DIR", os.path.join(".cache", "pdf_text"))
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_TEXT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+class PageTextCache:
+    """
+    Disk cache of cleaned per-page PDF text, keyed by the PDF's SHA-256 and EXTRACTOR_VERSION.
+    Entries are gzipped JSON-lines files (a header line, then one page per line), so pages can be
+    streamed in and out one at a time. The file mtime is refreshed on every hit and the least
+    recently used entries are evicted once the directory grows past max_bytes.
+    """
+    
+    def __init__(self, cache_dir=PDF_CACHE_DIR, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._lock = threading.Lock()
+    
+    def _entry_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}-v{EXTRACTOR_VERSION}.jsonl.gz")
+    
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+    
+    def open(self, digest):
+        """
+        Look up the pages of a PDF.
+        
+        Args:
+            digest (str): SHA-256 of the PDF content
+            
+        Returns:
+            tuple or None: (number of pages, iterator over cleaned page texts), or None on a miss
+        """
+        path = self._entry_path(digest)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                header = json.loads(file.readline())
+            num_pages = header["num_pages"]
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            self._count("misses")
+            return None
+        
+        self._count("hits")
+        
+        # The file is opened only once iteration starts, so an iterator that is closed
+        # (or dropped) before its first page holds no file handle
+        def pages():
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                file.readline()
+                for line in file:
+                    yield json.loads(line)
+        
+        return num_pages, pages()
+    
+    def writer(self, digest, num_pages):
+        """
+        Start writing the pages of a PDF.
+        
+        Args:
+            digest (str): SHA-256 of the PDF content
+            num_pages (int): Number of pages that will be written
+            
+        Returns:
+            PageCacheWriter: Writer whose entry becomes visible only once every page was written
+        """
+        return PageCacheWriter(self, self._entry_path(digest), num_pages)
+    
+    def _evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".jsonl.gz")]
+        except OSError:
+            return
+        
+        # Oldest access first
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries)
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self._count("evictions")
+
+class PageCacheWriter:
+    """
+    Streams pages into a temporary cache file and publishes it atomically when complete.
+    Failures are ignored; the cache is only an optimization.
+    """
+    
+    def __init__(self, cache, path, num_pages):
+        self.cache = cache
+        self.path = path
+        self.num_pages = num_pages
+        self.pages_written = 0
+        self.tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(cache.cache_dir, exist_ok=True)
+            self.file = gzip.open(self.tmp_path, 'wt', encoding='utf-8')
+            self.file.write(json.dumps({"version": EXTRACTOR_VERSION, "num_pages": num_pages}) + "\n")
+        except OSError:
+            self.file = None
+    
+    def write(self, page_text):
+        """Append the cleaned text of the next page; the entry is published after the last one."""
+        if self.file is None:
+            return
+        try:
+            self.file.write(json.dumps(page_text, ensure_ascii=False) + "\n")
+            self.pages_written += 1
+            if self.pages_written == self.num_pages:
+                self.file.close()
+                self.file = None
+                os.replace(self.tmp_path, self.path)
+                self.cache._count("writes")
+                self.cache._evict()
+        except OSError:
+            self.discard()
+    
+    def discard(self):
+        """Drop an unfinished entry (e.g. when the consumer stopped reading early)."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+page_cache = PageTextCache()
+
+def get_pdf_cache_stats():
+    """
+    Get hit/miss counters of the PDF text cache.
+    
+    Returns:
+        dict: Counts of hits, misses, writes and evictions since the process started
+    """
+    with page_cache._lock:
+        return dict(page_cache.stats)
+
+def _open_reader(source):
+    """Open a PdfReader from a file path or from PDF bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        return PdfReader(BytesIO(source))
+    return PdfReader(source)
+
+def _source_digest(source):
+    """SHA-256 of a PDF given as a path or as bytes."""
+    sha256 = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray)):
+        sha256.update(source)
+    else:
+        with open(source, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                sha256.update(block)
+    return sha256.hexdigest()
+
+def _clean_page(page_text):
+    """Clean a page's raw text; pages without text become empty strings."""
+    return clean_text(page_text) if page_text else ""
+
+def format_page(page_number, page_text):
+    """
+    Add the "--- Page N ---" marker to a cleaned page.
+    
+    Args:
+        page_number (int): Page number, starting at 1
+        page_text (str): Cleaned page text
+        
+    Returns:
+        str: Marked page text, or "" for pages without text
+    """
+    if not page_text:
+        return ""
+    return f"\n--- Page {page_number} ---\n{page_text}\n"
+
+def _extract_page_range(source, start, end):
+    """
+    Extract and clean pages [start, end) of a PDF. Runs in a worker process,
+    so it opens its own reader and must not call any Streamlit functions.
+    """
+    reader = _open_reader(source)
+    return [_clean_page(reader.pages[page_num].extract_text()) for page_num in range(start, end)]
+
+def _iter_extracted_pages(source, reader, workers):
+    """Yield the cleaned text of every page in order, decoding serially or in worker processes."""
+    num_pages = len(reader.pages)
+    
+    # Serial path
+    if workers <= 1 or num_pages < MIN_PAGES_FOR_PARALLEL:
+        for page_num in range(num_pages):
+            yield _clean_page(reader.pages[page_num].extract_text())
+        return
+    
+    # Parallel path: split the pages into contiguous ranges and extract them in worker processes.
+    # Ranges finish out of order, so finished ones wait in `done` until all earlier ranges are yielded.
+    num_ranges = min(num_pages, workers * RANGES_PER_WORKER)
+    bounds = [num_pages * i // num_ranges for i in range(num_ranges + 1)]
+    ranges = list(zip(bounds[:-1], bounds[1:]))
+    done = {}
+    next_range = 0
+    
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {
+            executor.submit(_extract_page_range, source, start, end): i
+            for i, (start, end) in enumerate(ranges)
+        }
+        for future in as_completed(futures):
+            done[futures[future]] = future.result()
+            while next_range in done:
+                yield from done.pop(next_range)
+                next_range += 1
+    finally:
+        # Stop outstanding work if the consumer closed the generator early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def iter_pdf_pages(source, workers=1, progress_callback=None, use_cache=True):
+    """
+    Stream the cleaned text of a PDF page by page, as pages are decoded.
+    Only the pages not yet consumed are held in memory (plus, in parallel mode,
+    ranges that finished ahead of an earlier one).
+    
+    Args:
+        source (str or bytes): Path to the PDF file or PDF content as bytes
+        workers (int, optional): Number of worker processes; None uses every CPU, 1 extracts serially
+        progress_callback (callable, optional): Called as progress_callback(pages_done, total_pages)
+        use_cache (bool): Whether to use the on-disk page cache keyed by the PDF's SHA-256
+        
+    Yields:
+        tuple: (page_number, cleaned_text), page numbers starting at 1; pages without text yield ""
+    """
+    digest = _source_digest(source) if use_cache else None
+    cached = page_cache.open(digest) if use_cache else None
+    
+    cache_writer = None
+    if cached is not None:
+        num_pages, pages = cached
+    else:
+        reader = _open_reader(source)
+        num_pages = len(reader.pages)
+        pages = _iter_extracted_pages(source, reader, workers or os.cpu_count() or 1)
+        if use_cache:
+            cache_writer = page_cache.writer(digest, num_pages)
+    
+    try:
+        for page_num, page_text in enumerate(pages):
+            if cache_writer:
+                cache_writer.write(page_text)
+            if progress_callback:
+                progress_callback(page_num + 1, num_pages)
+            yield page_num + 1, page_text
+    finally:
+        if cache_writer:
+            cache_writer.discard()
+        pages.close()
+
+def _extract_text(source, workers=1, progress_callback=None, use_cache=True, page_callback=None):
+    """Join the streamed pages of a PDF with their "--- Page N ---" markers."""
+    parts = []
+    for page_number, page_text in iter_pdf_pages(source, workers, progress_callback, use_cache):
+        parts.append(format_page(page_number, page_text))
+        if page_callback:
+            page_callback(page_number, parts[-1])
+    return "".join(parts)
+
+def extract_text_from_pdf(pdf_path, workers=1, progress_callback=None, use_cache=True, page_callback=None):
     """
     Extract text from a PDF file.
     
     Args:
         pdf_path (str): Path to the PDF file
+        workers (int, optional): Number of worker processes; None uses every CPU, 1 extracts serially
+        progress_callback (callable, optional): Called as progress_callback(pages_done, total_pages)
+        use_cache (bool): Whether to use the on-disk page cache keyed by the PDF's SHA-256
+        page_callback (callable, optional): Called as page_callback(page_number, marked_text)
+            as each page is extracted, e.g. to preview the text before the whole PDF is done
         
     Returns:
         str: Extracted text from the PDF
     """
     try:
-        text = ""
-        with open(pdf_path, 'rb') as file:
-            reader = PdfReader(file)
-            num_pages = len(reader.pages)
-            
-            # Extract text from each page
-            for page_num in range(num_pages):
-                page = reader.pages[page_num]
-                page_text = page.extract_text()
-                
-                if page_text:
-                    # Clean up text
-                    page_text = clean_text(page_text)
-                    text += f"\n--- Page {page_num+1} ---\n{page_text}\n"
-        
-        return text
+        return _extract_text(pdf_path, workers, progress_callback, use_cache, page_callback)
     except Exception as e:
         st.error(f"Error extracting text from PDF: {str(e)}")
         return ""
 
-def extract_text_from_pdf_bytes(pdf_bytes):
+def extract_text_from_pdf_bytes(pdf_bytes, workers=1, progress_callback=None, use_cache=True, page_callback=None):
     """
     Extract text from PDF bytes.
     
     Args:
         pdf_bytes (bytes): PDF content as bytes
+        workers (int, optional): Number of worker processes; None uses every CPU, 1 extracts serially
+        progress_callback (callable, optional): Called as progress_callback(pages_done, total_pages)
+        use_cache (bool): Whether to use the on-disk page cache keyed by the PDF's SHA-256
+        page_callback (callable, optional): Called as page_callback(page_number, marked_text)
+            as each page is extracted, e.g. to preview the text before the whole PDF is done
         
     Returns:
         str: Extracted text from the PDF
     """
     try:
-        text = ""
-        reader = PdfReader(BytesIO(pdf_bytes))
-        num_pages = len(reader.pages)
-        
-        # Extract text from each page
-        for page_num in range(num_pages):
-            page = reader.pages[page_num]
-            page_text = page.extract_text()
-            
-            if page_text:
-                # Clean up text
-                page_text = clean_text(page_text)
-                text += f"\n--- Page {page_num+1} ---\n{page_text}\n"
-        
-        return text
+        return _extract_text(pdf_bytes, workers, progress_callback, use_cache, page_callback)
     except Exception as e:
         st.error(f"Error extracting text from PDF bytes: {str(e)}")
         return ""
 
+def extract_text_from_upload(uploaded_file, workers=UPLOAD_WORKERS, progress_callback=None, use_cache=True,
+                             page_callback=None):
+    """
+    Extract text from an uploaded PDF. The upload is written to a temporary file first,
+    so worker processes open the file by path instead of each receiving a copy of its bytes.
+    
+    Args:
+        uploaded_file: Streamlit UploadedFile object (or any object with getbuffer())
+        workers (int, optional): Number of worker processes; None uses every CPU, 1 extracts serially
+        progress_callback (callable, optional): Called as progress_callback(pages_done, total_pages)
+        use_cache (bool): Whether to use the on-disk page cache keyed by the PDF's SHA-256
+        page_callback (callable, optional): Called as page_callback(page_number, marked_text)
+            as each page is extracted
+        
+    Returns:
+        str: Extracted text from the PDF
+    """
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as file:
+            file.write(uploaded_file.getbuffer())
+    except OSError as e:
+        st.error(f"Error extracting text from PDF bytes: {str(e)}")
+        return ""
+    try:
+        return extract_text_from_pdf(file.name, workers, progress_callback, use_cache, page_callback)
+    finally:
+        os.remove(file.name)
+
 def clean_text(text):
     """
     Clean extracted text by removing extra whitespace and normalizing line breaks.
+    Line and paragraph breaks are kept so the text can be chunked along them.
     
     Args:
         text (str): Raw text extracted from PDF
@@ -75,11 +377,12 @@ def clean_text(text):
     Returns:
         str: Cleaned text
     """
-    # Replace multiple spaces with a single space
-    text = re.sub(r'\s+', ' ', text)
+    # Replace runs of spaces and tabs with a single space, keeping line breaks
+    text = re.sub(r'[^\S\n]+', ' ', text)
     
-    # Remove extra line breaks
-    text = re.sub(r'\n\s*\n', '\n\n', text)
+    # Remove spaces around line breaks and collapse blank-line runs to one paragraph break
+    text = re.sub(r' *\n *', '\n', text)
+    text = re.sub(r'\n{2,}', '\n\n', text)
     
     # Trim leading/trailing whitespace
     text = text.strip()
@@ -0,0 +1,123 @@
+import threading
+from collections import OrderedDict
+
+# Memory cap of the cached attention states (bytes)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class PrefixCache:
+    """
+    LRU cache of model state for prompt prefixes, keyed by the prefix's token IDs.
+
+    Values are opaque (e.g. a transformers past_key_values object); size_of measures each
+    one, and the least recently used entries are evicted once the total exceeds max_bytes.
+    """
+
+    def __init__(self, size_of, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Create an empty cache.
+
+        Args:
+            size_of (callable): value -> size in bytes
+            max_bytes (int): Memory cap; a single value larger than this is not cached
+        """
+        self.size_of = size_of
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, token_ids):
+        """
+        Get the value cached for exactly these token IDs.
+
+        Args:
+            token_ids (sequence of int): Prefix tokens
+
+        Returns:
+            The cached value, or None
+        """
+        key = tuple(token_ids)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def longest_prefix(self, token_ids):
+        """
+        Find the longest cached prefix of a token sequence (shorter than the sequence itself).
+
+        Args:
+            token_ids (sequence of int): Prompt tokens
+
+        Returns:
+            tuple: (prefix length, value), or (0, None) if no cached prefix matches
+        """
+        token_ids = tuple(token_ids)
+        with self._lock:
+            best = None
+            for key in self._entries:
+                if len(key) < len(token_ids) and (best is None or len(key) > len(best)) \
+                        and token_ids[:len(key)] == key:
+                    best = key
+            if best is None:
+                self.misses += 1
+                return 0, None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return len(best), self._entries[best][0]
+
+    def put(self, token_ids, value):
+        """
+        Cache a value for these token IDs, evicting least recently used entries to stay under the cap.
+
+        Returns:
+            bool: Whether the value was cached
+        """
+        key = tuple(token_ids)
+        size = self.size_of(value)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.num_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.num_bytes += size
+            while self.num_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.num_bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        """Drop every entry (e.g. after a different model is loaded)."""
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+
+    def stats(self):
+        """
+        Report the cache's size and hit counts.
+
+        Returns:
+            dict: entries, bytes, hits, misses, evictions
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.num_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
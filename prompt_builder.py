@@ -0,0 +1,132 @@
+from typing import NamedTuple
+
+
+class ContextSection(NamedTuple):
+    """One piece of prompt context and how relevant it is to the question."""
+    source: str
+    text: str
+    score: float
+    # Emitted once before the first selected section of the same source
+    header: str = ""
+
+class PromptBuild(NamedTuple):
+    """A prompt fitted to the model's context window, with the tokens each source used."""
+    prompt: str
+    context: str
+    sections: list
+    usage: dict
+
+def estimate_tokens(text):
+    """
+    Rough token count for when no tokenizer is loaded (demo mode).
+    Subword tokenizers of Korean models produce about one token per two characters.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated number of tokens
+    """
+    return (len(text) + 1) // 2
+
+def join_sections(sections):
+    """
+    Concatenate sections in the given order, writing each source's header once.
+
+    Args:
+        sections (list): ContextSection objects
+
+    Returns:
+        str: Context text
+    """
+    parts = []
+    seen = set()
+    for section in sections:
+        if section.header and section.source not in seen:
+            parts.append(section.header)
+        seen.add(section.source)
+        parts.append(section.text)
+    return "".join(parts)
+
+def _section_costs(sections, count_tokens):
+    """Tokens of each section, with its source's header charged to the first one."""
+    costs = []
+    seen = set()
+    for section in sections:
+        cost = count_tokens(section.text)
+        if section.header and section.source not in seen:
+            cost += count_tokens(section.header)
+        seen.add(section.source)
+        costs.append(cost)
+    return costs
+
+def fit_sections(sections, budget, count_tokens):
+    """
+    Choose sections greedily by score until the token budget is spent.
+    A section that does not fit is skipped and smaller, less relevant ones may still be added.
+
+    Args:
+        sections (list): ContextSection objects, in the order they appear in the prompt
+        budget (int): Tokens available for the context
+        count_tokens (callable): text -> number of tokens
+
+    Returns:
+        list: The chosen sections, in their original order
+    """
+    chosen = set()
+    charged = set()
+    used = 0
+    # Highest score first; ties keep the prompt order
+    for i in sorted(range(len(sections)), key=lambda i: -sections[i].score):
+        section = sections[i]
+        cost = count_tokens(section.text)
+        if section.header and section.source not in charged:
+            cost += count_tokens(section.header)
+        if used + cost <= budget:
+            chosen.add(i)
+            charged.add(section.source)
+            used += cost
+    return [sections[i] for i in sorted(chosen)]
+
+def build_budgeted_prompt(make_prompt, sections, count_tokens, context_size, max_tokens):
+    """
+    Build a prompt whose context fits the model's window after reserving room for the answer.
+
+    The tokens left after the instruction, question and max_tokens are filled greedily by
+    section score. The full prompt is then counted once more, since tokens can merge across
+    section boundaries, and the lowest-scoring sections are dropped until it fits.
+
+    Args:
+        make_prompt (callable): context text -> full prompt
+        sections (list): ContextSection objects, in prompt order
+        count_tokens (callable): text -> number of tokens
+        context_size (int): Model context window, in tokens
+        max_tokens (int): Tokens reserved for the answer
+
+    Returns:
+        PromptBuild: Prompt, context, chosen sections and usage
+            (sources: source -> tokens, prompt_tokens, budget, dropped)
+    """
+    limit = context_size - max_tokens
+    budget = max(0, limit - count_tokens(make_prompt("")))
+    chosen = fit_sections(sections, budget, count_tokens)
+
+    context = join_sections(chosen)
+    prompt = make_prompt(context)
+    prompt_tokens = count_tokens(prompt)
+    while prompt_tokens > limit and chosen:
+        chosen.remove(min(chosen, key=lambda section: section.score))
+        context = join_sections(chosen)
+        prompt = make_prompt(context)
+        prompt_tokens = count_tokens(prompt)
+
+    sources = {}
+    for section, cost in zip(chosen, _section_costs(chosen, count_tokens)):
+        sources[section.source] = sources.get(section.source, 0) + cost
+    usage = {
+        "sources": sources,
+        "prompt_tokens": prompt_tokens,
+        "budget": limit,
+        "dropped": len(sections) - len(chosen),
+    }
+    return PromptBuild(prompt, context, chosen, usage)
@@ -0,0 +1,257 @@
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from address_index import ADDRESS_LEVELS, factorize_regions, find_address_column
+
+# Levels of the region tree: 도 -> 시/군 -> 읍/면 -> 리 (lot numbers are not regions)
+REGION_LEVELS = ADDRESS_LEVELS[:4]
+
+# Soil attributes whose distribution is precomputed for every region
+PROFILE_COLUMNS = ["토양통명", "표토토성", "배수등급", "경사", "유효토심"]
+
+# Administrative suffixes that may be left out in a question ("삼례" for 삼례읍)
+_REGION_SUFFIXES = ("특별자치시", "특별시", "광역시", "도", "시", "군", "구", "읍", "면", "동", "리", "가")
+
+_QUERY_WORD_RE = re.compile(r'[가-힣A-Za-z0-9]+')
+
+
+class RegionNode:
+    """
+    One administrative region with the soil attribute distributions of all rows inside it.
+    """
+
+    def __init__(self, name, level, path, parent=None):
+        self.name = name
+        self.level = level
+        self.path = path
+        self.parent = parent
+        self.children = {}
+        self.num_rows = 0
+        self.distributions = {}
+
+    @property
+    def full_name(self):
+        """Names from the 도 down to this region, e.g. "전라북도 완주군 삼례읍"."""
+        return " ".join(self.path)
+
+    def ancestors(self):
+        """This region and every region containing it, narrowest first."""
+        node = self
+        while node is not None:
+            yield node
+            node = node.parent
+
+    def top_values(self, col, n=3):
+        """
+        Most frequent values of a profiled column in this region.
+
+        Args:
+            col (str): One of the profiled columns
+            n (int): Number of values
+
+        Returns:
+            list: (value, count) tuples, most frequent first
+        """
+        return self.distributions.get(col, Counter()).most_common(n)
+
+    def describe(self, n=3):
+        """
+        Describe the region's soil in Korean, with the share of each top value.
+
+        Args:
+            n (int): Values listed per column
+
+        Returns:
+            str: Profile text for the model context
+        """
+        lines = [f"{self.full_name or '전체 지역'} 토양 프로필 (필지 {self.num_rows:,}개):"]
+        for col, counts in self.distributions.items():
+            values = ", ".join(
+                f"{value} {count / self.num_rows:.0%}" for value, count in counts.most_common(n)
+            )
+            lines.append(f"- {col}: {values}")
+        if self.children:
+            largest = sorted(self.children.values(), key=lambda child: -child.num_rows)[:5]
+            lines.append(f"- 하위 지역: {', '.join(f'{child.name}({child.num_rows:,})' for child in largest)}")
+        return "\n".join(lines)
+
+class RegionIndex:
+    """
+    Tree of the administrative regions found in the address column (도 -> 시/군 -> 읍/면 -> 리).
+
+    Every node holds precomputed distributions of the soil attributes in PROFILE_COLUMNS, so
+    a region mentioned in a question is answered from its node without touching the dataframe.
+    Region names (and their stems without the 읍/면/리 suffix) map to nodes through a dictionary.
+    """
+
+    def __init__(self):
+        self.root = RegionNode("", None, ())
+        self._by_name = {}
+        # Narrowest region of every row of the indexed dataframe, as positions in self.leaves
+        self.row_leaves = np.empty(0, dtype=np.int64)
+        self.leaves = []
+
+    @classmethod
+    def from_dataframe(cls, df, column=None, profile_columns=PROFILE_COLUMNS):
+        """
+        Build the region tree of a soil dataframe.
+        Each distinct region is parsed once, counts are computed per 리 with one groupby
+        per column, and every region above a 리 sums the counts of its children.
+
+        Args:
+            df (pandas.DataFrame): The CSV data
+            column (str, optional): Address column; detected automatically if omitted
+            profile_columns (list): Columns whose distributions are kept
+
+        Returns:
+            RegionIndex or None: The index, or None if the dataframe has no address column
+        """
+        if df is None:
+            return None
+        column = column or find_address_column(df)
+        if column is None:
+            return None
+
+        index = cls()
+        codes, regions = factorize_regions(df[column].to_numpy())
+        paths = [tuple((level, parts[level]) for level in REGION_LEVELS if parts[level]) for parts in regions]
+
+        # Rows are grouped by their narrowest region (usually the 리)
+        leaf_codes, leaf_paths = pd.factorize(pd.Series(paths, dtype=object))
+        row_leaves = leaf_codes[codes] if len(codes) else np.empty(0, dtype=np.int64)
+        leaves = [index._add_path(path) for path in leaf_paths]
+        index.row_leaves = row_leaves
+        index.leaves = leaves
+
+        leaf_rows = np.bincount(row_leaves, minlength=len(leaves))
+        for leaf, num_rows in zip(leaves, leaf_rows.tolist()):
+            for node in leaf.ancestors():
+                node.num_rows += num_rows
+
+        for col in profile_columns:
+            if col not in df.columns:
+                continue
+            # Missing values (unknown ordinal levels) are not counted
+            values = df[col].astype(str).where(df[col].notna())
+            counts = df.groupby([row_leaves, values], observed=True, sort=False).size()
+            for (leaf_id, value), count in counts.items():
+                for node in leaves[leaf_id].ancestors():
+                    node_counts = node.distributions.setdefault(col, Counter())
+                    node_counts[value] += count
+
+        # Keep the columns in PROFILE_COLUMNS order on every node
+        for node in index.nodes():
+            node.distributions = {col: node.distributions[col] for col in profile_columns if col in node.distributions}
+
+        # Soil attribute values that are also region stems ("고천" 토양통 / 고천리) need the suffix
+        index.reserve(value for node in index.root.children.values()
+                      for counts in node.distributions.values() for value in counts)
+        return index
+
+    def reserve(self, words):
+        """
+        Stop suffix-less stems from matching regions when the stem is also another kind of term,
+        such as a soil series name: "고천 토양통" is not about 고천리, while "고천리" still is.
+
+        Args:
+            words (iterable of str): Terms that must not be read as region stems
+        """
+        for word in set(words):
+            nodes = self._by_name.get(word)
+            if nodes is None:
+                continue
+            exact = [node for node in nodes if node.name == word]
+            if exact:
+                self._by_name[word] = exact
+            else:
+                del self._by_name[word]
+
+    def _add_path(self, path):
+        """Create the nodes along a ((level, name), ...) path and return the last one."""
+        node = self.root
+        names = []
+        for level, name in path:
+            names.append(name)
+            child = node.children.get(name)
+            if child is None:
+                child = RegionNode(name, level, tuple(names), parent=node)
+                node.children[name] = child
+                self._register(name, child)
+            node = child
+        return node
+
+    def _register(self, name, node):
+        """Map a region's name, and its stem without the administrative suffix, to the node."""
+        self._by_name.setdefault(name, []).append(node)
+        for suffix in _REGION_SUFFIXES:
+            stem = name[:-len(suffix)]
+            if name.endswith(suffix) and len(stem) >= 2:
+                self._by_name.setdefault(stem, []).append(node)
+                break
+
+    def nodes(self):
+        """Iterate over every region, parents before children."""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.children.values())
+
+    def node(self, *names):
+        """
+        Get a region by its names from the 도 down, e.g. node("전라북도", "완주군", "삼례읍").
+
+        Returns:
+            RegionNode or None: The region, or None if it does not exist
+        """
+        node = self.root
+        for name in names:
+            node = node.children.get(name)
+            if node is None:
+                return None
+        return node
+
+    def _mentions(self, query):
+        """(name, candidate regions) for each region name in the query; particles such as 의/은 are ignored."""
+        mentions = []
+        for word in _QUERY_WORD_RE.findall(query):
+            # The longest known name the word starts with ("삼례읍의" -> "삼례읍")
+            for end in range(len(word), 1, -1):
+                candidates = self._by_name.get(word[:end])
+                if candidates:
+                    mentions.append((word[:end], candidates))
+                    break
+        return mentions
+
+    def find(self, query):
+        """
+        Find the regions a question is about.
+        Each mentioned name is resolved to the region that agrees with the most other mentions
+        (so "완주군 삼례" is 삼례읍 of 완주군), then to an exact rather than a suffix-less name,
+        then to the region with more rows ("삼례" alone is 삼례읍, not 삼례리).
+
+        Args:
+            query (str): User question
+
+        Returns:
+            list: RegionNode objects, one per distinct region mentioned
+        """
+        mentions = self._mentions(query)
+        found = []
+        while mentions:
+            best = None
+            best_key = None
+            for name, candidates in mentions:
+                for node in candidates:
+                    chain = set(map(id, node.ancestors()))
+                    agreed = sum(any(id(other) in chain for other in group) for _, group in mentions)
+                    key = (agreed, node.name == name, node.num_rows)
+                    if best_key is None or key > best_key:
+                        best, best_key = node, key
+            found.append(best)
+            chain = set(map(id, best.ancestors()))
+            mentions = [(name, group) for name, group in mentions if not any(id(other) in chain for other in group)]
+        return found
@@ -0,0 +1,227 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Number of cached answers kept (least recently used are evicted first)
+DEFAULT_MAX_ENTRIES = 512
+
+# Seconds an answer stays valid
+DEFAULT_TTL_SECONDS = 3600
+
+# Minimum Dice similarity of character bigrams for a near-duplicate hit (None disables the tier)
+DEFAULT_SIMILARITY = 0.8
+
+# Question endings that do not change what is asked ("토색이 뭐야?" = "토색이 무엇인가요?")
+QUESTION_ENDINGS = frozenset([
+    "뭐야", "뭐예요", "뭐에요", "뭔가요", "뭡니까", "무엇인가요", "무엇입니까", "무엇이야", "무엇",
+    "알려줘", "알려주세요", "알려줄래", "설명해줘", "설명해주세요", "어때", "어때요", "어떤가요",
+    "어떻습니까", "인가요", "입니까", "이야", "요", "주세요",
+])
+
+# Particles and copula endings dropped from the end of a word, longest first ("토양통의" -> "토양통")
+PARTICLES = ("인가요", "입니까", "에서는", "에서", "이란", "으로", "란", "은", "는", "이", "가", "을", "를", "의", "에", "와", "과", "도", "로")
+
+_NON_WORD_RE = re.compile(r'[^\w\s]+')
+
+
+def normalize_query(query):
+    """
+    Reduce a question to the words that decide its answer.
+    Punctuation, case, spacing, trailing question endings and word-final particles are removed,
+    so "석천 토양통의 특징이 무엇인가요?" and "석천 토양통 특징 알려줘" normalize the same.
+
+    Args:
+        query (str): User question
+
+    Returns:
+        str: Normalized question
+    """
+    text = _NON_WORD_RE.sub(" ", unicodedata.normalize("NFKC", query).lower())
+    words = text.split()
+    while len(words) > 1 and words[-1] in QUESTION_ENDINGS:
+        words.pop()
+    normalized = []
+    for word in words:
+        for particle in PARTICLES:
+            if word.endswith(particle) and len(word) - len(particle) >= 2:
+                word = word[:-len(particle)]
+                break
+        normalized.append(word)
+    return " ".join(normalized)
+
+def _signature_words(signature):
+    """Every word of the strings nested in a signature."""
+    if isinstance(signature, str):
+        return signature.split()
+    if isinstance(signature, (tuple, list, frozenset, set)):
+        return [word for item in signature for word in _signature_words(item)]
+    return []
+
+def content_words(normalized, signature=()):
+    """
+    Words of a normalized question that the signature does not already cover.
+    A word is covered when it contains, or is contained in, a word of the signature
+    ("완주군" by the keyword "완주", "전라북도" by the region "전라북도 완주군").
+
+    Args:
+        normalized (str): Output of normalize_query
+        signature (tuple): Entities named by the question (strings, possibly nested in tuples)
+
+    Returns:
+        frozenset: Uncovered words
+    """
+    covered = [word for word in _signature_words(signature) if word]
+    return frozenset(
+        word for word in normalized.split()
+        if not any(entity in word or word in entity for entity in covered)
+    )
+
+def char_bigrams(text):
+    """Character bigrams of a text with the spaces removed."""
+    text = text.replace(" ", "")
+    return frozenset(text[i:i + 2] for i in range(len(text) - 1)) or frozenset([text])
+
+class _Entry:
+    __slots__ = ("response", "created", "signature", "bigrams", "words")
+
+    def __init__(self, response, created, signature, bigrams, words):
+        self.response = response
+        self.created = created
+        self.signature = signature
+        self.bigrams = bigrams
+        self.words = words
+
+class ResponseCache:
+    """
+    Cache of chatbot answers keyed by knowledge base version and normalized question.
+
+    Lookups try the exact normalized question first. With a similarity threshold set, a miss
+    then falls back to the most similar cached question of the same knowledge base version
+    and signature (the entities the question names, so "석천 토양통" never answers for
+    "남계 토양통") whose remaining words are all the same, so only particles, question endings
+    and the wording of the named entities may differ ("가장 넓은" never answers for
+    "가장 좁은"). Entries expire after ttl_seconds and the least recently used are evicted
+    beyond max_entries.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 similarity=DEFAULT_SIMILARITY, clock=time.monotonic):
+        """
+        Create an empty cache.
+
+        Args:
+            max_entries (int): Maximum number of answers kept
+            ttl_seconds (float): Seconds an answer stays valid
+            similarity (float, optional): Minimum bigram Dice similarity of a near-duplicate hit;
+                None turns the near-duplicate tier off
+            clock (callable): Time source, in seconds
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, version, query, signature=()):
+        """
+        Look up the cached answer to a question.
+
+        Args:
+            version: Knowledge base version the answer must come from
+            query (str): User question
+            signature (tuple): Entities named by the question; near-duplicates must match it
+
+        Returns:
+            str or None: The cached answer, or None on a miss
+        """
+        key = (version, normalize_query(query))
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created > self.ttl_seconds:
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry.response
+
+            if self.similarity is not None:
+                near_key = self._most_similar(version, key[1], signature, now)
+                if near_key is not None:
+                    self._entries.move_to_end(near_key)
+                    self.near_hits += 1
+                    return self._entries[near_key].response
+
+            self.misses += 1
+            return None
+
+    def _most_similar(self, version, normalized, signature, now):
+        """Key of the most similar live entry at or above the similarity threshold (lock held)."""
+        bigrams = char_bigrams(normalized)
+        words = content_words(normalized, signature)
+        best_key, best_score = None, self.similarity
+        for key, entry in self._entries.items():
+            if key[0] != version or entry.signature != signature or entry.words != words \
+                    or now - entry.created > self.ttl_seconds:
+                continue
+            score = 2 * len(bigrams & entry.bigrams) / (len(bigrams) + len(entry.bigrams))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def put(self, version, query, response, signature=()):
+        """
+        Cache the answer to a question.
+
+        Args:
+            version: Knowledge base version the answer came from
+            query (str): User question
+            response (str): Answer
+            signature (tuple): Entities named by the question
+        """
+        normalized = normalize_query(query)
+        entry = _Entry(response, self.clock(), signature, char_bigrams(normalized),
+                       content_words(normalized, signature))
+        with self._lock:
+            self._entries[(version, normalized)] = entry
+            self._entries.move_to_end((version, normalized))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Report the cache's hit rate.
+
+        Returns:
+            dict: entries, exact_hits, near_hits, misses, expired, evictions, hit_rate
+        """
+        with self._lock:
+            lookups = self.exact_hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "hit_rate": (self.exact_hits + self.near_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,150 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from chunking import chunk_knowledge_base
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Number of knowledge base versions whose index is kept in memory
+INDEX_CACHE_SIZE = 8
+
+_HANGUL_RE = re.compile(r'[가-힣]')
+_WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """
+    Split text into index terms.
+    Words containing Hangul are split into character bigrams, so a particle attached to a word
+    (토양통은, 토양통이) only adds one extra term instead of making the whole word a different term.
+    Other words (numbers, Latin text) are kept whole.
+
+    Args:
+        text (str): Text to tokenize
+
+    Returns:
+        list: Index terms
+    """
+    terms = []
+    for word in _WORD_RE.findall(text.lower()):
+        if len(word) > 1 and _HANGUL_RE.search(word):
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            terms.append(word)
+    return terms
+
+class KnowledgeIndex:
+    """
+    Inverted index over knowledge base chunks with BM25 scoring.
+    Posting lists are numpy arrays, so scoring a query term is one vectorized update
+    over the chunks that contain it.
+    """
+
+    def __init__(self, chunks):
+        """
+        Build the index.
+
+        Args:
+            chunks (list): Chunk objects from chunking.chunk_knowledge_base
+        """
+        self.chunks = list(chunks)
+        num_chunks = len(self.chunks)
+
+        postings = {}
+        lengths = np.zeros(num_chunks, dtype=np.float32)
+        for chunk_id, chunk in enumerate(self.chunks):
+            counts = Counter(tokenize(chunk.text))
+            lengths[chunk_id] = sum(counts.values())
+            for term, count in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(chunk_id)
+                postings[term][1].append(count)
+
+        self._lengths = lengths
+        avg_length = float(lengths.mean()) if num_chunks else 0.0
+        # Per-chunk part of the BM25 denominator, precomputed once
+        self._length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avg_length) if avg_length else lengths
+        self._postings = {}
+        for term, (ids, counts) in postings.items():
+            idf = math.log(1 + (num_chunks - len(ids) + 0.5) / (len(ids) + 0.5))
+            self._postings[term] = (
+                np.array(ids, dtype=np.int32),
+                np.array(counts, dtype=np.float32),
+                idf,
+            )
+
+    def rank(self, query, top_k=3):
+        """
+        Score the chunks against a query.
+
+        Args:
+            query (str): Query text
+            top_k (int): Maximum number of chunks to return
+
+        Returns:
+            list: (score, chunk id) tuples, best first; chunks sharing no term are left out
+        """
+        if not self.chunks:
+            return []
+
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term, query_count in Counter(tokenize(query)).items():
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, counts, idf = posting
+            scores[ids] += query_count * idf * counts * (BM25_K1 + 1) / (counts + self._length_norm[ids])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(float(scores[i]), int(i)) for i in matched]
+
+    def search(self, query, top_k=3):
+        """
+        Find the chunks most relevant to a query.
+
+        Args:
+            query (str): Query text
+            top_k (int): Maximum number of chunks to return
+
+        Returns:
+            list: (score, Chunk) tuples, best first; chunks sharing no term are left out
+        """
+        return [(score, self.chunks[i]) for score, i in self.rank(query, top_k)]
+
+_index_cache = OrderedDict()
+_index_cache_lock = threading.Lock()
+
+def get_knowledge_index(knowledge_base):
+    """
+    Get the index for a knowledge base, building it only the first time that version is seen.
+    The cache is keyed by the text itself: Python caches a string's hash on the object,
+    so looking up the same knowledge base again does not rescan it.
+
+    Args:
+        knowledge_base (str): Knowledge base text
+
+    Returns:
+        KnowledgeIndex: Index over the knowledge base's chunks
+    """
+    with _index_cache_lock:
+        index = _index_cache.get(knowledge_base)
+        if index is not None:
+            _index_cache.move_to_end(knowledge_base)
+            return index
+
+    index = KnowledgeIndex(chunk_knowledge_base(knowledge_base))
+
+    with _index_cache_lock:
+        _index_cache[knowledge_base] = index
+        while len(_index_cache) > INDEX_CACHE_SIZE:
+            _index_cache.popitem(last=False)
+    return index
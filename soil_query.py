@@ -0,0 +1,321 @@
+import math
+import re
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from address_index import factorize_regions, find_address_column
+from csv_processor import ORDERED_CATEGORIES
+from region_index import REGION_LEVELS
+
+# Columns whose values can be asked about, in order of preference when a value appears in several
+QUERY_COLUMNS = ["배수등급", "표토토성", "심토토성", "경사", "유효토심", "모암_모재", "토양통명", "분포지형"]
+
+# Values that never act as constraints
+IGNORED_VALUES = {"기타", "Unknown"}
+
+# Units of the columns with numeric range classes ("7-15%", "얕음_20-50cm")
+RANGE_UNITS = {"%": "경사", "cm": "유효토심"}
+
+# Number of 읍/면, 리 and addresses listed in a result
+RESULT_TOP_N = 5
+
+_QUERY_WORD_RE = re.compile(r'[가-힣A-Za-z0-9_%-]+')
+_RANGE_QUERY_RE = re.compile(r'(\d+)\s*(%|cm)\s*(이상|이하|미만|초과)')
+_CLASS_RANGE_RE = re.compile(r'(\d+)-(\d+)')
+_CLASS_OPEN_RE = re.compile(r'(\d+)\s*cm\s*이상')
+_COMPARATIVE_RE = re.compile(r'^\s*(이상|이하)')
+
+# Number of set bits in each byte value, for counting packed bitmaps
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+
+def class_bounds(value):
+    """
+    Numeric bounds of a range class such as "7-15%" or "깊음_100cm이상".
+
+    Args:
+        value (str): Category value
+
+    Returns:
+        tuple or None: (low, high) with high = inf for open classes, or None for other values
+    """
+    match = _CLASS_RANGE_RE.search(value)
+    if match:
+        return float(match.group(1)), float(match.group(2))
+    match = _CLASS_OPEN_RE.search(value)
+    if match:
+        return float(match.group(1)), math.inf
+    return None
+
+class QueryResult(NamedTuple):
+    """Rows of the soil table matching a question's attribute constraints."""
+    constraints: dict
+    regions: list
+    count: int
+    scope_rows: int
+    by_eupmyeon: list
+    by_ri: list
+    addresses: list
+
+    def describe(self):
+        """
+        Describe the result in Korean for the model context.
+
+        Returns:
+            str: Result text
+        """
+        conditions = [f"{col}={'/'.join(values)}" for col, values in self.constraints.items()]
+        if self.regions:
+            conditions.append(f"지역={'/'.join(region.full_name for region in self.regions)}")
+        share = self.count / self.scope_rows if self.scope_rows else 0
+        lines = [
+            f"조건 검색 ({', '.join(conditions)}):",
+            f"- 해당 필지: {self.count:,}개 (대상 {self.scope_rows:,}개 중 {share:.0%})",
+        ]
+        if self.by_eupmyeon:
+            lines.append("- 읍면별: " + ", ".join(f"{name} {count:,}개({ratio:.0%})" for name, count, ratio in self.by_eupmyeon))
+        if self.by_ri:
+            lines.append("- 주요 리: " + ", ".join(f"{name} {count:,}개" for name, count in self.by_ri))
+        if self.addresses:
+            lines.append("- 예시 주소: " + ", ".join(self.addresses))
+        return "\n".join(lines)
+
+class SoilQueryEngine:
+    """
+    Answers attribute questions ("완주군에서 배수가 양호한 지역은?") by filtering the soil table.
+
+    For every value of the QUERY_COLUMNS and every region in the address column, a packed
+    bitmap (one bit per row) is built once. A question is parsed into constraints, values of
+    one column are OR-ed, columns and regions are AND-ed, and the counts per 읍/면 and 리 come
+    from one bincount over the matching rows, so a query never rescans the dataframe.
+    """
+
+    def __init__(self, df, region_index=None, columns=QUERY_COLUMNS):
+        """
+        Build the bitmaps.
+
+        Args:
+            df (pandas.DataFrame): The cleaned CSV data
+            region_index (RegionIndex, optional): Used to recognize regions in questions
+            columns (list): Columns that can be constrained
+        """
+        self.num_rows = len(df)
+        self.region_index = region_index
+        self._bitmaps = {}
+        self._values = {}
+        self._vocabulary = {}
+
+        for col in columns:
+            if col not in df.columns:
+                continue
+            codes, uniques = self._factorize(df[col])
+            self._values[col] = [str(value) for value in uniques]
+            self._bitmaps[col] = self._pack_codes(codes, len(uniques))
+            for value in self._values[col]:
+                if value in IGNORED_VALUES:
+                    continue
+                self._vocabulary.setdefault(value, []).append((col, value))
+                # 유효토심 classes are asked about by their name ("깊음_100cm이상" -> "깊음")
+                alias = value.split("_")[0]
+                if alias != value and len(alias) >= 2:
+                    self._vocabulary.setdefault(alias, []).append((col, value))
+
+        # Region of every row, one code array per level, parsing each distinct address once
+        self.address_column = find_address_column(df)
+        self._region_bitmaps = {}
+        self._region_codes = {}
+        self._region_names = {}
+        self._region_name_set = set()
+        self._addresses = None
+        if self.address_column is not None:
+            self._addresses = df[self.address_column].to_numpy()
+            if region_index is not None and len(region_index.row_leaves) == self.num_rows:
+                # Reuse the region index's parse of the same table
+                row_regions = region_index.row_leaves
+                regions = [{node.level: node.name for node in leaf.ancestors() if node.level} for leaf in region_index.leaves]
+            else:
+                row_regions, regions = factorize_regions(self._addresses)
+            for level in REGION_LEVELS:
+                if level == "ri":
+                    # 리 names repeat across 읍/면, so they are keyed by both
+                    names = [f"{parts.get('eupmyeon', '')} {parts['ri']}".strip() if parts.get("ri") else "" for parts in regions]
+                else:
+                    names = [parts.get(level, "") for parts in regions]
+                name_codes, uniques = pd.factorize(pd.Series(names, dtype=object))
+                codes = name_codes[row_regions]
+                self._region_codes[level] = codes
+                self._region_names[level] = list(uniques)
+                self._region_bitmaps[level] = dict(zip(uniques, self._pack_codes(codes, len(uniques))))
+            self._region_name_set = {parts[level] for parts in regions for level in REGION_LEVELS if parts.get(level)}
+
+    @classmethod
+    def from_dataframe(cls, df, region_index=None):
+        """
+        Build an engine over a dataframe.
+
+        Args:
+            df (pandas.DataFrame): The cleaned CSV data
+            region_index (RegionIndex, optional): Region tree of the same data
+
+        Returns:
+            SoilQueryEngine or None: The engine, or None if df is None
+        """
+        if df is None:
+            return None
+        return cls(df, region_index)
+
+    @staticmethod
+    def _factorize(series):
+        """Integer codes and distinct values of a column (categoricals reuse their codes)."""
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series.cat.codes.to_numpy(), list(series.cat.categories)
+        return pd.factorize(series.astype(str))
+
+    def _pack_codes(self, codes, num_values):
+        """One packed bitmap per value, grouping the rows by code with one sort."""
+        order = np.argsort(codes, kind="stable")
+        starts = np.searchsorted(codes[order], np.arange(num_values + 1))
+        bitmaps = []
+        for i in range(num_values):
+            bits = np.zeros(self.num_rows, dtype=bool)
+            bits[order[starts[i]:starts[i + 1]]] = True
+            bitmaps.append(np.packbits(bits))
+        return bitmaps
+
+    def parse(self, query):
+        """
+        Find the attribute constraints in a question.
+        A value (or a 유효토심 class name such as "깊음") counts when a word starts with it, so
+        particles are ignored ("양호한", "사양토인"). Ordered values followed by 이상/이하 include
+        the better/worse classes, and "경사 15% 이상" / "30cm 미만" select the overlapping classes.
+
+        Args:
+            query (str): User question
+
+        Returns:
+            dict: Column -> list of accepted values
+        """
+        constraints = {}
+
+        def add(col, values):
+            accepted = constraints.setdefault(col, [])
+            accepted.extend(value for value in values if value not in accepted)
+
+        for match in _RANGE_QUERY_RE.finditer(query):
+            col = RANGE_UNITS[match.group(2)]
+            if col not in self._values:
+                continue
+            limit = float(match.group(1))
+            values = []
+            for value in self._values[col]:
+                bounds = class_bounds(value)
+                if bounds is None:
+                    continue
+                low, high = bounds
+                if match.group(3) in ("이상", "초과") and high > limit or match.group(3) in ("이하", "미만") and low < limit:
+                    values.append(value)
+            add(col, values)
+
+        for word_match in _QUERY_WORD_RE.finditer(query):
+            word = word_match.group()
+            for end in range(len(word), 1, -1):
+                prefix = word[:end]
+                if prefix in self._region_name_set:
+                    # "고산면" is a region, not the 고산 soil series
+                    break
+                candidates = self._vocabulary.get(prefix)
+                if not candidates:
+                    continue
+                # A value shared by 표토토성 and 심토토성 goes to 심토토성 only if the question says so
+                col, value = candidates[0]
+                for other_col, other_value in candidates:
+                    if other_col.split("토성")[0] in query and other_col != col:
+                        col, value = other_col, other_value
+                if col in ORDERED_CATEGORIES:
+                    rest = word[end:] or query[word_match.end():]
+                    comparative = _COMPARATIVE_RE.match(rest)
+                    if comparative:
+                        order = [v for v in ORDERED_CATEGORIES[col] if v in self._values[col]]
+                        position = order.index(value) if value in order else None
+                        if position is not None:
+                            add(col, order[position:] if comparative.group(1) == "이상" else order[:position + 1])
+                            break
+                add(col, [value])
+                break
+        return constraints
+
+    def _or(self, bitmaps):
+        result = bitmaps[0].copy()
+        for bitmap in bitmaps[1:]:
+            np.bitwise_or(result, bitmap, out=result)
+        return result
+
+    def _region_bitmap(self, region):
+        """Bitmap of the rows inside a RegionNode (every level of its path must match)."""
+        bitmap = None
+        eupmyeon = ""
+        for node in reversed(list(region.ancestors())):
+            if node.level is None:
+                continue
+            name = node.name
+            if node.level == "eupmyeon":
+                eupmyeon = name
+            elif node.level == "ri":
+                name = f"{eupmyeon} {name}".strip()
+            level_bitmap = self._region_bitmaps.get(node.level, {}).get(name)
+            if level_bitmap is None:
+                return np.zeros((self.num_rows + 7) // 8, dtype=np.uint8)
+            bitmap = level_bitmap.copy() if bitmap is None else np.bitwise_and(bitmap, level_bitmap, out=bitmap)
+        return bitmap
+
+    def query(self, question, regions=None):
+        """
+        Filter the table by the constraints in a question.
+
+        Args:
+            question (str): User question
+            regions (list, optional): RegionNode objects restricting the rows; found with
+                the region index when omitted
+
+        Returns:
+            QueryResult or None: The matching rows' summary, or None if the question has
+            no attribute constraint
+        """
+        constraints = self.parse(question)
+        if not constraints:
+            return None
+        if regions is None:
+            regions = self.region_index.find(question) if self.region_index is not None else []
+
+        mask = None
+        for col, values in constraints.items():
+            column_bitmap = self._or([self._bitmaps[col][self._values[col].index(value)] for value in values])
+            mask = column_bitmap if mask is None else np.bitwise_and(mask, column_bitmap, out=mask)
+
+        scope_rows = self.num_rows
+        if regions and self._region_bitmaps:
+            scope = self._or([self._region_bitmap(region) for region in regions])
+            scope_rows = int(_POPCOUNT[scope].sum())
+            np.bitwise_and(mask, scope, out=mask)
+
+        rows = np.flatnonzero(np.unpackbits(mask, count=self.num_rows))
+        by_eupmyeon = []
+        by_ri = []
+        addresses = []
+        if self._region_codes and len(rows):
+            eupmyeon_codes = self._region_codes["eupmyeon"]
+            matched = np.bincount(eupmyeon_codes[rows], minlength=len(self._region_names["eupmyeon"]))
+            totals = np.bincount(eupmyeon_codes, minlength=len(matched))
+            for code in np.argsort(-matched, kind="stable")[:RESULT_TOP_N].tolist():
+                if matched[code] and self._region_names["eupmyeon"][code]:
+                    by_eupmyeon.append((self._region_names["eupmyeon"][code], int(matched[code]), matched[code] / totals[code]))
+
+            ri_counts = np.bincount(self._region_codes["ri"][rows], minlength=len(self._region_names["ri"]))
+            for code in np.argsort(-ri_counts, kind="stable")[:RESULT_TOP_N].tolist():
+                if ri_counts[code] and self._region_names["ri"][code]:
+                    by_ri.append((self._region_names["ri"][code], int(ri_counts[code])))
+            addresses = [str(address).strip() for address in self._addresses[rows[:RESULT_TOP_N]].tolist()]
+
+        return QueryResult(constraints, list(regions), len(rows), scope_rows, by_eupmyeon, by_ri, addresses)
@@ -28,6 +28,28 @@ def get_soil_image_url(address_or_query):
     
     return soil_sample_urls[index]
 
+def get_upload_digest(uploaded_file, digest_cache=None):
+    """
+    Get the SHA-256 digest of an uploaded file's contents.
+    Streamlit returns the same upload object on every rerun, so the digest is
+    remembered per upload id in digest_cache to avoid re-hashing large files.
+    
+    Args:
+        uploaded_file: Streamlit UploadedFile object
+        digest_cache (dict, optional): Upload id -> digest mapping kept by the caller
+        
+    Returns:
+        str: Hex digest of the file contents
+    """
+    upload_id = getattr(uploaded_file, "file_id", None) or getattr(uploaded_file, "id", None)
+    if digest_cache is not None and upload_id in digest_cache:
+        return digest_cache[upload_id]
+    
+    digest = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    if digest_cache is not None and upload_id is not None:
+        digest_cache[upload_id] = digest
+    return digest
+
 def extract_soil_type_from_text(text):
     """
     Extract soil type from text.